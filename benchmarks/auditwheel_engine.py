@@ -0,0 +1,81 @@
+"""Benchmark auditwheel repairs by the command against long-lived workers.
+
+Run with: python -m benchmarks.auditwheel_engine [wheels folder|count] [jobs]
+
+Without a folder of wheels, count small wheels with a copy of an extension
+module of this interpreter are created.
+"""
+
+import sys
+import sysconfig
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext, suppress
+from pathlib import Path
+from subprocess import CalledProcessError
+from tempfile import TemporaryDirectory, TemporaryFile
+
+from builder.audit import AuditWorkers
+from builder.wheel import repair_wheel
+
+from .synthetic import native_wheels
+
+
+def measure(wheels: list[Path], jobs: int, engine: str) -> tuple[float, int]:
+    """Return runtime and number of repaired wheels of an engine."""
+    with (
+        TemporaryDirectory() as temp_dir,
+        TemporaryFile("w+") as log,
+        ThreadPoolExecutor(max_workers=jobs) as executor,
+    ):
+        start = time.perf_counter()
+        with AuditWorkers(jobs) if engine == "worker" else nullcontext() as workers:
+            repairs = [
+                executor.submit(
+                    repair_wheel,
+                    wheel_file,
+                    Path(temp_dir),
+                    None,
+                    log,
+                    workers,
+                )
+                for wheel_file in wheels
+            ]
+            for repair in repairs:
+                with suppress(CalledProcessError):
+                    repair.result()
+        runtime = time.perf_counter() - start
+        return runtime, len(list(Path(temp_dir).glob("*.whl")))
+
+
+def main() -> None:
+    """Compare both engines on the same wheels."""
+    source = sys.argv[1] if len(sys.argv) > 1 else "50"
+    jobs = int(sys.argv[2]) if len(sys.argv) > 2 else 1  # noqa: PLR2004
+
+    with TemporaryDirectory() as temp_dir:
+        if Path(source).is_dir():
+            wheels = sorted(Path(source).glob("*.whl"))
+        else:
+            shared_object = next(
+                Path(sysconfig.get_path("platstdlib"), "lib-dynload").glob("_json*.so"),
+            )
+            wheels = native_wheels(Path(temp_dir), int(source), shared_object)
+
+        print(f"Repair {len(wheels)} wheels with {jobs} jobs")
+        results = {}
+        for engine in ("command", "worker"):
+            runtime, repaired = measure(wheels, jobs, engine)
+            results[engine] = repaired
+            print(
+                f"{engine:>8}: {runtime:7.3f}s  {runtime / len(wheels) * 1e3:8.1f} "
+                f"ms/wheel  {repaired} wheels",
+            )
+
+    if results["command"] != results["worker"]:
+        msg = "Engines don't agree on the repaired wheels"
+        raise SystemExit(msg)
+
+
+if __name__ == "__main__":
+    main()
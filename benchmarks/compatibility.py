@@ -0,0 +1,77 @@
+"""Benchmark wheel tag compatibility checks at index scale.
+
+Run with: python -m benchmarks.compatibility [count]
+"""
+
+import sys
+import time
+from collections.abc import Callable
+from functools import cache
+
+from packaging.tags import Tag
+from packaging.utils import parse_wheel_filename
+
+from builder.wheel import _ALPINE_MUSL_VERSION, _ARCH_PLAT, WheelCompatibility
+
+from .synthetic import wheel_names
+
+_ARCH = "amd64"
+_ABI = "cp314"
+_ALPINE = ("3", "24")
+
+
+@cache
+def sys_platform(arch: str) -> set[str]:
+    """Build list of supported platform tags like before."""
+    major, minor = _ALPINE_MUSL_VERSION[_ALPINE]
+    return {"any", *[f"musllinux_{major}_{i}_{arch}" for i in range(minor + 1)]}
+
+
+def check_per_tag(wheels: list[frozenset[Tag]]) -> int:
+    """Check every tag of every wheel like before."""
+
+    def check_abi_platform(abi: str, platform: str) -> bool:
+        arch = _ARCH_PLAT.get(_ARCH, _ARCH)
+        if platform not in sys_platform(arch):
+            return False
+        return abi in ("none", "abi3", _ABI)
+
+    return sum(
+        any(check_abi_platform(tag.abi, tag.platform) for tag in tags)
+        for tags in wheels
+    )
+
+
+def check_compatibility(wheels: list[frozenset[Tag]]) -> int:
+    """Check every wheel with the shared compatibility object."""
+    compatibility = WheelCompatibility(_ARCH, _ABI, _ALPINE)
+    return sum(compatibility.compatible(tags) for tags in wheels)
+
+
+def measure(check: Callable[[list[frozenset[Tag]]], int], wheels: list) -> float:
+    """Return runtime of a check in seconds."""
+    start = time.perf_counter()
+    check(wheels)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    """Compare both checks on a synthetic index."""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    wheels = [parse_wheel_filename(name)[3] for name in wheel_names(count)]
+
+    if check_per_tag(wheels) != check_compatibility(wheels):
+        msg = "Compatibility checks don't agree"
+        raise SystemExit(msg)
+
+    print(f"Index with {count} wheels")
+    for name, check in (
+        ("per tag", check_per_tag),
+        ("compatibility", check_compatibility),
+    ):
+        runtime = measure(check, wheels)
+        print(f"{name:>14}: {runtime:7.3f}s  {runtime / count * 1e9:8.0f} ns/wheel")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""Benchmark the builder end to end with stub build tools.
+
+Run with: python -m benchmarks.end_to_end [--packages 10,50,200]
+
+Stubs of pip3, auditwheel, apk and rsync are put on PATH and the index is
+served by a local HTTP server. The builder command runs for every mode and
+package count. The overhead is the wall time in which no tool runs, so it is
+the time the builder itself needs to orchestrate the tools. Tool runs are
+taken from the trace of the builder.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from collections.abc import Generator
+from contextlib import contextmanager, redirect_stderr, redirect_stdout
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from threading import Thread
+from typing import Any, Final
+from unittest.mock import patch
+
+from builder.__main__ import builder
+
+from .stub_tools import TOOLS, write_wheel
+from .synthetic import autoindex_html, requirement_lines, wheel_names
+
+MODES: Final = ("single", "bulk", "prebuild")
+
+_PHASES: Final = (
+    "check_url",
+    "index",
+    "install_apks",
+    "plan",
+    "build",
+    "auditwheel",
+    "rebuild unmatched",
+    "prune",
+    "run_upload",
+)
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    """Serve files without a log line per request."""
+
+    def log_message(self, format: str, *args: object) -> None:  # noqa: A002
+        """Drop the request log."""
+
+
+@contextmanager
+def serve_index(folder: Path, wheels: int) -> Generator[str]:
+    """Serve a listing of wheels like the wheels server and yield its URL."""
+    for path in ("", "musllinux", "musllinux-index"):
+        Path(folder, path).mkdir(exist_ok=True)
+        Path(folder, path, "index.html").write_bytes(b"<html></html>")
+    Path(folder, "musllinux", "index.html").write_bytes(
+        autoindex_html(wheel_names(wheels)),
+    )
+
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0),
+        partial(_QuietHandler, directory=str(folder)),
+    )
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        thread.join()
+
+
+def install_stubs(folder: Path) -> None:
+    """Create the stub tools in folder."""
+    root = Path(__file__).parent.parent
+    launcher = (
+        f"#!{sys.executable}\n"
+        f"import sys\nsys.path.insert(0, {str(root)!r})\n"
+        "from benchmarks.stub_tools import main\nmain()\n"
+    )
+    for tool in TOOLS:
+        stub = Path(folder, tool)
+        stub.write_text(launcher, encoding="utf-8")
+        stub.chmod(0o755)
+
+
+def busy_time(events: list[dict[str, Any]]) -> float:
+    """Return the time in which at least one tool ran.
+
+    Tools run as commands, only apk is installed without run_command.
+    """
+    runs = sorted(
+        (event["ts"], event["ts"] + event["dur"])
+        for event in events
+        if event["cat"] == "command" or event["name"] == "install_apks"
+    )
+    busy = 0
+    current_start, current_end = runs[0] if runs else (0, 0)
+    for start, end in runs:
+        if start > current_end:
+            busy += current_end - current_start
+            current_start = start
+        current_end = max(current_end, end)
+    return (busy + current_end - current_start) / 1e6
+
+
+def phase_times(events: list[dict[str, Any]]) -> dict[str, float]:
+    """Return the total seconds per phase."""
+    times: dict[str, float] = {}
+    for event in events:
+        if event["cat"] == "phase":
+            times[event["name"]] = times.get(event["name"], 0) + event["dur"] / 1e6
+    return times
+
+
+def run_builder(
+    folder: Path,
+    index: str,
+    mode: str,
+    packages: int,
+    jobs: int,
+    extra: list[str],
+) -> dict[str, Any]:
+    """Run the builder once and return exit code, times and phases.
+
+    Builds and repairs run with jobs in parallel.
+    """
+    folder.mkdir()
+    requirement = Path(folder, "requirements.txt")
+    requirement.write_text("\n".join(requirement_lines(packages)), encoding="utf-8")
+    trace_file = Path(folder, "trace.json")
+
+    args = [
+        f"--index={index}",
+        "--index-lookup=listing",
+        "--apk=build-base",
+        "--audit-engine=command",
+        f"--audit-jobs={jobs}",
+        "--upload=rsync",
+        f"--remote={Path(folder, 'remote')}",
+        f"--trace={trace_file}",
+        *extra,
+    ]
+    if mode == "single":
+        args += ["--single", f"--jobs={jobs}", f"--requirement={requirement}"]
+    elif mode == "bulk":
+        args += [f"--requirement={requirement}"]
+    else:
+        prebuild = Path(folder, "prebuild")
+        prebuild.mkdir()
+        size = int(os.environ["STUB_WHEEL_SIZE"])
+        for package in requirement_lines(packages):
+            name, _, version = package.partition("==")
+            write_wheel(prebuild, name, version, size)
+        args += [f"--prebuild-dir={prebuild}"]
+
+    with (
+        Path(folder, "builder.log").open("w", encoding="utf-8") as log,
+        redirect_stdout(log),
+        redirect_stderr(log),
+    ):
+        start = time.perf_counter()
+        try:
+            builder.main(args, standalone_mode=False)
+        except SystemExit as err:
+            code = err.code
+        else:
+            code = 0
+        wall = time.perf_counter() - start
+
+    events = json.loads(trace_file.read_text(encoding="utf-8"))["traceEvents"]
+    busy = busy_time(events)
+    return {
+        "code": code,
+        "wall": wall,
+        "busy": busy,
+        "overhead": wall - busy,
+        "phases": phase_times(events),
+    }
+
+
+def main() -> None:
+    """Run every mode for every package count and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--packages", default="10,50,200")
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--jobs", type=int, default=2)
+    parser.add_argument("--index-wheels", type=int, default=10_000)
+    parser.add_argument("--build-time", type=float, default=0.05)
+    parser.add_argument("--audit-time", type=float, default=0.02)
+    parser.add_argument("--wheel-size", type=int, default=256 * 1024)
+    parser.add_argument("--failure-rate", type=float, default=0)
+    parser.add_argument(
+        "--builder-args",
+        default="",
+        help="More options of the builder, like --plan.",
+    )
+    args = parser.parse_args()
+    counts = [int(count) for count in args.packages.split(",")]
+
+    with TemporaryDirectory() as temp_dir:
+        stubs = Path(temp_dir, "bin")
+        stubs.mkdir()
+        install_stubs(stubs)
+        environ = {
+            "PATH": f"{stubs}:{os.environ['PATH']}",
+            "ARCH": "amd64",
+            "ABI": "cp314",
+            "STUB_BUILD_TIME": str(args.build_time),
+            "STUB_AUDIT_TIME": str(args.audit_time),
+            "STUB_WHEEL_SIZE": str(args.wheel_size),
+            "STUB_FAILURE_RATE": str(args.failure_rate),
+        }
+        with (
+            patch.dict(os.environ, environ),
+            patch("builder.wheel.alpine_version", return_value=("3", "24")),
+            serve_index(Path(temp_dir, "index"), args.index_wheels) as index,
+        ):
+            print(
+                f"{'Mode':<9} {'Pkgs':>5} {'Exit':>4} {'Wall s':>8} "
+                f"{'Tools s':>8} {'Overhead s':>10} {'ms/pkg':>7}  Phases",
+            )
+            for mode in args.modes.split(","):
+                overheads: list[float] = []
+                for count in counts:
+                    result = run_builder(
+                        Path(temp_dir, f"{mode}_{count}"),
+                        index,
+                        mode,
+                        count,
+                        args.jobs,
+                        args.builder_args.split(),
+                    )
+                    overheads.append(result["overhead"])
+                    phases = "  ".join(
+                        f"{phase} {result['phases'][phase]:.2f}"
+                        for phase in _PHASES
+                        if phase in result["phases"]
+                    )
+                    print(
+                        f"{mode:<9} {count:>5} {result['code']!s:>4} "
+                        f"{result['wall']:>8.2f} {result['busy']:>8.2f} "
+                        f"{result['overhead']:>10.2f} "
+                        f"{result['overhead'] / count * 1000:>7.1f}  {phases}",
+                        flush=True,
+                    )
+
+                if len(counts) > 1:
+                    slope, intercept = statistics.linear_regression(counts, overheads)
+                    print(
+                        f"{mode:<9} overhead scales {slope * 1000:.2f} ms/package "
+                        f"+ {intercept:.2f}s fixed",
+                    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""Benchmark the index and requirement hot paths against a stored baseline.
+
+Run with: python -m benchmarks.hot_paths [--update] [--tolerance 0.25]
+
+Every function runs on synthetic indexes of 10k to 200k wheels and 1k to 5k
+requirements. The best time of some rounds and the peak of allocated memory
+are compared to the baseline, the run fails if one of them got worse by more
+than the tolerance. Timings depend on the machine, store a new baseline with
+--update before comparing changes on another one.
+"""
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable
+from contextlib import redirect_stdout
+from io import StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any, Final
+from unittest.mock import MagicMock, patch
+
+from builder.infra import (
+    PackageIndex,
+    check_available_binary,
+    check_existing_packages,
+    create_package_map,
+    extract_packages_from_index,
+    remove_local_wheels,
+)
+from builder.pip import parse_requirements
+from builder.wheel import fix_wheels_unmatch_requirements
+
+from .synthetic import autoindex_html, chunked, requirement_lines, wheel_names
+
+BASELINE: Final = Path(__file__).with_name("hot_paths_baseline.json")
+
+# Wheels of the index and requirements of a scenario
+_SCENARIOS: Final = ((10_000, 1_000), (50_000, 2_500), (200_000, 5_000))
+
+# Differences below are noise of the timer and the allocator
+_MIN_TIME: Final = 0.002
+_MIN_MEMORY: Final = 256 * 1024
+
+
+class Scenario:
+    """Synthetic index, requirements and wheel folders of one size."""
+
+    def __init__(self, wheels: int, requirements: int, folder: Path) -> None:
+        """Initialize the scenario."""
+        self.name = f"{wheels}x{requirements}"
+        self.wheels = wheel_names(wheels)
+        self.listing = autoindex_html(self.wheels)
+        self.packages = requirement_lines(requirements)
+        self.skip_binary = ";".join(
+            package.partition("==")[0] for package in self.packages[::10]
+        )
+        self.folder = folder
+
+        # Requirement file includes a second one like Home Assistant does
+        half = len(self.packages) // 2
+        self.requirement = Path(folder, "requirements.txt")
+        Path(folder, "requirements_core.txt").write_text(
+            "\n".join(self.packages[:half]),
+            encoding="utf-8",
+        )
+        self.requirement.write_text(
+            "-r requirements_core.txt\n# Synthetic packages\n"
+            + "\n".join(self.packages[half:]),
+            encoding="utf-8",
+        )
+
+    def package_index(self) -> PackageIndex:
+        """Return a new index, lookups are not cached between rounds."""
+        return PackageIndex(self.wheels)
+
+    def wheels_dir(self) -> Path:
+        """Return a new folder with a wheel per requirement, every third linux."""
+        wheels_dir = Path(self.folder, f"wheels_{time.monotonic_ns()}")
+        wheels_dir.mkdir()
+        for i, package in enumerate(self.packages):
+            name, _, version = package.partition("==")
+            platform = "linux_x86_64" if i % 3 == 0 else "musllinux_1_2_x86_64"
+            Path(wheels_dir, f"{name}-{version}-cp314-cp314-{platform}.whl").touch()
+        return wheels_dir
+
+
+def _benchmarks(
+    scenario: Scenario,
+) -> dict[str, Callable[[], Callable[[], Any]]]:
+    """Return a setup per function that prepares one round of it."""
+
+    def _fetch() -> Callable[[], Any]:
+        response = MagicMock(status_code=200, headers={})
+        response.iter_content.side_effect = lambda **_: chunked(scenario.listing)
+
+        def _run() -> PackageIndex:
+            with patch("builder.infra.requests.get", return_value=response):
+                return extract_packages_from_index("https://index/")
+
+        return _run
+
+    def _existing() -> Callable[[], Any]:
+        index = scenario.package_index()
+        package_map = create_package_map(scenario.packages)
+        return lambda: check_existing_packages(index, package_map)
+
+    def _available() -> Callable[[], Any]:
+        index = scenario.package_index()
+        return lambda: check_available_binary(
+            index,
+            scenario.skip_binary,
+            scenario.packages,
+            [],
+        )
+
+    def _remove() -> Callable[[], Any]:
+        index = scenario.package_index()
+        wheels_dir = scenario.wheels_dir()
+        return lambda: remove_local_wheels(
+            index,
+            scenario.skip_binary,
+            scenario.packages,
+            wheels_dir,
+        )
+
+    def _unmatch() -> Callable[[], Any]:
+        wheels_dir = scenario.wheels_dir()
+        return lambda: fix_wheels_unmatch_requirements(wheels_dir)
+
+    return {
+        "extract_packages_from_index": _fetch,
+        "create_package_map": lambda: lambda: create_package_map(scenario.packages),
+        "check_existing_packages": _existing,
+        "check_available_binary": _available,
+        "remove_local_wheels": _remove,
+        "parse_requirements": lambda: lambda: parse_requirements(scenario.requirement),
+        "fix_wheels_unmatch_requirements": _unmatch,
+    }
+
+
+def measure(setup: Callable[[], Callable[[], Any]], rounds: int) -> dict[str, float]:
+    """Return the best time of some rounds and the peak memory of one more."""
+    best = float("inf")
+    for _ in range(rounds):
+        run = setup()
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+
+    # Tracing slows down the function, so memory is measured on its own
+    run = setup()
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"time": best, "memory": peak}
+
+
+def regressions(
+    results: dict[str, dict[str, dict[str, float]]],
+    baseline: dict[str, dict[str, dict[str, float]]],
+    tolerance: float,
+) -> list[str]:
+    """Return a line for every result that is worse than the baseline."""
+    lines: list[str] = []
+    for scenario, functions in results.items():
+        for function, result in functions.items():
+            base = baseline.get(scenario, {}).get(function)
+            if base is None:
+                continue
+            for metric, floor in (("time", _MIN_TIME), ("memory", _MIN_MEMORY)):
+                if result[metric] > base[metric] * (1 + tolerance) + floor:
+                    lines.append(
+                        f"{scenario} {function}: {metric} {result[metric]:.4g} "
+                        f"> baseline {base[metric]:.4g}",
+                    )
+    return lines
+
+
+def main() -> None:
+    """Measure every hot path and compare it to the baseline."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--update", action="store_true", help="Store as baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    results: dict[str, dict[str, dict[str, float]]] = {}
+    with (
+        TemporaryDirectory() as temp_dir,
+        patch("builder.wheel.build_arch", return_value="amd64"),
+        patch("builder.wheel.build_abi", return_value="cp314"),
+        patch("builder.wheel.alpine_version", return_value=("3", "24")),
+    ):
+        for wheels, requirements in _SCENARIOS:
+            folder = Path(temp_dir, f"{wheels}x{requirements}")
+            folder.mkdir()
+            scenario = Scenario(wheels, requirements, folder)
+            print(f"Index with {wheels} wheels, {requirements} requirements")
+            for function, setup in _benchmarks(scenario).items():
+                # The functions print progress for every package
+                with redirect_stdout(StringIO()):
+                    result = measure(setup, args.rounds)
+                results.setdefault(scenario.name, {})[function] = result
+                print(
+                    f"{function:>32}: {result['time'] * 1000:9.2f}ms"
+                    f"  peak {result['memory'] / 1024 / 1024:7.2f} MiB",
+                )
+
+    if args.update:
+        args.baseline.write_text(
+            json.dumps(results, indent=2, sort_keys=True) + "\n",
+            encoding="utf-8",
+        )
+        print(f"Stored baseline {args.baseline}")
+        return
+
+    if not args.baseline.exists():
+        print(f"No baseline {args.baseline}, store one with --update")
+        return
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    if failed := regressions(results, baseline, args.tolerance):
+        print(f"Regressions over {args.tolerance:.0%} of the baseline:")
+        print("\n".join(failed))
+        sys.exit(1)
+    print("No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Benchmark parsing of the wheel index listing.
+
+Run with: python -m benchmarks.index_parser [count]
+"""
+
+import re
+import sys
+import time
+import tracemalloc
+from collections import deque
+from collections.abc import Callable
+
+from builder.infra import HTMLParserAHREF, iter_index_wheels
+
+from .synthetic import autoindex_html, chunked, wheel_names
+
+_RE_PACKAGE_INDEX = re.compile(r"(.+\.whl)")
+
+
+def parse_html_parser(data: bytes) -> None:
+    """Parse the listing like before with the full text and HTMLParser."""
+    html_parser = HTMLParserAHREF()
+    html_parser.feed(data.decode())
+    deque(filter(_RE_PACKAGE_INDEX.match, html_parser.href), maxlen=0)
+
+
+def parse_streaming(data: bytes) -> None:
+    """Parse the listing from chunks of a streamed response."""
+    deque(iter_index_wheels(chunked(data)), maxlen=0)
+
+
+def measure(parser: Callable[[bytes], None], data: bytes) -> tuple[float, int]:
+    """Return runtime in seconds and peak allocated memory of a parser."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    parser(data)
+    runtime = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return runtime, peak
+
+
+def main() -> None:
+    """Compare both parsers on a synthetic listing."""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    wheels = wheel_names(count)
+    data = autoindex_html(wheels)
+    if list(iter_index_wheels(chunked(data))) != wheels:
+        msg = "Streaming parser doesn't find all wheels"
+        raise SystemExit(msg)
+
+    print(f"Index listing with {count} wheels, {len(data) / 1024 / 1024:.1f} MiB")
+    for name, parser in (
+        ("HTMLParser", parse_html_parser),
+        ("streaming", parse_streaming),
+    ):
+        runtime, peak = measure(parser, data)
+        print(f"{name:>12}: {runtime:7.3f}s  peak {peak / 1024 / 1024:7.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Benchmark building and querying the package index.
+
+Run with: python -m benchmarks.package_index [count]
+"""
+
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable, Mapping
+from unittest.mock import patch
+
+from awesomeversion import AwesomeVersion
+from packaging.utils import NormalizedName, canonicalize_name, parse_wheel_filename
+
+from builder.infra import PackageIndex, WhlPackage
+from builder.wheel import build_compatibility
+
+from .synthetic import wheel_names
+
+
+def eager_index(wheels: list[str]) -> dict[NormalizedName, list[WhlPackage]]:
+    """Parse every wheel up front like before."""
+    compatibility = build_compatibility()
+    result: dict[NormalizedName, list[WhlPackage]] = {}
+    for wheel_filename in wheels:
+        name, version, _build_tag, tags = parse_wheel_filename(wheel_filename)
+        if not compatibility.compatible(tags):
+            continue
+        package = WhlPackage(name, AwesomeVersion(str(version)), tags)
+        result.setdefault(package.name, []).append(package)
+    return result
+
+
+def measure(
+    create: Callable[[list[str]], Mapping[NormalizedName, list[WhlPackage]]],
+    count: int,
+) -> tuple[float, int, float]:
+    """Return build time, resident memory and lookup time of an index.
+
+    The filenames are created while tracing, so a kept filename is counted.
+    """
+    tracemalloc.start()
+    wheels = wheel_names(count)
+    start = time.perf_counter()
+    index = create(wheels)
+    build = time.perf_counter() - start
+    del wheels
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for i in range(0, 100, 10):
+        index.get(canonicalize_name(f"package_{i}"))
+    lookup = time.perf_counter() - start
+    return build, memory, lookup
+
+
+def main() -> None:
+    """Compare eager and lazy index on a synthetic listing."""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    wheels = wheel_names(count)
+
+    with (
+        patch("builder.wheel.build_arch", return_value="amd64"),
+        patch("builder.wheel.build_abi", return_value="cp314"),
+        patch("builder.wheel.alpine_version", return_value=("3", "24")),
+    ):
+        if dict(PackageIndex(wheels)) != eager_index(wheels):
+            msg = "Lazy index doesn't match eager index"
+            raise SystemExit(msg)
+
+        print(f"Index with {count} wheels")
+        for name, create in (("eager", eager_index), ("lazy", PackageIndex)):
+            build, memory, lookup = measure(create, count)
+            print(
+                f"{name:>6}: build {build:7.3f}s"
+                f"  memory {memory / 1024 / 1024:7.1f} MiB"
+                f"  10 lookups {lookup * 1000:7.2f}ms",
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Stand-ins for pip3, auditwheel, apk and rsync of the end to end benchmark.
+
+The tool is picked by the name the stub is called with. Every call sleeps for
+the configured time like the real tool would work. The stubs are configured by
+environment:
+
+STUB_BUILD_TIME     Seconds pip needs per package
+STUB_AUDIT_TIME     Seconds auditwheel needs per wheel
+STUB_WHEEL_SIZE     Bytes of the shared object in a built wheel
+STUB_FAILURE_RATE   Share of packages that fail to build, by name hash
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+import zlib
+from pathlib import Path
+from zipfile import ZIP_STORED, ZipFile
+
+TOOLS = ("pip", "pip3", "auditwheel", "apk", "rsync")
+
+
+def write_wheel(folder: Path, name: str, version: str, size: int) -> Path:
+    """Create a linux wheel with a shared object of size random bytes."""
+    wheel_file = Path(folder, f"{name}-{version}-cp314-cp314-linux_x86_64.whl")
+    with ZipFile(wheel_file, "w", ZIP_STORED) as wheel_zip:
+        wheel_zip.writestr(f"{name}/_native.so", os.urandom(size))
+        wheel_zip.writestr(
+            f"{name}-{version}.dist-info/METADATA",
+            f"Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n",
+        )
+    return wheel_file
+
+
+def _fails(name: str) -> bool:
+    """Return True if the build of a package fails, the same on every run."""
+    rate = float(os.environ.get("STUB_FAILURE_RATE", "0"))
+    return zlib.crc32(name.encode()) % 1000 < rate * 1000
+
+
+def _pip(args: list[str]) -> int:
+    """Build a wheel per requested package or report them as resolved."""
+    parser = argparse.ArgumentParser(prog="pip")
+    parser.add_argument("command")
+    for flag in ("--no-clean", "--no-deps", "--dry-run", "--ignore-installed"):
+        parser.add_argument(flag, action="store_true")
+    parser.add_argument("--quiet", action="store_true")
+    parser.add_argument("--upgrade", action="store_true")
+    parser.add_argument("--wheel-dir", type=Path)
+    parser.add_argument("--requirement", type=Path)
+    parser.add_argument("--report", type=Path)
+    for option in ("--no-binary", "--extra-index-url", "--constraint", "--find-links"):
+        parser.add_argument(option)
+    parser.add_argument("packages", nargs="*")
+    options = parser.parse_intermixed_args(args)
+
+    packages = list(options.packages)
+    if options.requirement:
+        packages += options.requirement.read_text(encoding="utf-8").split()
+
+    if options.command == "install":
+        # Requested packages resolve to themselves without dependencies
+        if options.report:
+            install = [
+                {
+                    "metadata": {"name": name, "version": version or "1.0.0"},
+                    "requested": True,
+                }
+                for name, _, version in (
+                    package.partition("==") for package in packages
+                )
+            ]
+            options.report.write_text(json.dumps({"install": install}), "utf-8")
+        return 0
+
+    size = int(os.environ.get("STUB_WHEEL_SIZE", "65536"))
+    failed = False
+    for package in packages:
+        if package.endswith(".whl"):
+            # Wheel files are saved as they are
+            shutil.copy(package, options.wheel_dir)
+            continue
+        name, _, version = package.partition("==")
+        time.sleep(float(os.environ.get("STUB_BUILD_TIME", "0")))
+        if _fails(name):
+            print(f"ERROR: Failed building wheel for {name}", file=sys.stderr)
+            failed = True
+            continue
+        write_wheel(options.wheel_dir, name, version or "1.0.0", size)
+    return 1 if failed else 0
+
+
+def _auditwheel(args: list[str]) -> int:
+    """Repair a wheel by renaming it to the musllinux platform."""
+    parser = argparse.ArgumentParser(prog="auditwheel")
+    parser.add_argument("command")
+    parser.add_argument("-w", "--wheel-dir", type=Path)
+    parser.add_argument("wheel", type=Path)
+    options = parser.parse_args(args)
+
+    time.sleep(float(os.environ.get("STUB_AUDIT_TIME", "0")))
+    name = options.wheel.name.replace("-linux_", "-musllinux_1_2_")
+    shutil.copy(options.wheel, Path(options.wheel_dir, name))
+    return 0
+
+
+def _rsync(args: list[str]) -> int:
+    """Copy sources into the local folder of the destination."""
+    files_from = next(
+        (arg.partition("=")[2] for arg in args if arg.startswith("--files-from=")),
+        None,
+    )
+    *sources, destination = [arg for arg in args if not arg.startswith("-")]
+    target = Path(destination)
+    if files_from:
+        names = Path(files_from).read_text(encoding="utf-8").split()
+        for name in names:
+            Path(target, name).parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy(Path(sources[0], name), Path(target, name))
+        return 0
+
+    target.mkdir(parents=True, exist_ok=True)
+    for source in map(Path, sources):
+        if source.is_dir():
+            shutil.copytree(source, Path(target, source.name), dirs_exist_ok=True)
+        else:
+            shutil.copy(source, target)
+    return 0
+
+
+def main() -> None:
+    """Run the tool the stub is called as."""
+    tool = Path(sys.argv[0]).name
+    if tool in ("pip", "pip3"):
+        code = _pip(sys.argv[1:])
+    elif tool == "auditwheel":
+        code = _auditwheel(sys.argv[1:])
+    elif tool == "rsync":
+        code = _rsync(sys.argv[1:])
+    else:
+        code = 0
+    sys.exit(code)
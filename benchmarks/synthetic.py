@@ -0,0 +1,78 @@
+"""Synthetic wheel indexes for benchmarks."""
+
+from collections.abc import Generator
+from pathlib import Path
+from platform import machine
+from typing import Final
+from zipfile import ZIP_DEFLATED, ZipFile
+
+_PLATFORMS: Final = (
+    "cp314-cp314-musllinux_1_2_x86_64",
+    "cp314-cp314-musllinux_1_2_aarch64",
+    "cp313-cp313-musllinux_1_2_x86_64",
+    "cp313-cp313-musllinux_1_2_aarch64",
+    "cp312-abi3-musllinux_1_2_x86_64",
+    "py3-none-any",
+)
+
+
+def wheel_names(count: int) -> list[str]:
+    """Return count distinct wheel filenames spread over many packages."""
+    names: list[str] = []
+    for i in range(count):
+        package, release = divmod(i, len(_PLATFORMS) * 10)
+        version, platform = divmod(release, len(_PLATFORMS))
+        names.append(f"package_{package}-1.{version}.0-{_PLATFORMS[platform]}.whl")
+    return names
+
+
+def requirement_lines(count: int) -> list[str]:
+    """Return count pinned requirements of the packages of wheel_names."""
+    return [f"package_{i}==1.{i % 10}.0" for i in range(count)]
+
+
+def autoindex_html(wheels: list[str]) -> bytes:
+    """Return a webserver autoindex listing of wheels."""
+    lines = [
+        f'<a href="{wheel}">{wheel}</a>     28-May-2021 09:53  38181515'
+        for wheel in wheels
+    ]
+    return (
+        '<html>\n<body>\n<pre><a href="../">../</a>\n'
+        + "\n".join(lines)
+        + "\n</pre>\n</body></html>"
+    ).encode()
+
+
+def chunked(data: bytes, chunk_size: int = 65536) -> Generator[bytes]:
+    """Yield data in chunks like a streamed response."""
+    for pos in range(0, len(data), chunk_size):
+        yield data[pos : pos + chunk_size]
+
+
+def native_wheels(folder: Path, count: int, shared_object: Path) -> list[Path]:
+    """Create count small linux wheels that ship a copy of a shared object."""
+    platform = f"linux_{machine()}"
+    data = shared_object.read_bytes()
+    wheels: list[Path] = []
+    for i in range(count):
+        name = f"native_{i}"
+        wheel_file = Path(folder, f"{name}-1.0-py3-none-{platform}.whl")
+        with ZipFile(wheel_file, "w", ZIP_DEFLATED) as wheel_zip:
+            wheel_zip.writestr(f"{name}/_native.so", data)
+            wheel_zip.writestr(
+                f"{name}-1.0.dist-info/METADATA",
+                f"Metadata-Version: 2.1\nName: {name}\nVersion: 1.0\n",
+            )
+            wheel_zip.writestr(
+                f"{name}-1.0.dist-info/WHEEL",
+                "Wheel-Version: 1.0\nRoot-Is-Purelib: false\n"
+                f"Tag: py3-none-{platform}\n",
+            )
+            wheel_zip.writestr(
+                f"{name}-1.0.dist-info/RECORD",
+                "".join(f"{member},,\n" for member in wheel_zip.namelist())
+                + f"{name}-1.0.dist-info/RECORD,,\n",
+            )
+        wheels.append(wheel_file)
+    return wheels
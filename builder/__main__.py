@@ -1,38 +1,63 @@
 """Hass.io Builder main application."""
 
-import shutil
 import sys
+from collections.abc import Mapping
+from contextlib import ExitStack
 from enum import IntEnum
 from pathlib import Path
 from subprocess import CalledProcessError, TimeoutExpired
 from tempfile import TemporaryDirectory
 
 import click
+from packaging.utils import NormalizedName
 
+from builder import trace
 from builder.apk import install_apks
+from builder.audit import AuditWorkers
+from builder.cache import WheelCache
+from builder.graph import missing_packages, parse_install_report, schedule_packages
+from builder.history import BuildHistory, select_shard
 from builder.infra import (
+    PackageIndex,
+    WhlPackage,
     check_available_binary,
+    create_package_map,
     create_wheels_folder,
     create_wheels_index,
     create_wheels_list,
+    existing_skip_binary,
+    extract_package_names_from_wheels,
     extract_packages_from_index,
+    extract_packages_from_projects,
+    fetch_projects_files,
     remove_local_wheels,
+    remove_uploaded_wheels,
 )
 from builder.pip import (
     build_wheels_local,
     build_wheels_package,
+    build_wheels_packages,
     build_wheels_requirement,
     extract_packages,
     install_pips,
     parse_requirements,
+    resolve_requirement,
     write_requirement,
 )
+from builder.pipeline import WheelPipeline
+from builder.trace import span
 from builder.upload import run_upload
-from builder.utils import check_url
+from builder.utils import (
+    CommandUsage,
+    check_url,
+    stage_file,
+    write_usage_report,
+)
 from builder.wheel import (
     copy_wheels_from_cache,
     fix_wheels_unmatch_requirements,
     run_auditwheel,
+    snapshot_wheels,
 )
 
 _DEFAULT_SKIP_BINARY = ":none:"
@@ -61,6 +86,104 @@ class ExitCodes(IntEnum):
     ERROR_TIMEOUT = 80
 
 
+def _parse_shard(
+    _ctx: click.Context,
+    _param: click.Parameter,
+    value: str | None,
+) -> tuple[int, int] | None:
+    """Parse a shard option of the form i/N."""
+    if value is None:
+        return None
+    shard, _, count = value.partition("/")
+    if not (shard.isdigit() and count.isdigit() and 1 <= int(shard) <= int(count)):
+        msg = f"{value} is not of the form i/N with 1 <= i <= N"
+        raise click.BadParameter(msg)
+    return int(shard), int(count)
+
+
+def _shard_packages(
+    packages: list[str],
+    shard: tuple[int, int],
+    shard_history: Path | None,
+) -> list[str]:
+    """Return the packages of a shard."""
+    selected = select_shard(
+        packages,
+        *shard,
+        BuildHistory(shard_history) if shard_history else None,
+    )
+    print(
+        f"Shard {shard[0]}/{shard[1]}: {len(selected)} of {len(packages)} packages",
+        flush=True,
+    )
+    return selected
+
+
+def _plan_packages(
+    packages: list[str],
+    wheels_index: str,
+    package_index: Mapping[NormalizedName, list[WhlPackage]],
+    index_lookup: str,
+    timeout: int,
+    constraint: Path | None,
+) -> list[str] | None:
+    """Return pins of all resolved packages that are missing from the index."""
+    with span("plan"):
+        temp_requirement = Path("/tmp/wheels_plan.txt")  # noqa: S108
+        write_requirement(temp_requirement, packages)
+        try:
+            report = resolve_requirement(
+                temp_requirement,
+                wheels_index,
+                timeout,
+                constraint,
+            )
+        except (CalledProcessError, TimeoutExpired) as err:
+            print(f"Can't plan the build: {err!s}", flush=True)
+            return None
+
+        resolved = parse_install_report(report)
+        if index_lookup != "listing":
+            package_index = extract_packages_from_projects(wheels_index, list(resolved))
+        missing = missing_packages(resolved, package_index)
+        print(
+            f"Plan: {len(missing)} of {len(resolved)} resolved packages are missing",
+            flush=True,
+        )
+        return missing
+
+
+def _prune_wheels(
+    wheels_dir: Path,
+    prune: str,
+    wheels_index: str,
+    package_index: PackageIndex,
+    index_lookup: str,
+) -> None:
+    """Remove wheels from the upload that exist on the index already."""
+    with span("prune"):
+        names = extract_package_names_from_wheels(wheels_dir)
+        if prune == "filename" and index_lookup == "listing":
+            remote = dict.fromkeys(
+                file for name in names for file in package_index.files(name)
+            )
+        else:
+            # Only project pages carry the sha256 of a file
+            remote = fetch_projects_files(wheels_index, names)
+        saved = remove_uploaded_wheels(
+            wheels_dir,
+            remote,
+            check_hash=prune == "sha256",
+        )
+        print(f"Pruned {saved / 1024 / 1024:.1f} MiB from the upload", flush=True)
+
+
+def _export_trace(trace_file: Path) -> None:
+    """Write the trace file and print the timing summary."""
+    trace.write_trace(trace_file)
+    print(trace.summary(), flush=True)
+
+
 @click.command("builder")
 @click.option("--apk", type=str, help="APKs they are needed to build this.")
 @click.option("--pip", type=str, help="PiPy modules needed to build this.")
@@ -96,6 +219,46 @@ class ExitCodes(IntEnum):
     default=False,
     help="Install every package as single requirement.",
 )
+@click.option(
+    "--shard",
+    callback=_parse_shard,
+    help="Build only shard i/N of the requirements, like 2/4.",
+)
+@click.option(
+    "--shard-history",
+    type=click.Path(dir_okay=False, exists=True, path_type=Path),
+    help="Build history to balance the shards by, the same for every shard.",
+)
+@click.option(
+    "--jobs",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of single requirement builds running in parallel.",
+)
+@click.option(
+    "--audit-jobs",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of auditwheel repairs running in parallel.",
+)
+@click.option(
+    "--audit-engine",
+    default="command",
+    type=click.Choice(["worker", "command"]),
+    help="Repair wheels in long-lived auditwheel workers or by the command.",
+)
+@click.option(
+    "--dependency-graph",
+    is_flag=True,
+    default=False,
+    help="Resolve dependencies first and build shared ones once before single builds.",
+)
+@click.option(
+    "--plan",
+    is_flag=True,
+    default=False,
+    help="Resolve all dependencies first and build only pins missing from the index.",
+)
 @click.option(
     "--local",
     is_flag=True,
@@ -109,18 +272,70 @@ class ExitCodes(IntEnum):
     help="Test building wheels, no upload.",
 )
 @click.option("--upload", default="rsync", help="Upload plugin to upload wheels.")
+@click.option(
+    "--prune",
+    default="off",
+    type=click.Choice(["off", "filename", "sha256"]),
+    help="Skip upload of wheels whose file is on the index by filename or sha256.",
+)
+@click.option(
+    "--pipeline-batch",
+    default=0,
+    type=click.IntRange(min=0),
+    help="Repair and upload wheels in batches of this size while building, 0 is off.",
+)
+@click.option(
+    "--upload-streams",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of concurrent upload streams.",
+)
 @click.option(
     "--remote",
     required=True,
     type=str,
     help="Remote URL pass to upload plugin.",
 )
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False, path_type=Path),
+    help="Folder to keep built wheels and build durations between runs.",
+)
+@click.option(
+    "--cache-size",
+    default=10240,
+    type=click.IntRange(min=0),
+    help="Max size of the cache folder in MiB.",
+)
+@click.option(
+    "--index-lookup",
+    default="project",
+    type=click.Choice(["project", "listing"]),
+    help="Look up single projects in the simple index or parse the whole listing.",
+)
+@click.option(
+    "--index-ttl",
+    default=0,
+    type=click.IntRange(min=0),
+    help="Minutes the index snapshot in the cache folder is used without revalidation.",
+)
 @click.option(
     "--timeout",
     default=345,
     type=int,
     help="Max runtime for pip before abort.",
 )
+@click.option(
+    "--trace",
+    "trace_file",
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="Write timing spans of phases and packages as Chrome trace JSON.",
+)
+@click.option(
+    "--usage-report",
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="Write CPU time, peak memory and I/O of every build as JSON.",
+)
 def builder(  # noqa: C901, PLR0913, PLR0912, PLR0915
     apk: str | None,
     pip: str | None,
@@ -131,14 +346,33 @@ def builder(  # noqa: C901, PLR0913, PLR0912, PLR0915
     constraint: Path | None,
     prebuild_dir: Path | None,
     single: bool,
+    shard: tuple[int, int] | None,
+    shard_history: Path | None,
+    jobs: int,
+    audit_jobs: int,
+    audit_engine: str,
+    dependency_graph: bool,
+    plan: bool,
     local: bool,
     test: bool,
     upload: str,
+    prune: str,
+    pipeline_batch: int,
+    upload_streams: int,
     remote: str,
+    cache_dir: Path | None,
+    cache_size: int,
+    index_lookup: str,
+    index_ttl: int,
     timeout: int,
+    trace_file: Path | None,
+    usage_report: Path | None,
 ) -> None:
     """Build wheels precompiled for Home Assistant container."""
-    check_url(index)
+    if trace_file:
+        trace.enable()
+    with span("check_url"):
+        check_url(index)
     if (override := _OVERRIDE_SKIP_BINARY.get(index)) is not None:
         if skip_binary != _DEFAULT_SKIP_BINARY:
             print(
@@ -149,103 +383,263 @@ def builder(  # noqa: C901, PLR0913, PLR0912, PLR0915
         print(f"Setting skip binary to: {skip_binary}")
 
     exit_code = ExitCodes.SUCCESS
-    with TemporaryDirectory() as temp_dir:
+    with TemporaryDirectory() as temp_dir, ExitStack() as stack:
         output = Path(temp_dir)
         timeout = timeout * 60
+        if trace_file:
+            stack.callback(_export_trace, trace_file)
+        build_usage: dict[str, CommandUsage] = {}
+        if usage_report:
+            stack.callback(write_usage_report, usage_report, build_usage)
 
         wheels_dir = create_wheels_folder(output)
         wheels_index = create_wheels_index(index)
         wheels_list = create_wheels_list(index)
-        package_index = extract_packages_from_index(wheels_list)
+        cache = (
+            WheelCache(cache_dir, cache_size * 1024 * 1024, apk, pip)
+            if cache_dir
+            else None
+        )
+        history = BuildHistory(Path(cache_dir, "history.json")) if cache_dir else None
+        with span("index"):
+            if index_lookup == "listing":
+                package_index = extract_packages_from_index(
+                    wheels_list,
+                    cache.index_snapshot(wheels_list) if cache else None,
+                    index_ttl * 60,
+                )
+            else:
+                # Only the skip binary packages are looked up in the index
+                package_index = extract_packages_from_projects(
+                    wheels_index,
+                    [
+                        name
+                        for name in skip_binary.split(";")
+                        if not name.startswith(":")
+                    ],
+                )
 
         # Setup build helper
         if apk:
-            install_apks(apk)
+            with span("install_apks"):
+                install_apks(apk)
         if pip:
-            install_pips(wheels_index, pip)
-
-        if local:
-            # Build wheels in a local folder/src
-            build_wheels_local(wheels_index, wheels_dir)
-        elif prebuild_dir:
-            # Prepare allready builded wheels for upload
-            for whl_file in prebuild_dir.glob("*.whl"):
-                shutil.copy(whl_file, Path(wheels_dir, whl_file.name))
-        elif not requirement:
-            print("No requirement file provided, nothing to build.")
-            sys.exit(ExitCodes.ERROR_FILE_NOT_FOUND)
-        elif single:
-            # Build every wheel like a single installation
-            packages = extract_packages(requirement, requirement_diff)
-            constraints = parse_requirements(constraint) if constraint else []
-            skip_binary_new = check_available_binary(
-                package_index,
-                skip_binary,
-                packages,
-                constraints,
+            with span("install_pips"):
+                install_pips(wheels_index, pip)
+        pip_cache = Path("/root/.cache/pip/wheels")
+        pip_cache_snapshot = snapshot_wheels(pip_cache)
+
+        audit_workers = (
+            stack.enter_context(AuditWorkers(audit_jobs))
+            if audit_engine == "worker"
+            else None
+        )
+        pipeline = None
+        if pipeline_batch:
+            exclude = {}
+            if skip_binary != ":none:" and requirement:
+                exclude = existing_skip_binary(
+                    package_index,
+                    skip_binary,
+                    extract_packages(requirement, requirement_diff)
+                    + (parse_requirements(constraint) if constraint else []),
+                )
+            pipeline = WheelPipeline(
+                wheels_dir,
+                None
+                if test
+                else lambda folder: run_upload(upload, folder, remote, upload_streams),
+                exclude,
+                pipeline_batch,
+                wheel_cache=cache,
+                workers=audit_workers,
+                prune=None
+                if test or prune == "off"
+                else lambda folder: _prune_wheels(
+                    folder,
+                    prune,
+                    wheels_index,
+                    package_index,
+                    index_lookup,
+                ),
             )
-            for package in packages:
-                print(f"Process package: {package}", flush=True)
-                try:
-                    build_wheels_package(
-                        package,
+            pipeline.start()
+
+        with span("build"):
+            if local:
+                # Build wheels in a local folder/src
+                build_wheels_local(wheels_index, wheels_dir)
+            elif prebuild_dir:
+                # Prepare allready builded wheels for upload
+                for whl_file in prebuild_dir.glob("*.whl"):
+                    stage_file(whl_file, wheels_dir)
+            elif not requirement:
+                print("No requirement file provided, nothing to build.")
+                sys.exit(ExitCodes.ERROR_FILE_NOT_FOUND)
+            elif single:
+                # Build every wheel like a single installation
+                packages = extract_packages(requirement, requirement_diff)
+                if shard:
+                    packages = _shard_packages(packages, shard, shard_history)
+                planned = (
+                    _plan_packages(
+                        packages,
                         wheels_index,
-                        wheels_dir,
-                        skip_binary_new,
+                        package_index,
+                        index_lookup,
                         timeout,
                         constraint,
                     )
-                except CalledProcessError:
-                    exit_code = ExitCodes.ERROR_BUILD_FAILED
-                except TimeoutExpired:
-                    exit_code = ExitCodes.ERROR_TIMEOUT
-        else:
-            # Build all needed wheels at once
-            packages = extract_packages(requirement, requirement_diff)
-            temp_requirement = Path("/tmp/wheels_requirement.txt")  # noqa: S108
-            write_requirement(temp_requirement, packages)
-            constraints = parse_requirements(constraint) if constraint else []
-            skip_binary_new = check_available_binary(
-                package_index,
-                skip_binary,
-                packages,
-                constraints,
-            )
-            try:
-                build_wheels_requirement(
-                    temp_requirement,
+                    if plan
+                    else None
+                )
+                if planned is not None:
+                    packages = planned
+                constraints = parse_requirements(constraint) if constraint else []
+                skip_binary_new = check_available_binary(
+                    package_index,
+                    skip_binary,
+                    packages,
+                    constraints,
+                )
+                dependencies = None
+                if dependency_graph and planned is None:
+                    temp_requirement = Path("/tmp/wheels_requirement.txt")  # noqa: S108
+                    write_requirement(temp_requirement, packages)
+                    try:
+                        report = resolve_requirement(
+                            temp_requirement,
+                            wheels_index,
+                            timeout,
+                            constraint,
+                        )
+                    except (CalledProcessError, TimeoutExpired) as err:
+                        print(f"Can't resolve dependency graph: {err!s}", flush=True)
+                    else:
+                        dependencies = schedule_packages(
+                            packages,
+                            parse_install_report(report),
+                        )
+                        packages = list(dependencies)
+                if history:
+                    # Heavy builds first, so they don't run into the timeout
+                    packages = history.longest_first(packages)
+                for package, build in build_wheels_packages(
+                    packages,
                     wheels_index,
                     wheels_dir,
                     skip_binary_new,
                     timeout,
                     constraint,
+                    jobs,
+                    dependencies,
+                    cache,
+                    no_deps=planned is not None,
+                ):
+                    try:
+                        usage = build.result()
+                    except CalledProcessError as err:
+                        exit_code = ExitCodes.ERROR_BUILD_FAILED
+                        usage = getattr(err, "usage", None)
+                    except TimeoutExpired as err:
+                        exit_code = ExitCodes.ERROR_TIMEOUT
+                        usage = getattr(err, "usage", None)
+                    if usage:
+                        build_usage[package] = usage
+                        if history:
+                            history.record(package, usage.wall)
+                if history:
+                    history.save()
+            else:
+                # Build all needed wheels at once
+                packages = extract_packages(requirement, requirement_diff)
+                if shard:
+                    packages = _shard_packages(packages, shard, shard_history)
+                planned = (
+                    _plan_packages(
+                        packages,
+                        wheels_index,
+                        package_index,
+                        index_lookup,
+                        timeout,
+                        constraint,
+                    )
+                    if plan
+                    else None
                 )
-            except CalledProcessError:
-                exit_code = ExitCodes.ERROR_BUILD_FAILED
-            except TimeoutExpired:
-                exit_code = ExitCodes.ERROR_TIMEOUT
+                if planned is not None:
+                    packages = planned
+                if not packages:
+                    print("No packages to build.")
+                else:
+                    temp_requirement = Path("/tmp/wheels_requirement.txt")  # noqa: S108
+                    write_requirement(temp_requirement, packages)
+                    constraints = parse_requirements(constraint) if constraint else []
+                    skip_binary_new = check_available_binary(
+                        package_index,
+                        skip_binary,
+                        packages,
+                        constraints,
+                    )
+                    usage = None
+                    try:
+                        usage = build_wheels_requirement(
+                            temp_requirement,
+                            wheels_index,
+                            wheels_dir,
+                            skip_binary_new,
+                            timeout,
+                            constraint,
+                            cache,
+                            no_deps=planned is not None,
+                        )
+                    except CalledProcessError as err:
+                        exit_code = ExitCodes.ERROR_BUILD_FAILED
+                        usage = getattr(err, "usage", None)
+                    except TimeoutExpired as err:
+                        exit_code = ExitCodes.ERROR_TIMEOUT
+                        usage = getattr(err, "usage", None)
+                    if usage:
+                        # One pip run builds all packages of the requirement
+                        build_usage[requirement.name] = usage
+
+        if pipeline:
+            with span("pipeline"):
+                if not pipeline.stop():
+                    exit_code = ExitCodes.ERROR_BUILD_FAILED
 
         # pip copy wheels only on success over to our folder
-        # let's preserve on a error all success builds before
-        if exit_code != ExitCodes.SUCCESS:
-            copy_wheels_from_cache(Path("/root/.cache/pip/wheels"), wheels_dir)
+        # let's preserve on a error all success builds of this run before
+        if exit_code != ExitCodes.SUCCESS and requirement:
+            copy_wheels_from_cache(
+                pip_cache,
+                wheels_dir,
+                create_package_map(extract_packages(requirement, requirement_diff)),
+                pip_cache_snapshot,
+                pipeline.uploaded_packages if pipeline else frozenset(),
+            )
 
-        if not run_auditwheel(wheels_dir):
-            exit_code = ExitCodes.ERROR_BUILD_FAILED
+        with span("auditwheel"):
+            if not run_auditwheel(wheels_dir, audit_jobs, cache, audit_workers):
+                exit_code = ExitCodes.ERROR_BUILD_FAILED
 
         # Check if all wheels are on our min requirements
         package_wrong = fix_wheels_unmatch_requirements(wheels_dir)
         if package_wrong and exit_code != ExitCodes.ERROR_TIMEOUT:
-            for package, version in package_wrong.items():
-                build_wheels_package(
-                    f"{package}=={version!s}",
-                    wheels_index,
-                    wheels_dir,
-                    package,
-                    timeout,
-                )
-            if not run_auditwheel(wheels_dir):
-                exit_code = ExitCodes.ERROR_BUILD_FAILED
+            with span("rebuild unmatched"):
+                for package, version in package_wrong.items():
+                    usage = build_wheels_package(
+                        f"{package}=={version!s}",
+                        wheels_index,
+                        wheels_dir,
+                        package,
+                        timeout,
+                        cache=cache,
+                    )
+                    if usage:
+                        build_usage[f"{package}=={version!s}"] = usage
+                if not run_auditwheel(wheels_dir, audit_jobs, cache, audit_workers):
+                    exit_code = ExitCodes.ERROR_BUILD_FAILED
 
         if skip_binary != ":none:":
             if not requirement:
@@ -264,8 +658,15 @@ def builder(  # noqa: C901, PLR0913, PLR0912, PLR0915
                 wheels_dir,
             )
 
+        if prune != "off" and not test:
+            _prune_wheels(wheels_dir, prune, wheels_index, package_index, index_lookup)
+
         if not test:
-            run_upload(upload, output, remote)
+            with span("run_upload"):
+                run_upload(upload, output, remote, upload_streams)
+
+        if cache:
+            cache.evict()
 
     sys.exit(exit_code)
 
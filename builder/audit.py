@@ -0,0 +1,138 @@
+"""Run auditwheel repairs in long-lived worker processes.
+
+The auditwheel command starts a new interpreter, imports auditwheel and loads
+the musl policy for every wheel. A worker does that once and keeps the library
+lookup caches for all of its repairs. Repairs change the working directory, so
+a worker only runs one repair at a time.
+"""
+
+import argparse
+import io
+import logging
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import redirect_stderr
+from functools import cache
+from multiprocessing import get_context
+from pathlib import Path
+from subprocess import CalledProcessError
+from threading import Lock
+from types import TracebackType
+from typing import IO, Self
+
+_PARSER: argparse.ArgumentParser | None = None
+
+
+def _init_worker() -> None:
+    """Load auditwheel once for all repairs of a worker process."""
+    global _PARSER  # noqa: PLW0603 # pylint: disable=global-statement
+
+    # pylint: disable-next=import-outside-toplevel
+    from auditwheel import (  # type: ignore[import-untyped] # noqa: PLC0415
+        libc,
+        main_repair,
+    )
+
+    # The musl version is read by running the loader for every wheel
+    # pylint: disable-next=protected-access
+    libc._get_musl_version = cache(libc._get_musl_version)  # noqa: SLF001
+
+    parser = argparse.ArgumentParser(prog="auditwheel")
+    main_repair.configure_parser(parser.add_subparsers())
+    _PARSER = parser
+
+
+def _repair(wheel_file: str, wheel_dir: str) -> tuple[int, str]:
+    """Repair a wheel like the auditwheel command and return code and output."""
+    # pylint: disable-next=import-outside-toplevel
+    from auditwheel.wheel_abi import (  # type: ignore[import-untyped] # noqa: PLC0415
+        get_wheel_elfdata,
+    )
+
+    if _PARSER is None:
+        msg = "Worker is not initialized"
+        raise RuntimeError(msg)
+
+    log = io.StringIO()
+    logging.basicConfig(level=logging.INFO, stream=log, force=True)
+    try:
+        with redirect_stderr(log):
+            args = _PARSER.parse_args(["repair", "-w", wheel_dir, wheel_file])
+            code = args.func(args, _PARSER) or 0
+    except SystemExit as err:
+        # parser.error() rejects a wheel that can't be repaired
+        code = err.code if isinstance(err.code, int) else 1
+    except Exception:  # noqa: BLE001 # pylint: disable=broad-exception-caught
+        # The command fails the same way on a library it can't locate or a
+        # broken wheel, so only this wheel fails and not the whole builder
+        traceback.print_exc(file=log)
+        code = 1
+    finally:
+        # Cached by path, a rebuilt wheel with the same name has to be read again
+        get_wheel_elfdata.cache_clear()
+    return code, log.getvalue()
+
+
+class AuditWorkers:
+    """Pool of worker processes with auditwheel loaded."""
+
+    def __init__(self, jobs: int = 1) -> None:
+        """Initialize the worker processes."""
+        self._jobs = jobs
+        self._lock = Lock()
+        self._executor = self._create_executor()
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        """Start a new pool of worker processes."""
+        return ProcessPoolExecutor(
+            max_workers=self._jobs,
+            mp_context=get_context("spawn"),
+            initializer=_init_worker,
+        )
+
+    def repair(
+        self,
+        wheel_file: Path,
+        wheel_dir: Path,
+        output: IO[str] | None = None,
+    ) -> None:
+        """Repair a wheel into wheel_dir, raise CalledProcessError on failure.
+
+        A dead worker, like one killed for its memory, fails the wheel and the
+        pool is started again for the next repairs.
+        """
+        executor = self._executor
+        try:
+            code, log = executor.submit(
+                _repair,
+                str(wheel_file),
+                str(wheel_dir),
+            ).result()
+        except BrokenProcessPool as err:
+            with self._lock:
+                if self._executor is executor:
+                    executor.shutdown(wait=False)
+                    self._executor = self._create_executor()
+            print(f"Audit worker died: {err!s}", file=output, flush=True)
+            raise CalledProcessError(1, f"auditwheel repair {wheel_file}") from err
+        print(log, end="", file=output, flush=True)
+        if code:
+            raise CalledProcessError(code, f"auditwheel repair {wheel_file}")
+
+    def close(self) -> None:
+        """Stop the worker processes."""
+        self._executor.shutdown()
+
+    def __enter__(self) -> Self:
+        """Return the workers."""
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        exc_traceback: TracebackType | None,
+    ) -> None:
+        """Stop the worker processes."""
+        self.close()
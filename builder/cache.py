@@ -0,0 +1,168 @@
+"""Persistent cache of built wheels."""
+
+import hashlib
+import json
+import os
+import shutil
+from collections.abc import Iterable
+from pathlib import Path
+from tempfile import mkdtemp
+from typing import Final
+
+from packaging.requirements import InvalidRequirement, Requirement
+from packaging.utils import NormalizedName, canonicalize_name
+
+from .utils import alpine_version, build_abi, build_arch, stage_file
+
+# Environment variables that change with every run but not the build result
+_VOLATILE_ENV: Final = frozenset(
+    {"HOSTNAME", "MAKEFLAGS", "OLDPWD", "PWD", "SHLVL", "TERM", "_"},
+)
+
+
+def pinned_version(package: str) -> tuple[NormalizedName, str] | None:
+    """Return normalized name and version of a requirement pinned to one version."""
+    try:
+        requirement = Requirement(package)
+    except InvalidRequirement:
+        return None
+    specifiers = list(requirement.specifier)
+    if (
+        requirement.url
+        or requirement.marker
+        or len(specifiers) != 1
+        or specifiers[0].operator not in ("==", "===")
+        or specifiers[0].version.endswith(".*")
+    ):
+        return None
+    return canonicalize_name(requirement.name), specifiers[0].version
+
+
+class WheelCache:
+    """Store built wheels across builder runs.
+
+    Every entry holds the wheels of one pinned package build or auditwheel
+    repair and is keyed by a fingerprint of its input and the build system.
+    Entries are evicted least recently used once the cache grows over max_size
+    bytes.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        max_size: int,
+        apk: str | None = None,
+        pip: str | None = None,
+    ) -> None:
+        """Initialize the cache folder and fingerprint of the build system."""
+        self.path = path
+        self.max_size = max_size
+        self.wheels = Path(path, "wheels")
+        self.wheels.mkdir(parents=True, exist_ok=True)
+
+        system = {
+            "abi": build_abi(),
+            "arch": build_arch(),
+            "alpine": alpine_version(),
+            "apk": sorted(filter(None, (apk or "").split(";"))),
+            "pip": sorted(filter(None, (pip or "").split(";"))),
+            "env": {
+                key: value
+                for key, value in sorted(os.environ.items())
+                if key not in _VOLATILE_ENV
+            },
+        }
+        self._system = json.dumps(system, sort_keys=True)
+
+    def index_snapshot(self, index: str) -> Path:
+        """Return the snapshot file of an index listing."""
+        name = hashlib.sha256(index.encode()).hexdigest()[:16]
+        return Path(self.path, "index", f"{name}.snapshot")
+
+    def key(
+        self,
+        package: str,
+        skip_binary: str,
+        *,
+        index: str = "",
+        constraint: str | None = None,
+        no_deps: bool = False,
+        requirement: bool = False,
+    ) -> str | None:
+        """Return the cache key of a package build or None if it can't be cached.
+
+        The index and the sha256 of the constraint file select the versions of
+        the dependencies that are built along.
+        """
+        if (pinned := pinned_version(package)) is None:
+            return None
+        name, version = pinned
+
+        # A binary from pypi is a different result than a build from source
+        binaries = {canonicalize_name(binary) for binary in skip_binary.split(",")}
+        source = skip_binary == ":all:" or name in binaries
+
+        fingerprint = hashlib.sha256(self._system.encode())
+        fingerprint.update(f"\0{name}\0{version}\0{source}".encode())
+        fingerprint.update(f"\0{index}\0{constraint or ''}".encode())
+
+        # Without dependencies the entry holds only the wheel of the package,
+        # a requirement build stores only that wheel although it built more
+        if no_deps:
+            fingerprint.update(b"\0no-deps")
+        elif requirement:
+            fingerprint.update(b"\0requirement")
+        return fingerprint.hexdigest()
+
+    def repair_key(self, digest: str) -> str:
+        """Return the cache key of an auditwheel repair of a wheel by its sha256."""
+        fingerprint = hashlib.sha256(self._system.encode())
+        fingerprint.update(f"\0repair\0{digest}".encode())
+        return fingerprint.hexdigest()
+
+    def _entry(self, key: str) -> Path:
+        """Return folder of a cache entry."""
+        return Path(self.wheels, key[:2], key)
+
+    def restore(self, key: str, output: Path) -> bool:
+        """Copy the wheels of a cache entry into output and return True on hit."""
+        entry = self._entry(key)
+        if not entry.is_dir():
+            return False
+
+        for wheel_file in entry.glob("*.whl"):
+            stage_file(wheel_file, output)
+        os.utime(entry)
+        return True
+
+    def store(self, key: str, wheels: Iterable[Path]) -> None:
+        """Add wheels as a new cache entry."""
+        entry = self._entry(key)
+        if entry.is_dir():
+            return
+        entry.parent.mkdir(exist_ok=True)
+
+        # Fill a temp folder first, so a partial entry is never visible
+        temp_dir = Path(mkdtemp(dir=self.path))
+        try:
+            for wheel_file in wheels:
+                stage_file(wheel_file, temp_dir)
+            temp_dir.rename(entry)
+        except OSError:
+            # Concurrent build did store the same entry
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def evict(self) -> None:
+        """Remove least recently used entries until the cache fits max_size."""
+        entries: list[tuple[float, int, Path]] = []
+        for entry in self.wheels.glob("*/*"):
+            size = sum(wheel_file.stat().st_size for wheel_file in entry.iterdir())
+            entries.append((entry.stat().st_mtime, size, entry))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_size:
+                break
+            print(f"Evict cache entry {entry.name}", flush=True)
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
@@ -0,0 +1,145 @@
+"""Dependency graph of a requirement set."""
+
+from collections.abc import Iterable, Mapping
+from dataclasses import dataclass
+from typing import Any
+
+from awesomeversion import AwesomeVersion
+from packaging.requirements import InvalidRequirement, Requirement
+from packaging.utils import NormalizedName, canonicalize_name
+
+from .infra import WhlPackage, check_existing_packages
+
+
+@dataclass
+class ResolvedPackage:
+    """Represent a package from a pip installation report."""
+
+    name: NormalizedName
+    version: str
+    dependencies: frozenset[NormalizedName]
+    requested: bool
+
+
+def _requirement_name(package: str) -> NormalizedName | None:
+    """Return the normalized name of a requirement line."""
+    try:
+        return canonicalize_name(Requirement(package).name)
+    except InvalidRequirement:
+        return None
+
+
+def _dependency_names(
+    metadata: dict[str, Any],
+    extras: Iterable[str],
+) -> set[NormalizedName]:
+    """Return dependency names of a report entry with active markers."""
+    environments = [{"extra": extra} for extra in ("", *extras)]
+    dependencies: set[NormalizedName] = set()
+    for dependency in metadata.get("requires_dist", []):
+        try:
+            requirement = Requirement(dependency)
+        except InvalidRequirement:
+            continue
+        if requirement.marker and not any(
+            requirement.marker.evaluate(environment) for environment in environments
+        ):
+            continue
+        dependencies.add(canonicalize_name(requirement.name))
+    return dependencies
+
+
+def parse_install_report(
+    report: dict[str, Any],
+) -> dict[NormalizedName, ResolvedPackage]:
+    """Create the resolved dependency graph from a pip installation report."""
+    resolved: dict[NormalizedName, ResolvedPackage] = {}
+    for item in report.get("install", []):
+        metadata = item["metadata"]
+        name = canonicalize_name(metadata["name"])
+        dependencies = _dependency_names(metadata, item.get("requested_extras", []))
+        resolved[name] = ResolvedPackage(
+            name,
+            metadata["version"],
+            frozenset(dependencies),
+            item.get("requested", False),
+        )
+
+    # Only keep edges inside of the resolved set
+    for package in resolved.values():
+        package.dependencies = package.dependencies & resolved.keys()
+    return resolved
+
+
+def transitive_dependencies(
+    resolved: dict[NormalizedName, ResolvedPackage],
+    name: NormalizedName,
+) -> set[NormalizedName]:
+    """Return all packages a package depends on, without the package itself."""
+    found: set[NormalizedName] = set()
+    stack = list(resolved[name].dependencies)
+    while stack:
+        dependency = stack.pop()
+        if dependency in found:
+            continue
+        found.add(dependency)
+        stack.extend(resolved[dependency].dependencies)
+    found.discard(name)
+    return found
+
+
+def schedule_packages(
+    packages: list[str],
+    resolved: dict[NormalizedName, ResolvedPackage],
+) -> dict[str, set[str]]:
+    """Plan single builds of packages from their dependency graph.
+
+    Dependencies shared by more than one package are added as pinned builds of
+    their own. Every build waits for the builds of its dependencies, so a shared
+    dependency is built once before all of its dependents.
+    """
+    schedule: dict[str, set[str]] = {}
+    requested: dict[NormalizedName, str] = {}
+    for package in packages:
+        name = _requirement_name(package)
+        if name is None or name not in resolved or name in requested:
+            # Nothing known about the dependencies, build it without waiting
+            schedule[package] = set()
+            continue
+        requested[name] = package
+
+    closures = {name: transitive_dependencies(resolved, name) for name in requested}
+
+    # Count how many requested packages need each dependency
+    users: dict[NormalizedName, int] = {}
+    for closure in closures.values():
+        for dependency in closure:
+            users[dependency] = users.get(dependency, 0) + 1
+
+    builds: dict[NormalizedName, str] = dict(requested)
+    for dependency, count in users.items():
+        if count > 1 and dependency not in builds:
+            builds[dependency] = f"{dependency}=={resolved[dependency].version}"
+            closures[dependency] = transitive_dependencies(resolved, dependency)
+
+    for name, package in builds.items():
+        schedule[package] = {
+            builds[dependency] for dependency in closures[name] if dependency in builds
+        }
+    return schedule
+
+
+def missing_packages(
+    resolved: dict[NormalizedName, ResolvedPackage],
+    package_index: Mapping[NormalizedName, list[WhlPackage]],
+) -> list[str]:
+    """Return pins of resolved packages without a wheel of their version."""
+    existing = check_existing_packages(
+        package_index,
+        {name: AwesomeVersion(package.version) for name, package in resolved.items()},
+    )
+    return [
+        f"{name}=={package.version}"
+        for name, package in sorted(resolved.items())
+        if name not in existing
+    ]
@@ -0,0 +1,120 @@
+"""Durations of past package builds."""
+
+import hashlib
+import json
+import os
+import statistics
+from collections.abc import Iterable
+from pathlib import Path
+from typing import Final
+
+from packaging.requirements import InvalidRequirement, Requirement
+from packaging.utils import NormalizedName, canonicalize_name
+
+from .cache import pinned_version
+from .utils import balanced_partitions, build_abi, build_arch
+
+# Guess for packages without any recorded build
+_DEFAULT_DURATION: Final = 60.0
+
+# Recorded versions per package
+_MAX_VERSIONS: Final = 3
+
+
+def _name_version(package: str) -> tuple[NormalizedName | str, str | None]:
+    """Return name and pinned version of a requirement."""
+    if pinned := pinned_version(package):
+        return pinned
+    try:
+        return canonicalize_name(Requirement(package).name), None
+    except InvalidRequirement:
+        return package, None
+
+
+class BuildHistory:
+    """Record build durations per package and version of this build system.
+
+    The history estimates how long a build takes. A version that was built
+    before takes as long as last time, another version of a known package as
+    long as the mean of its versions, and an unknown package as long as the
+    median of all packages.
+    """
+
+    def __init__(self, path: Path) -> None:
+        """Load the history file."""
+        self.path = path
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            data = {}
+        self._data: dict[str, dict[str, dict[str, float]]] = data
+        self._builds = self._data.setdefault(f"{build_arch()}-{build_abi()}", {})
+
+        durations = [
+            seconds
+            for versions in self._builds.values()
+            for seconds in versions.values()
+        ]
+        self._default = statistics.median(durations) if durations else _DEFAULT_DURATION
+
+    def record(self, package: str, seconds: float) -> None:
+        """Record the duration of a package build."""
+        name, version = _name_version(package)
+        versions = self._builds.setdefault(name, {})
+        versions.pop(version or "", None)
+        versions[version or ""] = round(seconds, 1)
+        for old in list(versions)[:-_MAX_VERSIONS]:
+            del versions[old]
+
+    def estimate(self, package: str) -> float:
+        """Return the expected duration of a package build in seconds."""
+        name, version = _name_version(package)
+        if not (versions := self._builds.get(name)):
+            return self._default
+        if (seconds := versions.get(version or "")) is not None:
+            return seconds
+        return statistics.mean(versions.values())
+
+    def longest_first(self, packages: Iterable[str]) -> list[str]:
+        """Return packages ordered by expected duration, longest first."""
+        return sorted(packages, key=lambda package: (-self.estimate(package), package))
+
+    def save(self) -> None:
+        """Replace the history file atomically."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_file = self.path.with_suffix(f".{os.getpid()}.tmp")
+        temp_file.write_text(
+            json.dumps(self._data, indent=1),
+            encoding="utf-8",
+        )
+        temp_file.replace(self.path)
+
+
+def _hash_shard(package: str, count: int) -> int:
+    """Return the shard of a package by the hash of its name."""
+    digest = hashlib.sha256(str(_name_version(package)[0]).encode()).digest()
+    return int.from_bytes(digest[:8]) % count + 1
+
+
+def select_shard(
+    packages: Iterable[str],
+    shard: int,
+    count: int,
+    history: BuildHistory | None = None,
+) -> list[str]:
+    """Return the packages of shard 1 to count of the requirement set.
+
+    With a history, the shards are balanced by expected duration. Every shard
+    job must use the same history, or the shards overlap. Without one, a
+    package is placed by the hash of its name, so it stays in its shard while
+    other packages come and go.
+    """
+    if history is None:
+        return [package for package in packages if _hash_shard(package, count) == shard]
+
+    # Sorted input keeps the partitions the same for every job
+    partitions = balanced_partitions(
+        {package: history.estimate(package) for package in sorted(packages)},
+        count,
+    )
+    return partitions[shard - 1] if shard <= len(partitions) else []
@@ -1,26 +1,38 @@
 """Create folder structure for index."""
 
+import json
+import os
 import re
+import time
+import zlib
+from collections.abc import Generator, Iterable, Iterator, Mapping
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+from html import unescape
 from html.parser import HTMLParser
 from pathlib import Path
-from typing import Final
+from typing import Any, Final
+from urllib.parse import unquote
 
 import requests
 from awesomeversion import AwesomeVersion
 from packaging.tags import Tag
 from packaging.utils import NormalizedName, canonicalize_name, parse_wheel_filename
 
-from .wheel import check_abi_platform
+from .utils import file_sha256
+from .wheel import build_compatibility
 
 _RE_REQUIREMENT: Final = re.compile(
     r"(?P<package>.+)(?:==|>|<|<=|>=|~=)(?P<version>.+)",
 )
-_RE_PACKAGE_INDEX: Final = re.compile(r"(.+\.whl)")
+_RE_HREF_WHEEL: Final = re.compile(rb"""href=(["'])([^"'<>]+?\.whl)\1""")
 _MUSLLINUX: Final = "musllinux"
+_SNAPSHOT_MAGIC: Final = b"WHLIDX1\n"
+_SIMPLE_JSON: Final = "application/vnd.pypi.simple.v1+json"
+_PROJECT_WORKERS: Final = 8
 
 
-@dataclass
+@dataclass(slots=True)
 class WhlPackage:
     """Represent a wheel information from index."""
 
@@ -29,6 +41,74 @@ class WhlPackage:
     tags: frozenset[Tag]
 
 
+class PackageIndex(Mapping[NormalizedName, list[WhlPackage]]):
+    """Map package names to the supported wheels of an index.
+
+    Only the wheel filenames are kept per package name. Versions and tags are
+    parsed when a package is looked up, with tag sets shared between wheels.
+    Packages without a supported wheel are not part of the index.
+    """
+
+    def __init__(self, wheels: Iterable[str]) -> None:
+        """Group wheel filenames by package name."""
+        self._compatibility = build_compatibility()
+        self._packages: dict[NormalizedName, list[WhlPackage]] = {}
+        self._tags: dict[str, frozenset[Tag]] = {}
+
+        names: dict[str, NormalizedName] = {}
+        files: dict[NormalizedName, list[str]] = {}
+        for wheel_filename in wheels:
+            raw_name = wheel_filename.partition("-")[0]
+            if (name := names.get(raw_name)) is None:
+                name = names[raw_name] = canonicalize_name(raw_name)
+            files.setdefault(name, []).append(wheel_filename)
+
+        # One string per package saves the overhead of many small objects
+        self._files = {name: "\n".join(wheels) for name, wheels in files.items()}
+
+    def _load(self, name: NormalizedName) -> list[WhlPackage]:
+        """Parse and return the supported wheels of a package."""
+        if (packages := self._packages.get(name)) is not None:
+            return packages
+
+        packages = []
+        if name in self._files:
+            for wheel_filename in self._files[name].split("\n"):
+                _, version, _build_tag, tags = parse_wheel_filename(wheel_filename)
+                tags = self._tags.setdefault(wheel_filename.split("-", 2)[-1], tags)
+                if not self._compatibility.compatible(tags):
+                    continue
+                packages.append(
+                    WhlPackage(name, AwesomeVersion(str(version)), tags),
+                )
+
+        self._packages[name] = packages
+        return packages
+
+    def files(self, name: str) -> list[str]:
+        """Return all wheel filenames of a package, also unsupported ones."""
+        files = self._files.get(canonicalize_name(name))
+        return files.split("\n") if files else []
+
+    def __getitem__(self, name: str) -> list[WhlPackage]:
+        """Return the supported wheels of a package."""
+        if not (packages := self._load(canonicalize_name(name))):
+            raise KeyError(name)
+        return packages
+
+    def __contains__(self, name: object) -> bool:
+        """Return True if the package has supported wheels."""
+        return isinstance(name, str) and bool(self._load(canonicalize_name(name)))
+
+    def __iter__(self) -> Iterator[NormalizedName]:
+        """Iterate over packages with supported wheels."""
+        return (name for name in self._files if self._load(name))
+
+    def __len__(self) -> int:
+        """Return number of packages with supported wheels."""
+        return sum(1 for _ in self)
+
+
 class HTMLParserAHREF(HTMLParser):
     """HTMLParser subclass for collecting anchor link href targets."""
 
@@ -78,25 +158,182 @@ def create_package_map(packages: list[str]) -> dict[NormalizedName, AwesomeVersi
     return results
 
 
-def extract_packages_from_index(index: str) -> dict[NormalizedName, list[WhlPackage]]:
-    """Extract packages from index which match the supported."""
-    available_data = requests.get(index, allow_redirects=True, timeout=60).text
-    html_parser = HTMLParserAHREF()
-    html_parser.feed(available_data)
-
-    result: dict[NormalizedName, list[WhlPackage]] = {}
-    for wheel_filename in filter(_RE_PACKAGE_INDEX.match, html_parser.href):
-        name, version, _build_tag, tags = parse_wheel_filename(wheel_filename)
-        package = WhlPackage(name, AwesomeVersion(str(version)), tags)
-
-        for tag in package.tags:
-            if check_abi_platform(tag.abi, tag.platform):
-                break
+def iter_index_wheels(chunks: Iterable[bytes]) -> Generator[str]:
+    """Yield wheel filenames of anchors from chunks of an index listing.
+
+    Only the rest of a tag that is cut at the end of a chunk is kept until the
+    next one, so memory use doesn't depend on the size of the listing.
+    """
+    rest = b""
+    for chunk in chunks:
+        data = rest + chunk
+        end = 0
+        for match in _RE_HREF_WHEEL.finditer(data):
+            end = match.end()
+            wheel = match[2].decode()
+            if "%" in wheel:
+                wheel = unquote(wheel)
+            if "&" in wheel:
+                wheel = unescape(wheel)
+            yield wheel.rpartition("/")[2]
+
+        tag = data.rfind(b"<", end)
+        rest = data[tag:] if tag != -1 else b""
+
+
+def read_index_snapshot(snapshot: Path) -> tuple[dict[str, Any], list[str]] | None:
+    """Read HTTP cache metadata and wheel filenames from an index snapshot."""
+    try:
+        with snapshot.open("rb") as data:
+            if data.readline() != _SNAPSHOT_MAGIC:
+                return None
+            metadata = json.loads(data.readline())
+            wheels = zlib.decompress(data.read()).decode()
+    except (OSError, ValueError, zlib.error):
+        return None
+    return metadata, wheels.split("\n") if wheels else []
+
+
+def write_index_snapshot(
+    snapshot: Path,
+    metadata: dict[str, Any],
+    wheels: list[str],
+) -> None:
+    """Write HTTP cache metadata and wheel filenames to an index snapshot."""
+    snapshot.parent.mkdir(parents=True, exist_ok=True)
+    temp_snapshot = snapshot.with_suffix(f".{os.getpid()}.tmp")
+    with temp_snapshot.open("wb") as data:
+        data.write(_SNAPSHOT_MAGIC)
+        data.write(json.dumps(metadata).encode() + b"\n")
+        data.write(zlib.compress("\n".join(wheels).encode()))
+    temp_snapshot.replace(snapshot)
+
+
+def fetch_index_wheels(
+    index: str,
+    snapshot: Path | None = None,
+    ttl: float = 0,
+) -> list[str]:
+    """Return all wheel filenames of the index.
+
+    With a snapshot, the listing is only downloaded again if the snapshot is
+    older than ttl seconds and the server reports a change. If the server
+    fails, the snapshot is used.
+    """
+    cached = read_index_snapshot(snapshot) if snapshot else None
+    headers: dict[str, str] = {}
+    if cached:
+        metadata, wheels = cached
+        if time.time() - metadata["checked"] < ttl:
+            return wheels
+        if etag := metadata.get("etag"):
+            headers["If-None-Match"] = etag
+        if last_modified := metadata.get("last_modified"):
+            headers["If-Modified-Since"] = last_modified
+
+    response = requests.get(
+        index,
+        headers=headers,
+        allow_redirects=True,
+        stream=True,
+        timeout=60,
+    )
+    # A streamed response keeps its connection until it is closed
+    with response:
+        if cached and response.status_code == requests.codes.not_modified:
+            print(f"Index {index} not modified, use snapshot", flush=True)
+            metadata, wheels = cached
+        elif cached and response.status_code != requests.codes.ok:
+            print(
+                f"Index {index} failed with {response.status_code}, use snapshot",
+                flush=True,
+            )
+            return cached[1]
         else:
-            continue
-        result.setdefault(package.name, []).append(package)
+            wheels = list(iter_index_wheels(response.iter_content(chunk_size=65536)))
+            metadata = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            }
+
+    if snapshot and response.status_code in (
+        requests.codes.ok,
+        requests.codes.not_modified,
+    ):
+        metadata["checked"] = time.time()
+        write_index_snapshot(snapshot, metadata, wheels)
+    return wheels
+
+
+def fetch_project_files(index: str, name: NormalizedName) -> dict[str, str | None]:
+    """Return wheel filenames of a project page with their sha256 if known.
+
+    The page is looked up in a PEP 503/691 simple index.
+    """
+    response = requests.get(
+        f"{index}{name}/",
+        headers={"Accept": f"{_SIMPLE_JSON}, text/html;q=0.1"},
+        allow_redirects=True,
+        timeout=60,
+    )
+    if response.status_code == requests.codes.not_found:
+        return {}
+    response.raise_for_status()
+
+    if response.headers.get("Content-Type", "").startswith(_SIMPLE_JSON):
+        files = {
+            file["filename"]: file.get("hashes", {}).get("sha256")
+            for file in response.json()["files"]
+        }
+    else:
+        html_parser = HTMLParserAHREF()
+        html_parser.feed(response.text)
+        files = {}
+        for href in html_parser.href:
+            if not href:
+                continue
+            url, _, fragment = href.partition("#")
+            algorithm, _, digest = fragment.partition("=")
+            files[unquote(url.rpartition("/")[2])] = (
+                digest if algorithm == "sha256" else None
+            )
+    return {file: digest for file, digest in files.items() if file.endswith(".whl")}
 
-    return result
+
+def fetch_project_wheels(index: str, name: NormalizedName) -> list[str]:
+    """Return wheel filenames of a project page from a PEP 503/691 simple index."""
+    return list(fetch_project_files(index, name))
+
+
+def fetch_projects_files(
+    index: str,
+    packages: Iterable[str],
+) -> dict[str, str | None]:
+    """Return wheel filenames with their sha256 of the pages of these projects."""
+    names = sorted(set(map(canonicalize_name, packages)))
+    with ThreadPoolExecutor(max_workers=_PROJECT_WORKERS) as executor:
+        projects = executor.map(lambda name: fetch_project_files(index, name), names)
+        return {file: digest for files in projects for file, digest in files.items()}
+
+
+def extract_packages_from_index(
+    index: str,
+    snapshot: Path | None = None,
+    ttl: float = 0,
+) -> PackageIndex:
+    """Extract packages from index which match the supported."""
+    return PackageIndex(fetch_index_wheels(index, snapshot, ttl))
+
+
+def extract_packages_from_projects(
+    index: str,
+    packages: Iterable[str],
+) -> PackageIndex:
+    """Extract packages from the simple index pages of only these projects."""
+    names = sorted(set(map(canonicalize_name, packages)))
+    with ThreadPoolExecutor(max_workers=_PROJECT_WORKERS) as executor:
+        projects = executor.map(lambda name: fetch_project_wheels(index, name), names)
+        return PackageIndex(wheel for project in projects for wheel in project)
 
 
 def extract_package_names_from_wheels(
@@ -111,7 +348,7 @@ def extract_package_names_from_wheels(
 
 
 def check_existing_packages(
-    package_index: dict[NormalizedName, list[WhlPackage]],
+    package_index: Mapping[NormalizedName, list[WhlPackage]],
     package_map: dict[NormalizedName, AwesomeVersion],
 ) -> set[NormalizedName]:
     """Return the set of package names that already exist in the index."""
@@ -125,7 +362,7 @@ def check_existing_packages(
 
 
 def check_available_binary(
-    package_index: dict[NormalizedName, list[WhlPackage]],
+    package_index: Mapping[NormalizedName, list[WhlPackage]],
     skip_binary: str,
     packages: list[str],
     constraints: list[str],
@@ -164,13 +401,12 @@ def check_available_binary(
     return ",".join(list_needed)
 
 
-def remove_local_wheels(
-    package_index: dict[NormalizedName, list[WhlPackage]],
+def existing_skip_binary(
+    package_index: Mapping[NormalizedName, list[WhlPackage]],
     skip_exists: str,
     packages: list[str],
-    wheels_dir: Path,
-) -> None:
-    """Remove existing wheels if they already exist in the index to avoid syncing."""
+) -> dict[NormalizedName, AwesomeVersion]:
+    """Return skip binary packages with the version that exists in the index."""
     package_map = create_package_map(packages)
     list_exists = list(map(canonicalize_name, skip_exists.split(";")))
     binary_package_map = {
@@ -178,10 +414,43 @@ def remove_local_wheels(
     }
     print(f"Checking if binaries already exist for packages {binary_package_map}")
     exists = check_existing_packages(package_index, binary_package_map)
+    return {binary: binary_package_map[binary] for binary in exists}
+
+
+def remove_local_wheels(
+    package_index: Mapping[NormalizedName, list[WhlPackage]],
+    skip_exists: str,
+    packages: list[str],
+    wheels_dir: Path,
+) -> None:
+    """Remove existing wheels if they already exist in the index to avoid syncing."""
+    exists = existing_skip_binary(package_index, skip_exists, packages)
     wheel_map = extract_package_names_from_wheels(wheels_dir)
-    for binary in exists:
-        version = binary_package_map[binary]
+    for binary, version in exists.items():
         print(f"Found existing wheels for {binary}, removing local copy {version}")
         for wheel in wheel_map.get(binary, ()):
             print(f"Removing local wheel {wheel}")
             wheel.unlink()
+
+
+def remove_uploaded_wheels(
+    wheels_dir: Path,
+    remote: Mapping[str, str | None],
+    *,
+    check_hash: bool = False,
+) -> int:
+    """Remove wheels whose file is on the index already and return bytes saved.
+
+    With check_hash a wheel is only removed if the sha256 of the index matches,
+    a wheel without a known hash is kept.
+    """
+    saved = 0
+    for wheel in sorted(wheels_dir.glob("*.whl")):
+        if wheel.name not in remote:
+            continue
+        if check_hash and remote[wheel.name] != file_sha256(wheel):
+            continue
+        print(f"Skip upload of {wheel.name}, it exists on the index", flush=True)
+        saved += wheel.stat().st_size
+        wheel.unlink()
+    return saved
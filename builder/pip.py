@@ -1,61 +1,355 @@
 """Pip build commands."""
 
+import json
 import os
+import zipfile
+from collections.abc import Collection, Generator, Mapping
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import nullcontext, suppress
 from pathlib import Path
+from subprocess import CalledProcessError, TimeoutExpired
+from tempfile import TemporaryDirectory
+from typing import IO, Any
+
+from packaging.utils import NormalizedName, canonicalize_name, parse_wheel_filename
+from packaging.version import Version
+
+from .cache import WheelCache, pinned_version
+from .infra import extract_package_names_from_wheels
+from .trace import span
+from .utils import (
+    CommandUsage,
+    captured_output,
+    file_sha256,
+    run_command,
+    stage_file,
+)
+from .wheel import is_linux_wheel
+
+
+def build_cpu_count(jobs: int = 1) -> int:
+    """Return the CPUs a single build can use while jobs builds run in parallel."""
+    cpu = os.cpu_count() or 4
+    return max(1, cpu // jobs)
+
+
+def _without_binaries(skip_binary: str, names: Collection[NormalizedName]) -> str:
+    """Return the skip binary list without these packages."""
+    if skip_binary.startswith(":"):
+        return skip_binary
+    binaries = [
+        binary
+        for binary in skip_binary.split(",")
+        if canonicalize_name(binary) not in names
+    ]
+    return ",".join(binaries) or ":none:"
 
-from .utils import run_command
 
+def _stage_dependency_wheels(
+    pins: Mapping[NormalizedName, str],
+    output: Path,
+    folder: Path,
+) -> list[Path]:
+    """Link a wheel of every pinned package built before from output into folder."""
+    wheel_map = extract_package_names_from_wheels(output)
+    wheels: list[Path] = []
+    for name, version in sorted(pins.items()):
+        # The pipeline replaces a build wheel with its repair at any time
+        for wheel_file in sorted(wheel_map.get(name, ()), key=is_linux_wheel):
+            if parse_wheel_filename(wheel_file.name)[1] != Version(version):
+                continue
+            with suppress(OSError):
+                wheels.append(stage_file(wheel_file, folder))
+                break
+    return wheels
 
-def build_wheels_package(
+
+def build_wheels_package(  # noqa: PLR0913
     package: str,
     index: str,
     output: Path,
     skip_binary: str,
     timeout: int,
     constraint: Path | None = None,
+    jobs: int = 1,
+    log: IO[str] | None = None,
+    find_links: Path | None = None,
+    cache: WheelCache | None = None,
+    *,
+    no_deps: bool = False,
+    wheels: Collection[Path] = (),
+) -> CommandUsage | None:
+    """Build wheels from a requirements file into output.
+
+    Return the resource usage of pip, None if the wheels are from the cache.
+    With no_deps only the wheel of the package itself is built. The given
+    wheels of dependencies are installed as they are, also if they are on the
+    skip binary list, so pip doesn't build them from source again.
+    """
+    with span(f"build {package}", "build"):
+        cpu = build_cpu_count(jobs)
+
+        # Modify speed
+        build_env = os.environ.copy()
+        build_env["MAKEFLAGS"] = f"-j{cpu}"
+
+        # Add constraint
+        constraint_cmd = f"--constraint {constraint}" if constraint else ""
+
+        # Use wheels we built before
+        find_links_cmd = f"--find-links {find_links}" if find_links else ""
+        no_deps_cmd = "--no-deps " if no_deps else ""
+        no_binary = _without_binaries(
+            skip_binary,
+            {parse_wheel_filename(wheel_file.name)[0] for wheel_file in wheels},
+        )
+        wheels_cmd = "".join(f' "{wheel_file}"' for wheel_file in wheels)
+
+        def _build(wheel_dir: Path) -> CommandUsage:
+            return run_command(
+                f'pip3 wheel --no-clean --no-binary "{no_binary}" '
+                f"--wheel-dir {wheel_dir} --extra-index-url {index} {constraint_cmd} "
+                f'{no_deps_cmd}{find_links_cmd} "{package}"{wheels_cmd}',
+                env=build_env,
+                timeout=timeout,
+                output=log,
+            )
+
+        key = (
+            cache.key(
+                package,
+                skip_binary,
+                index=index,
+                constraint=file_sha256(constraint) if constraint else None,
+                no_deps=no_deps,
+            )
+            if cache
+            else None
+        )
+        if cache is None or key is None:
+            return _build(output)
+
+        if cache.restore(key, output):
+            print(f"Use cached wheels for {package}", flush=True)
+            return None
+
+        with TemporaryDirectory() as temp_dir:
+            try:
+                usage = _build(Path(temp_dir))
+            except (CalledProcessError, TimeoutExpired):
+                # Wheels of dependencies built before the failure are kept
+                _remove_incomplete_wheels(Path(temp_dir))
+                for wheel_file in Path(temp_dir).glob("*.whl"):
+                    stage_file(wheel_file, output, move=True)
+                raise
+            wheels = list(Path(temp_dir).glob("*.whl"))
+            cache.store(key, wheels)
+            for wheel_file in wheels:
+                stage_file(wheel_file, output, move=True)
+        return usage
+
+
+def build_wheels_packages(  # noqa: PLR0913
+    packages: list[str],
+    index: str,
+    output: Path,
+    skip_binary: str,
+    timeout: int,
+    constraint: Path | None = None,
+    jobs: int = 1,
+    dependencies: Mapping[str, set[str]] | None = None,
+    cache: WheelCache | None = None,
+    *,
+    no_deps: bool = False,
+) -> Generator[tuple[str, Future[CommandUsage | None]]]:
+    """Build every package as single requirement with jobs builds in parallel.
+
+    Yield each package with its finished build in order of completion. With more
+    than one job the pip output of a build is printed as one block once it is done.
+
+    If dependencies are given, a package is only started once the packages it
+    depends on are finished, and the build uses their wheels from output.
+    """
+    find_links = output if dependencies is not None else None
+    waiting = {
+        package: set(dependencies.get(package, ())).intersection(packages)
+        if dependencies
+        else set()
+        for package in packages
+    }
+
+    def _build(package: str) -> CommandUsage | None:
+        print(f"Process package: {package}", flush=True)
+        pins = dict(
+            pinned
+            for dependency in (dependencies or {}).get(package, ())
+            if (pinned := pinned_version(dependency))
+        )
+        with (
+            captured_output(package) if jobs > 1 else nullcontext() as log,
+            TemporaryDirectory() as links_dir,
+        ):
+            return build_wheels_package(
+                package,
+                index,
+                output,
+                skip_binary,
+                timeout,
+                constraint,
+                jobs,
+                log,
+                find_links,
+                cache,
+                no_deps=no_deps,
+                wheels=_stage_dependency_wheels(pins, output, Path(links_dir)),
+            )
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        builds: dict[Future[CommandUsage | None], str] = {}
+        while waiting or builds:
+            ready = [package for package, wait_for in waiting.items() if not wait_for]
+            if not ready and not builds:
+                # Dependency cycle, start the next package regardless
+                ready = list(waiting)[:1]
+            for package in ready[: jobs - len(builds)]:
+                del waiting[package]
+                builds[executor.submit(_build, package)] = package
+
+            done, _ = wait(builds, return_when=FIRST_COMPLETED)
+            for build in done:
+                package = builds.pop(build)
+                for wait_for in waiting.values():
+                    wait_for.discard(package)
+                yield package, build
+
+
+def _remove_incomplete_wheels(wheel_dir: Path) -> None:
+    """Remove a wheel pip was still writing when it was stopped."""
+    for wheel_file in wheel_dir.glob("*.whl"):
+        if not zipfile.is_zipfile(wheel_file):
+            wheel_file.unlink()
+
+
+def _store_packages(
+    cache: WheelCache,
+    packages: Mapping[str, str | None],
+    wheel_dir: Path,
 ) -> None:
-    """Build wheels from a requirements file into output."""
-    cpu = os.cpu_count() or 4
-
-    # Modify speed
-    build_env = os.environ.copy()
-    build_env["MAKEFLAGS"] = f"-j{cpu}"
-
-    # Add constraint
-    constraint_cmd = f"--constraint {constraint}" if constraint else ""
+    """Store the wheel of every package by its cache key."""
+    wheel_map = extract_package_names_from_wheels(wheel_dir)
+    for package, key in packages.items():
+        if key is None or (pinned := pinned_version(package)) is None:
+            continue
+        name, _ = pinned
+        if wheels := wheel_map.get(name):
+            cache.store(key, wheels)
 
-    run_command(
-        f'pip3 wheel --no-clean --no-binary "{skip_binary}" --wheel-dir {output} '
-        f'--extra-index-url {index} {constraint_cmd} "{package}"',
-        env=build_env,
-        timeout=timeout,
-    )
 
-
-def build_wheels_requirement(
+def build_wheels_requirement(  # noqa: PLR0913
     requirement: Path,
     index: str,
     output: Path,
     skip_binary: str,
     timeout: int,
     constraint: Path | None = None,
-) -> None:
-    """Build wheels from a requirements file into output."""
+    cache: WheelCache | None = None,
+    *,
+    no_deps: bool = False,
+) -> CommandUsage | None:
+    """Build wheels from a requirements file into output.
+
+    Return the resource usage of pip, None if all wheels are from the cache.
+    With no_deps only the wheels of the listed packages are built. Otherwise a
+    cached package is handed to pip as wheel file, so pip still adds the
+    wheels of its dependencies.
+    """
     cpu = os.cpu_count() or 4
 
     # Modify speed
     build_env = os.environ.copy()
     build_env["MAKEFLAGS"] = f"-j{cpu}"
 
+    # Add constraint
+    constraint_cmd = f"--constraint {constraint}" if constraint else ""
+    no_deps_cmd = "--no-deps " if no_deps else ""
+
+    def _build(requirement: Path, wheel_dir: Path) -> CommandUsage:
+        return run_command(
+            f'pip3 wheel --no-clean --no-binary "{skip_binary}" '
+            f"--wheel-dir {wheel_dir} --extra-index-url {index} {constraint_cmd} "
+            f"{no_deps_cmd}--requirement {requirement}",
+            env=build_env,
+            timeout=timeout,
+        )
+
+    if cache is None:
+        return _build(requirement, output)
+
+    # Only build packages they are not cached
+    constraint_digest = file_sha256(constraint) if constraint else None
+    with TemporaryDirectory() as temp_dir:
+        cached_dir = Path(temp_dir, "cached")
+        cached_dir.mkdir()
+        missing: dict[str, str | None] = {}
+        for package in parse_requirements(requirement):
+            key = cache.key(
+                package,
+                skip_binary,
+                index=index,
+                constraint=constraint_digest,
+                no_deps=no_deps,
+                requirement=True,
+            )
+            if key is not None and cache.restore(key, cached_dir):
+                print(f"Use cached wheels for {package}", flush=True)
+                continue
+            missing[package] = key
+
+        cached = sorted(cached_dir.glob("*.whl"))
+        for wheel_file in cached:
+            stage_file(wheel_file, output)
+        if no_deps:
+            cached = []
+        if not missing and not cached:
+            return None
+
+        temp_requirement = Path(temp_dir, "requirement.txt")
+        write_requirement(temp_requirement, [*missing, *map(str, cached)])
+        wheel_dir = Path(temp_dir, "wheels")
+        wheel_dir.mkdir()
+
+        try:
+            usage = _build(temp_requirement, wheel_dir)
+        except (CalledProcessError, TimeoutExpired):
+            # Wheels built before a failure or timeout are kept and cached
+            _remove_incomplete_wheels(wheel_dir)
+            raise
+        finally:
+            _store_packages(cache, missing, wheel_dir)
+            for wheel_file in wheel_dir.glob("*.whl"):
+                stage_file(wheel_file, output, move=True)
+    return usage
+
+
+def resolve_requirement(
+    requirement: Path,
+    index: str,
+    timeout: int,
+    constraint: Path | None = None,
+) -> dict[str, Any]:
+    """Resolve a requirements file with pip and return the installation report."""
     # Add constraint
     constraint_cmd = f"--constraint {constraint}" if constraint else ""
 
-    run_command(
-        f'pip3 wheel --no-clean --no-binary "{skip_binary}" --wheel-dir {output} '
-        f"--extra-index-url {index} {constraint_cmd} --requirement {requirement}",
-        env=build_env,
-        timeout=timeout,
-    )
+    with TemporaryDirectory() as temp_dir:
+        report = Path(temp_dir, "report.json")
+        run_command(
+            "pip3 install --dry-run --ignore-installed --quiet "
+            f"--report {report} --extra-index-url {index} {constraint_cmd} "
+            f"--requirement {requirement}",
+            timeout=timeout,
+        )
+        return json.loads(report.read_text(encoding="utf-8"))
 
 
 def build_wheels_local(
@@ -0,0 +1,162 @@
+"""Audit and upload wheels while the build goes on."""
+
+import shutil
+import zipfile
+from collections.abc import Callable, Collection
+from pathlib import Path
+from subprocess import CalledProcessError
+from tempfile import TemporaryDirectory, mkdtemp
+from threading import Event, Thread
+
+from packaging.utils import InvalidWheelFilename, NormalizedName, parse_wheel_filename
+
+from .audit import AuditWorkers
+from .cache import WheelCache
+from .utils import stage_file
+from .wheel import build_compatibility, is_linux_wheel, repair_wheel
+
+
+class WheelPipeline:
+    """Repair, validate and upload wheels as soon as they are built.
+
+    A watcher thread picks up complete wheels from the wheels folder. Every
+    wheel is repaired and checked against the build system, then it waits in
+    a batch that is uploaded once batch_size wheels are ready. Wheels stay in
+    the wheels folder for builds that find their dependencies there, uploaded
+    ones are removed once the pipeline stops. Wheels the pipeline can't
+    handle are left to the final pass. A batch is pruned before its upload,
+    the wheels prune removes from the batch count as uploaded.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        wheels_dir: Path,
+        upload: Callable[[Path], None] | None,
+        exclude: Collection[NormalizedName] = frozenset(),
+        batch_size: int = 20,
+        interval: float = 5.0,
+        wheel_cache: WheelCache | None = None,
+        workers: AuditWorkers | None = None,
+        prune: Callable[[Path], None] | None = None,
+    ) -> None:
+        """Initialize the pipeline."""
+        self.wheels_dir = wheels_dir
+        self.success = True
+        self._upload = upload
+        self._exclude = exclude
+        self._batch_size = batch_size
+        self._interval = interval
+        self._wheel_cache = wheel_cache
+        self._workers = workers
+        self._prune = prune
+        self._seen: set[str] = set()
+        self._uploaded: set[str] = set()
+        self._stop = Event()
+        self._thread = Thread(target=self._watch, name="pipeline", daemon=True)
+
+        # Batch folder has the layout of the upload folder
+        self._batch_root = Path(mkdtemp())
+        self._batch = Path(self._batch_root, wheels_dir.name)
+        self._batch.mkdir()
+
+    @property
+    def uploaded_packages(self) -> set[NormalizedName]:
+        """Return the packages with uploaded wheels."""
+        return {parse_wheel_filename(name)[0] for name in self._uploaded}
+
+    def start(self) -> None:
+        """Start watching the wheels folder."""
+        self._thread.start()
+
+    def stop(self) -> bool:
+        """Handle the last wheels, upload the residual batch and return success."""
+        self._stop.set()
+        if self._thread.ident is not None:
+            self._thread.join()
+        self.process()
+        self.flush()
+        shutil.rmtree(self._batch_root, ignore_errors=True)
+        for name in self._uploaded:
+            Path(self.wheels_dir, name).unlink(missing_ok=True)
+        return self.success
+
+    def _watch(self) -> None:
+        """Process new wheels until stopped."""
+        while not self._stop.wait(self._interval):
+            self.process()
+            if len(list(self._batch.glob("*.whl"))) >= self._batch_size:
+                self.flush()
+
+    def process(self) -> None:
+        """Repair and validate all new complete wheels of the wheels folder."""
+        for wheel_file in sorted(self.wheels_dir.glob("*.whl")):
+            if wheel_file.name in self._seen or not zipfile.is_zipfile(wheel_file):
+                continue
+            self._seen.add(wheel_file.name)
+            try:
+                self._process_wheel(wheel_file)
+            except Exception as err:  # noqa: BLE001 # pylint: disable=broad-exception-caught
+                # The watcher keeps going, the final pass handles the wheel
+                print(f"Pipeline failed on {wheel_file.name}: {err!r}", flush=True)
+                self.success = False
+
+    def _process_wheel(self, wheel_file: Path) -> None:
+        """Repair and validate a wheel and add it to the batch."""
+        try:
+            name, _, _, tags = parse_wheel_filename(wheel_file.name)
+        except InvalidWheelFilename:
+            return
+        if name in self._exclude:
+            return
+
+        if not is_linux_wheel(wheel_file):
+            if build_compatibility().compatible(tags):
+                stage_file(wheel_file, self._batch)
+            return
+
+        with TemporaryDirectory() as repair_dir:
+            try:
+                repair_wheel(
+                    wheel_file,
+                    Path(repair_dir),
+                    self._wheel_cache,
+                    workers=self._workers,
+                )
+            except CalledProcessError as err:
+                print(f"Issues auditwheel {wheel_file.name}: {err!s}", flush=True)
+                self.success = False
+                wheel_file.unlink()
+                return
+            wheel_file.unlink()
+
+            for repaired in Path(repair_dir).glob("*.whl"):
+                self._seen.add(repaired.name)
+                _, _, _, repaired_tags = parse_wheel_filename(repaired.name)
+                if build_compatibility().compatible(repaired_tags):
+                    stage_file(repaired, self._batch)
+                # Final pass reports an incompatible wheel and builds it again
+                stage_file(repaired, self.wheels_dir, move=True)
+
+    def flush(self) -> None:
+        """Upload the batch, on failure the final pass uploads the wheels."""
+        wheels = list(self._batch.glob("*.whl"))
+        if not wheels:
+            return
+        if self._prune is not None:
+            try:
+                self._prune(self._batch)
+            except OSError as err:
+                print(f"Batch prune failed: {err!s}", flush=True)
+            pruned = [wheel_file for wheel_file in wheels if not wheel_file.exists()]
+            self._uploaded.update(wheel_file.name for wheel_file in pruned)
+            wheels = [wheel_file for wheel_file in wheels if wheel_file.exists()]
+        if self._upload is not None and wheels:
+            print(f"Upload batch of {len(wheels)} wheels", flush=True)
+            try:
+                self._upload(self._batch_root)
+            except (CalledProcessError, OSError) as err:
+                print(f"Batch upload failed: {err!s}", flush=True)
+            else:
+                self._uploaded.update(wheel_file.name for wheel_file in wheels)
+        for wheel_file in wheels:
+            wheel_file.unlink()
@@ -0,0 +1,103 @@
+"""Record timing spans of the builder phases.
+
+Spans are exported as Chrome trace JSON, which Perfetto and chrome://tracing
+open, and as a summary table. Recording is off until enable() is called.
+"""
+
+import json
+import os
+import threading
+import time
+from collections.abc import Generator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any
+
+_LOCK = threading.Lock()
+_LOCAL = threading.local()
+_START = time.perf_counter()
+
+_events: list[dict[str, Any]] | None = None  # pylint: disable=invalid-name
+
+
+def enable() -> None:
+    """Start recording spans."""
+    global _events  # noqa: PLW0603 # pylint: disable=global-statement
+    _events = []
+
+
+def _stack() -> list[str]:
+    """Return the open spans of this thread."""
+    if not hasattr(_LOCAL, "stack"):
+        _LOCAL.stack = []
+    return _LOCAL.stack
+
+
+@contextmanager
+def span(name: str, category: str = "phase", **args: str) -> Generator[None]:
+    """Record the runtime of a block as span."""
+    events = _events
+    if events is None:
+        yield
+        return
+
+    stack = _stack()
+    if stack:
+        args["parent"] = stack[-1]
+    stack.append(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        stack.pop()
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": round((start - _START) * 1e6),
+            "dur": round((end - start) * 1e6),
+            "pid": os.getpid(),
+            "tid": threading.get_native_id(),
+            "args": args,
+        }
+        with _LOCK:
+            events.append(event)
+
+
+def write_trace(trace_file: Path) -> None:
+    """Write recorded spans as Chrome trace JSON."""
+    with _LOCK:
+        events = list(_events or [])
+    trace_file.write_text(
+        json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}),
+        encoding="utf-8",
+    )
+
+
+def summary(slowest: int = 10) -> str:
+    """Return a table of phases, totals of other categories and slowest spans."""
+    with _LOCK:
+        events = list(_events or [])
+
+    # Phases by name, packages, repairs and commands by category
+    rows: dict[str, list[float]] = {}
+    for event in sorted(events, key=lambda event: event["ts"]):
+        key = event["name"] if event["cat"] == "phase" else f"[{event['cat']}]"
+        rows.setdefault(key, []).append(event["dur"] / 1e6)
+
+    lines = [f"{'Span':<40} {'Count':>6} {'Total s':>10} {'Max s':>10}"]
+    lines.extend(
+        f"{key:<40} {len(times):>6} {sum(times):>10.2f} {max(times):>10.2f}"
+        for key, times in rows.items()
+    )
+
+    lines.append(f"Slowest {slowest} builds and repairs:")
+    work = [event for event in events if event["cat"] in ("build", "repair")]
+    lines.extend(
+        f"{event['name']:<58} {event['dur'] / 1e6:>10.2f}"
+        for event in sorted(work, key=lambda event: event["dur"], reverse=True)[
+            :slowest
+        ]
+    )
+    return "\n".join(lines)
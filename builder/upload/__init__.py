@@ -1,12 +1,119 @@
 """Supported upload function."""
 
+import sys
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from importlib import import_module
 from pathlib import Path
+from subprocess import CalledProcessError
+from typing import IO
 
+from builder.utils import balanced_partitions, followed_output, stage_file
 
-def run_upload(plugin_name: str, local: Path, remote: str) -> None:
+
+def run_upload(plugin_name: str, local: Path, remote: str, streams: int = 1) -> None:
     """Load a plugin and start upload."""
     plugin = import_module(f".{plugin_name}", "builder.upload")
 
     # Run upload
-    plugin.upload(local, remote)
+    plugin.upload(local, remote, streams)
+
+
+def list_files(local: Path) -> list[str]:
+    """Return all files of a folder by relative path."""
+    return sorted(
+        file.relative_to(local).as_posix()
+        for file in local.rglob("*")
+        if file.is_file()
+    )
+
+
+def copy_files(
+    local: Path,
+    remote: Path,
+    files: list[str],
+    output: IO[str] | None = None,
+) -> None:
+    """Copy files into a local folder, each one replaced atomically."""
+    for number, name in enumerate(files, 1):
+        print(f"[{number}/{len(files)}] {name}", file=output or sys.stdout, flush=True)
+        target = Path(remote, name)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        temp_file = stage_file(
+            Path(local, name),
+            target.with_name(f".{target.name}.tmp"),
+        )
+        temp_file.replace(target)
+
+
+def _file_progress(number: int, files: list[str]) -> Callable[[str], str | None]:
+    """Return a follow function that reports the files a stream started."""
+    names = set(files)
+    started = 0
+
+    def _follow(line: str) -> str | None:
+        # rsync prints the name of a file, copy_files the name with a counter
+        nonlocal started
+        if (name := line.strip().rpartition(" ")[2]) not in names:
+            return None
+        started += 1
+        return f"Upload stream {number}: [{started}/{len(files)}] {name}"
+
+    return _follow
+
+
+def upload_streams(
+    local: Path,
+    files: list[str],
+    streams: int,
+    transfer: Callable[[list[str], IO[str] | None], None],
+) -> None:
+    """Transfer files in partitions balanced by size over concurrent streams.
+
+    Every stream prints a line for each file the tool starts at once and the
+    output of the tool as one block once done. Failed streams are summarized
+    after all streams are done and the first error is raised.
+    """
+    sizes = {name: Path(local, name).stat().st_size for name in files}
+    partitions = balanced_partitions(sizes, streams)
+    if len(partitions) <= 1:
+        transfer(files, None)
+        return
+
+    def _stream(number: int, partition: list[str]) -> None:
+        with followed_output(
+            f"upload stream {number}",
+            _file_progress(number, partition),
+        ) as log:
+            transfer(partition, log)
+
+    failed: dict[int, Exception] = {}
+    with ThreadPoolExecutor(max_workers=len(partitions)) as executor:
+        uploads = {
+            executor.submit(_stream, number, partition): number
+            for number, partition in enumerate(partitions, 1)
+        }
+        for upload in as_completed(uploads):
+            number = uploads[upload]
+            partition = partitions[number - 1]
+            size = sum(sizes[name] for name in partition) / 1024 / 1024
+            try:
+                upload.result()
+            except (CalledProcessError, OSError) as err:
+                failed[number] = err
+                print(f"Upload stream {number} failed: {err!s}", flush=True)
+            else:
+                print(
+                    f"Upload stream {number}/{len(partitions)} done: "
+                    f"{len(partition)} files, {size:.1f} MiB",
+                    flush=True,
+                )
+
+    if not failed:
+        return
+    print(f"Upload failed on {len(failed)} of {len(partitions)} streams:", flush=True)
+    for number, error in sorted(failed.items()):
+        print(f"  stream {number}: {error!s}", flush=True)
+        for name in partitions[number - 1]:
+            print(f"    {name}", flush=True)
+    raise failed[min(failed)]
@@ -0,0 +1,103 @@
+"""Upload plugin local.
+
+Publish wheels into a local repository folder and update its PEP 503 simple
+index. Only the pages of projects with new wheels are written, so the cost
+follows the uploaded wheels and not the size of the repository.
+"""
+
+import html
+from pathlib import Path
+from urllib.parse import quote, unquote
+
+from packaging.utils import NormalizedName, parse_wheel_filename
+
+from builder.infra import HTMLParserAHREF
+from builder.upload import copy_files, list_files, upload_streams
+from builder.utils import file_sha256
+
+INDEX = "musllinux-index"
+
+
+def _read_hrefs(page: Path) -> list[str]:
+    """Return link targets of a simple index page."""
+    if not page.exists():
+        return []
+    html_parser = HTMLParserAHREF()
+    html_parser.feed(page.read_text(encoding="utf-8"))
+    return [href for href in html_parser.href if href]
+
+
+def _write_page(page: Path, title: str, links: dict[str, str]) -> None:
+    """Replace a simple index page atomically with sorted links."""
+    lines = [
+        "<!DOCTYPE html>",
+        "<html>",
+        "<head>",
+        '<meta name="pypi:repository-version" content="1.0">',
+        f"<title>{html.escape(title)}</title>",
+        "</head>",
+        "<body>",
+        *[
+            f'<a href="{html.escape(href)}">{html.escape(text)}</a><br>'
+            for text, href in sorted(links.items())
+        ],
+        "</body>",
+        "</html>",
+        "",
+    ]
+    page.parent.mkdir(parents=True, exist_ok=True)
+    temp_file = page.with_name(f".{page.name}.tmp")
+    temp_file.write_text("\n".join(lines), encoding="utf-8")
+    temp_file.chmod(0o644)
+    temp_file.replace(page)
+
+
+def update_project_page(
+    index: Path,
+    name: NormalizedName,
+    wheels: dict[str, str],
+) -> None:
+    """Add wheels by relative path with their sha256 to the page of a project."""
+    page = Path(index, name, "index.html")
+    links = {
+        unquote(href.partition("#")[0].rpartition("/")[2]): href
+        for href in _read_hrefs(page)
+    }
+    for wheel, digest in wheels.items():
+        links[wheel.rpartition("/")[2]] = f"../../{quote(wheel)}#sha256={digest}"
+    _write_page(page, f"Links for {name}", links)
+
+
+def update_root_page(index: Path, names: set[NormalizedName]) -> None:
+    """Add projects to the root page of the index."""
+    page = Path(index, "index.html")
+    projects = {href.strip("/"): href for href in _read_hrefs(page)}
+    if names <= projects.keys():
+        return
+    projects.update({name: f"{name}/" for name in names})
+    _write_page(page, "Simple index", projects)
+
+
+def upload(local: Path, remote: str, streams: int = 1) -> None:
+    """Publish wheels from folder to a local repository folder."""
+    files = list_files(local)
+    upload_streams(
+        local,
+        files,
+        streams,
+        lambda files, output: copy_files(local, Path(remote), files, output),
+    )
+
+    # Wheels are published before the index links them
+    projects: dict[NormalizedName, dict[str, str]] = {}
+    for file in files:
+        if not file.endswith(".whl"):
+            continue
+        name = parse_wheel_filename(file.rpartition("/")[2])[0]
+        projects.setdefault(name, {})[file] = file_sha256(Path(local, file))
+
+    index = Path(remote, INDEX)
+    for name, wheels in sorted(projects.items()):
+        update_project_page(index, name, wheels)
+    update_root_page(index, set(projects))
+    print(f"Updated {len(projects)} project pages of the index", flush=True)
@@ -0,0 +1,102 @@
+"""Upload plugin with sha256 manifest.
+
+A manifest of all uploaded files and their sha256 is kept on the remote. Only
+files missing from it or with another hash are transferred, so no end reads
+files that are already uploaded. The remote is a rsync target or a local
+folder.
+"""
+
+import json
+import re
+from pathlib import Path
+from subprocess import CalledProcessError
+from tempfile import NamedTemporaryFile, TemporaryDirectory
+from typing import Final
+
+from builder.upload import copy_files, list_files, upload_streams
+from builder.upload.rsync import rsync_files
+from builder.utils import file_sha256, run_command
+
+MANIFEST: Final = ".manifest.json"
+
+_RE_REMOTE_HOST: Final = re.compile(r"^[^/]*:")
+
+
+def create_manifest(local: Path) -> dict[str, str]:
+    """Return the sha256 of every file in a folder by relative path."""
+    return {name: file_sha256(Path(local, name)) for name in list_files(local)}
+
+
+def changed_files(manifest: dict[str, str], remote: dict[str, str]) -> list[str]:
+    """Return files of a manifest that are missing or different on the remote."""
+    return [name for name, digest in manifest.items() if remote.get(name) != digest]
+
+
+def _is_local(remote: str) -> bool:
+    """Return True if the remote is a local folder."""
+    return _RE_REMOTE_HOST.match(remote) is None
+
+
+def _read_manifest(remote: str) -> dict[str, str]:
+    """Return the manifest of the remote, empty if it has none."""
+    with TemporaryDirectory() as temp_dir:
+        if _is_local(remote):
+            manifest_file = Path(remote, MANIFEST)
+        else:
+            manifest_file = Path(temp_dir, MANIFEST)
+            try:
+                run_command(f"rsync --quiet {remote}/{MANIFEST} {manifest_file}")
+            except CalledProcessError:
+                return {}
+
+        try:
+            return json.loads(manifest_file.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return {}
+
+
+def _write_manifest(remote: str, manifest: dict[str, str]) -> None:
+    """Replace the manifest of the remote atomically."""
+    data = json.dumps(manifest, indent=1, sort_keys=True)
+    if _is_local(remote):
+        with NamedTemporaryFile("w", dir=remote, delete=False) as temp_file:
+            temp_file.write(data)
+        Path(temp_file.name).chmod(0o644)
+        Path(temp_file.name).replace(Path(remote, MANIFEST))
+        return
+
+    # rsync writes to a temp file and renames it
+    with TemporaryDirectory() as temp_dir:
+        manifest_file = Path(temp_dir, MANIFEST)
+        manifest_file.write_text(data, encoding="utf-8")
+        run_command(f"rsync --quiet --chmod=F644 {manifest_file} {remote}/{MANIFEST}")
+
+
+def upload(local: Path, remote: str, streams: int = 1) -> None:
+    """Upload new and changed wheels from folder to remote."""
+    manifest = create_manifest(local)
+    remote_manifest = _read_manifest(remote)
+    files = changed_files(manifest, remote_manifest)
+    print(
+        f"Upload {len(files)} of {len(manifest)} files, "
+        f"{len(manifest) - len(files)} already on remote",
+        flush=True,
+    )
+    if not files:
+        return
+
+    upload_streams(
+        local,
+        files,
+        streams,
+        lambda files, output: (
+            copy_files(local, Path(remote), files, output)
+            if _is_local(remote)
+            else rsync_files(local, remote, files, output)
+        ),
+    )
+
+    # Files are on the remote before the manifest names them. Read it again to
+    # keep entries of runs that uploaded meanwhile, a lost entry only means
+    # the file is uploaded once more.
+    _write_manifest(remote, {**_read_manifest(remote), **manifest})
@@ -1,12 +1,51 @@
 """Upload plugin rsync."""
 
 from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import IO
 
+from builder.upload import list_files, upload_streams
 from builder.utils import run_command
 
 
-def upload(local: Path, remote: str) -> None:
+def rsync_files(
+    local: Path,
+    remote: str,
+    files: list[str],
+    output: IO[str] | None = None,
+    *,
+    checksum: bool = False,
+) -> None:
+    """Upload files of a folder by relative path to remote rsync server."""
+    with NamedTemporaryFile("w", suffix=".txt") as files_from:
+        files_from.write("".join(f"{name}\n" for name in files))
+        files_from.flush()
+        run_command(
+            "rsync --human-readable --progress "
+            f"{'--checksum ' if checksum else ''}"
+            f"--files-from={files_from.name} {local}/ {remote}/",
+            output=output,
+        )
+
+
+def upload(local: Path, remote: str, streams: int = 1) -> None:
     """Upload wheels from folder to remote rsync server."""
-    run_command(
-        f"rsync --human-readable --recursive --progress --checksum {local}/* {remote}/",
+    if streams == 1:
+        run_command(
+            "rsync --human-readable --recursive --progress --checksum "
+            f"{local}/* {remote}/",
+        )
+        return
+
+    upload_streams(
+        local,
+        list_files(local),
+        streams,
+        lambda files, output: rsync_files(
+            local,
+            remote,
+            files,
+            output,
+            checksum=True,
+        ),
     )
@@ -1,13 +1,39 @@
 """Some utils for builder."""
 
+import errno
+import fcntl
+import hashlib
+import heapq
+import json
 import os
+import resource
+import shutil
 import subprocess
 import sys
+import time
+from collections.abc import Callable, Generator, Mapping
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
 from functools import cache
 from pathlib import Path
+from tempfile import TemporaryFile
+from threading import Lock, Thread, get_ident
+from typing import IO, Final, TypeVar
 
 import requests
 
+from .trace import span
+
+_T = TypeVar("_T")
+
+_OUTPUT_LOCK = Lock()
+
+# ioctl to share the data blocks of a file, linux/fs.h
+_FICLONE: Final = 0x40049409
+
+# Max seconds between polls of a command with timeout
+_WAIT_INTERVAL: Final = 0.5
+
 
 @cache
 def alpine_version() -> tuple[str, str]:
@@ -35,18 +61,249 @@ def check_url(url: str) -> None:
     response.raise_for_status()
 
 
+def balanced_partitions(weights: Mapping[_T, float], count: int) -> list[list[_T]]:
+    """Split items into up to count partitions with a balanced total weight.
+
+    Heaviest items first go to the lightest partition (longest processing time
+    first), which is at most 4/3 of the optimal largest partition.
+    """
+    heap = [(0.0, index) for index in range(min(count, len(weights)))]
+    partitions: list[list[_T]] = [[] for _ in heap]
+    for item in sorted(weights, key=lambda item: weights[item], reverse=True):
+        load, index = heapq.heappop(heap)
+        partitions[index].append(item)
+        heapq.heappush(heap, (load + weights[item], index))
+    return partitions
+
+
+def file_sha256(path: Path) -> str:
+    """Return the sha256 hex digest of a file."""
+    with path.open("rb") as stream:
+        return hashlib.file_digest(stream, "sha256").hexdigest()
+
+
+def _clone_file(source: Path, target: Path) -> None:
+    """Create target as reflink of source."""
+    with source.open("rb") as src, target.open("wb") as dst:
+        fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+    shutil.copymode(source, target)
+
+
+def _share_file(source: Path, target: Path) -> None:
+    """Replace target atomically with a hardlink, reflink or copy of source.
+
+    The data is written to a new file, so a file target was linked to before
+    is never truncated.
+    """
+    temp_file = target.with_name(f".{target.name}.{get_ident()}.tmp")
+    temp_file.unlink(missing_ok=True)
+    try:
+        os.link(source, temp_file)
+    except OSError as err:
+        if err.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+            raise
+        try:
+            try:
+                _clone_file(source, temp_file)
+            except OSError:
+                shutil.copy(source, temp_file)
+        except BaseException:
+            temp_file.unlink(missing_ok=True)
+            raise
+    temp_file.replace(target)
+
+
+def stage_file(source: Path, target: Path, *, move: bool = False) -> Path:
+    """Place a file at target and share its data where possible.
+
+    A move is a rename on the same filesystem. A copy is a hardlink or a
+    reflink, only across filesystems the data is copied. Staged files are
+    replaced but never changed in place, so a hardlink is safe.
+    """
+    if target.is_dir():
+        target = Path(target, source.name)
+    if move:
+        try:
+            source.replace(target)
+        except OSError as err:
+            if err.errno != errno.EXDEV:
+                raise
+            _share_file(source, target)
+            source.unlink()
+        return target
+
+    if target.exists() and target.samefile(source):
+        return target
+    _share_file(source, target)
+    return target
+
+
+@dataclass(slots=True)
+class CommandUsage:
+    """Represent the resources used by a command and all of its children."""
+
+    status: str
+    wall: float
+    user: float
+    system: float
+    max_rss: int
+    read_bytes: int
+    write_bytes: int
+
+
+class CommandError(subprocess.CalledProcessError):
+    """Command exited with an error code."""
+
+    def __init__(self, returncode: int, cmd: str, usage: CommandUsage) -> None:
+        """Initialize the error with the usage of the command."""
+        super().__init__(returncode, cmd)
+        self.usage = usage
+
+
+class CommandTimeout(subprocess.TimeoutExpired):
+    """Command was killed after its timeout."""
+
+    def __init__(self, cmd: str, timeout: float, usage: CommandUsage) -> None:
+        """Initialize the error with the usage of the command."""
+        super().__init__(cmd, timeout)
+        self.usage = usage
+
+
+def _command_usage(
+    status: str,
+    start: float,
+    usage: resource.struct_rusage,
+) -> CommandUsage:
+    """Convert the usage of a command, Linux counts KiB and 512 byte blocks."""
+    return CommandUsage(
+        status=status,
+        wall=time.perf_counter() - start,
+        user=usage.ru_utime,
+        system=usage.ru_stime,
+        max_rss=usage.ru_maxrss * 1024,
+        read_bytes=usage.ru_inblock * 512,
+        write_bytes=usage.ru_oublock * 512,
+    )
+
+
+def _wait_usage(
+    process: subprocess.Popen[bytes],
+    timeout: int | None,
+) -> tuple[int, resource.struct_rusage]:
+    """Wait for a process and return its exit code and resource usage.
+
+    The usage of wait4 covers only this process and its children, unlike
+    RUSAGE_CHILDREN deltas which mix up builds that run in parallel threads.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    interval = 0.01
+    while True:
+        pid, status, usage = os.wait4(
+            process.pid,
+            0 if deadline is None else os.WNOHANG,
+        )
+        if pid:
+            process.returncode = os.waitstatus_to_exitcode(status)
+            return process.returncode, usage
+        if deadline is not None and time.monotonic() >= deadline:
+            raise subprocess.TimeoutExpired(process.args, timeout or 0)
+        time.sleep(interval)
+        interval = min(interval * 2, _WAIT_INTERVAL)
+
+
 def run_command(
     cmd: str,
     env: dict[str, str] | None = None,
     timeout: int | None = None,
-) -> None:
-    """Implement subprocess.run but handle timeout different."""
-    subprocess.run(  # noqa: S602
-        cmd,
-        shell=True,
-        check=True,
-        stdout=sys.stdout,
-        stderr=sys.stderr,
-        env=env,
-        timeout=timeout,
-    )
+    output: IO[str] | None = None,
+) -> CommandUsage:
+    """Implement subprocess.run but handle timeout different.
+
+    Return wall time, CPU time, peak RSS and block I/O of the command. Errors
+    carry the usage up to the failure.
+    """
+    with span(cmd.split(maxsplit=1)[0], "command", cmd=cmd):
+        start = time.perf_counter()
+        with subprocess.Popen(  # noqa: S602
+            cmd,
+            shell=True,
+            stdout=output or sys.stdout,
+            stderr=output or sys.stderr,
+            env=env,
+        ) as process:
+            try:
+                code, usage = _wait_usage(process, timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                code, usage = _wait_usage(process, None)
+                raise CommandTimeout(
+                    cmd,
+                    timeout or 0,
+                    _command_usage("timeout", start, usage),
+                ) from None
+            except BaseException:
+                process.kill()
+                process.wait()
+                raise
+
+            if code:
+                raise CommandError(code, cmd, _command_usage("failed", start, usage))
+            return _command_usage("success", start, usage)
+
+
+def write_usage_report(report_file: Path, usage: Mapping[str, CommandUsage]) -> None:
+    """Write the usage per package as JSON, packages with most CPU time first."""
+    report = {
+        name: asdict(package_usage)
+        for name, package_usage in sorted(
+            usage.items(),
+            key=lambda item: item[1].user + item[1].system,
+            reverse=True,
+        )
+    }
+    report_file.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+
+@contextmanager
+def captured_output(title: str) -> Generator[IO[str]]:
+    """Collect output of a worker and print it as one block once done."""
+    with TemporaryFile("w+", encoding="utf-8", errors="replace") as log:
+        try:
+            yield log
+        finally:
+            log.seek(0)
+            with _OUTPUT_LOCK:
+                print(f"Output of {title}:", flush=True)
+                shutil.copyfileobj(log, sys.stdout)
+                sys.stdout.flush()
+
+
+@contextmanager
+def followed_output(
+    title: str,
+    follow: Callable[[str], str | None],
+) -> Generator[IO[str]]:
+    """Collect output of a worker like captured_output and print events live.
+
+    Every output line is passed to follow, a returned text is printed at once.
+    """
+    read_fd, write_fd = os.pipe()
+    with (
+        captured_output(title) as log,
+        open(read_fd, encoding="utf-8", errors="replace") as reader,  # noqa: PTH123
+    ):
+
+        def _read() -> None:
+            for line in reader:
+                log.write(line)
+                if (text := follow(line)) is not None:
+                    with _OUTPUT_LOCK:
+                        print(text, flush=True)
+
+        thread = Thread(target=_read, name=title, daemon=True)
+        thread.start()
+        try:
+            with open(write_fd, "w", encoding="utf-8") as writer:  # noqa: PTH123
+                yield writer
+        finally:
+            thread.join()
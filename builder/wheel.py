@@ -1,132 +1,360 @@
-"""Utils for wheel."""
-
-import re
-import shutil
-from contextlib import suppress
-from functools import cache
-from pathlib import Path
-from subprocess import CalledProcessError
-from tempfile import TemporaryDirectory
-from typing import Final
-
-from awesomeversion import AwesomeVersion
-
-from .utils import alpine_version, build_abi, build_arch, run_command
-
-_RE_PACKAGE_FULL: Final = re.compile(
-    r"^(?P<namever>(?P<name>.+?)-(?P<ver>.+?))(-(?P<build>\d[^-]*))?-(?P<pyver>.+?)-(?P<abi>.+?)-(?P<plat>.+?)\.whl$",
-)
-_RE_LINUX_PLATFORM: Final = re.compile(r"-linux_\w+\.whl$")
-_RE_MUSLLINUX_PLATFORM: Final = re.compile(
-    r"-musllinux_(?P<major>\d)_(?P<minor>\d)_(?P<arch>\w+)\.whl$",
-)
-
-_ARCH_PLAT = {
-    "amd64": "x86_64",
-}
-
-_ALPINE_MUSL_VERSION = {
-    ("3", "16"): (1, 2),
-    ("3", "17"): (1, 2),
-    ("3", "18"): (1, 2),
-    ("3", "19"): (1, 2),
-    ("3", "20"): (1, 2),
-    ("3", "21"): (1, 2),
-    ("3", "22"): (1, 2),
-    ("3", "23"): (1, 2),
-    ("3", "24"): (1, 2),
-}
-
-
-@cache
-def sys_platform(arch: str) -> set[str]:
-    """Build list of supported platform tags.
-
-    Minor musl versions are backwards compatible.
-    """
-    major, minor = _ALPINE_MUSL_VERSION[alpine_version()]
-    return {"any", *[f"musllinux_{major}_{i}_{arch}" for i in range(minor + 1)]}
-
-
-def check_abi_platform(abi: str, platform: str) -> bool:
-    """Return True if abi and platform work."""
-    arch = _ARCH_PLAT.get(build_arch(), build_arch())
-    sys_abi = build_abi()
-
-    # Check platform
-    if platform in sys_platform(arch):
-        pass
-    else:
-        return False
-
-    # Check abi
-    if abi in ("none", "abi3", sys_abi):
-        pass
-    else:
-        return False
-
-    return True
-
-
-def fix_wheels_unmatch_requirements(wheels_folder: Path) -> dict[str, AwesomeVersion]:
-    """Check Wheels against our min requirements."""
-    result: dict[str, AwesomeVersion] = {}
-    for wheel_file in wheels_folder.glob("*.whl"):
-        package = _RE_PACKAGE_FULL.fullmatch(wheel_file.name)
-        if not package:
-            msg = f"Error on parse wheel {wheel_file.name}"
-            raise RuntimeError(msg)
-
-        if check_abi_platform(package["abi"], package["plat"]):
-            continue
-
-        print(
-            f"Found wheel {wheel_file.name} that not match our min requirements",
-            flush=True,
-        )
-        result[package["name"]] = AwesomeVersion(package["ver"])
-        wheel_file.unlink()
-
-    return result
-
-
-def copy_wheels_from_cache(cache_folder: Path, wheels_folder: Path) -> None:
-    """Preserve wheels from cache on timeout error."""
-    for wheel_file in cache_folder.glob("**/*.whl"):
-        with suppress(OSError):
-            shutil.copy(wheel_file, wheels_folder)
-
-
-def run_auditwheel(wheels_folder: Path) -> bool:
-    """Run auditwheel to include shared library."""
-    success = True
-    with TemporaryDirectory() as temp_dir:
-        for wheel_file in wheels_folder.glob("*.whl"):
-            if not _RE_LINUX_PLATFORM.search(wheel_file.name):
-                continue
-            try:
-                run_command(f"auditwheel repair -w {temp_dir} {wheel_file}")
-            except CalledProcessError as err:
-                print(f"Issues auditwheel {wheel_file.name}: {err!s}", flush=True)
-                success = False
-                wheel_file.unlink()
-
-        # Copy back wheels & make sure ARCH is correct
-        target_arch = _ARCH_PLAT.get(build_arch(), build_arch())
-        for wheel_file in Path(temp_dir).glob("*.whl"):
-            package = _RE_MUSLLINUX_PLATFORM.search(wheel_file.name)
-            if not package:
-                msg = f"Wheel format error {wheel_file}"
-                raise RuntimeError(msg)
-            if package["arch"] != target_arch:
-                msg = f"Wheel have wrong platform {package['arch']}"
-                raise RuntimeError(msg)
-            shutil.copy(wheel_file, wheels_folder)
-
-    # Cleanup linux_ARCH tags
-    for wheel_file in wheels_folder.glob("*.whl"):
-        if not _RE_LINUX_PLATFORM.search(wheel_file.name):
-            continue
-        wheel_file.unlink()
-
-    return success
+"""Utils for wheel."""
+
+import base64
+import hashlib
+import re
+import sys
+from collections.abc import Collection
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext, suppress
+from functools import cache
+from pathlib import Path
+from subprocess import CalledProcessError
+from tempfile import TemporaryDirectory
+from typing import IO, Final
+from zipfile import ZIP_DEFLATED, BadZipFile, ZipFile
+
+from awesomeversion import AwesomeVersion
+from packaging.tags import Tag
+from packaging.utils import InvalidWheelFilename, NormalizedName, parse_wheel_filename
+
+from .audit import AuditWorkers
+from .cache import WheelCache
+from .trace import span
+from .utils import (
+    alpine_version,
+    build_abi,
+    build_arch,
+    captured_output,
+    file_sha256,
+    run_command,
+    stage_file,
+)
+
+_RE_LINUX_PLATFORM: Final = re.compile(r"-linux_\w+\.whl$")
+_RE_MUSLLINUX_PLATFORM: Final = re.compile(
+    r"-musllinux_(?P<major>\d)_(?P<minor>\d)_(?P<arch>\w+)\.whl$",
+)
+
+_RE_SHARED_OBJECT: Final = re.compile(r"\.so(\.\d+)*$")
+_ELF_MAGIC: Final = b"\x7fELF"
+
+_ARCH_PLAT = {
+    "amd64": "x86_64",
+}
+
+_ALPINE_MUSL_VERSION = {
+    ("3", "16"): (1, 2),
+    ("3", "17"): (1, 2),
+    ("3", "18"): (1, 2),
+    ("3", "19"): (1, 2),
+    ("3", "20"): (1, 2),
+    ("3", "21"): (1, 2),
+    ("3", "22"): (1, 2),
+    ("3", "23"): (1, 2),
+    ("3", "24"): (1, 2),
+}
+
+
+class WheelCompatibility:
+    """Answer if wheel tags can be installed on the build system.
+
+    The supported abi/platform pairs are computed once, and the result for a
+    set of wheel tags is remembered, so a wheel costs one lookup.
+    """
+
+    def __init__(self, arch: str, abi: str, alpine: tuple[str, str]) -> None:
+        """Initialize supported abi/platform pairs.
+
+        Minor musl versions are backwards compatible.
+        """
+        arch = _ARCH_PLAT.get(arch, arch)
+        major, minor = _ALPINE_MUSL_VERSION[alpine]
+        platforms = {
+            "any",
+            *[f"musllinux_{major}_{i}_{arch}" for i in range(minor + 1)],
+        }
+
+        # Platform tag of wheels built on this system
+        self.platform = f"musllinux_{major}_{minor}_{arch}"
+        self.supported = frozenset(
+            (sys_abi, platform)
+            for sys_abi in ("none", "abi3", abi)
+            for platform in platforms
+        )
+        self._tags: dict[frozenset[Tag], bool] = {}
+
+    def check(self, abi: str, platform: str) -> bool:
+        """Return True if abi and platform work."""
+        return (abi, platform) in self.supported
+
+    def compatible(self, tags: frozenset[Tag]) -> bool:
+        """Return True if one of the wheel tags works."""
+        if (result := self._tags.get(tags)) is None:
+            result = self._tags[tags] = any(
+                (tag.abi, tag.platform) in self.supported for tag in tags
+            )
+        return result
+
+
+@cache
+def _wheel_compatibility(
+    arch: str,
+    abi: str,
+    alpine: tuple[str, str],
+) -> WheelCompatibility:
+    """Return the shared compatibility of a build system."""
+    return WheelCompatibility(arch, abi, alpine)
+
+
+def build_compatibility() -> WheelCompatibility:
+    """Return wheel compatibility of this build system."""
+    return _wheel_compatibility(build_arch(), build_abi(), alpine_version())
+
+
+def check_abi_platform(abi: str, platform: str) -> bool:
+    """Return True if abi and platform work."""
+    return build_compatibility().check(abi, platform)
+
+
+def fix_wheels_unmatch_requirements(wheels_folder: Path) -> dict[str, AwesomeVersion]:
+    """Check Wheels against our min requirements."""
+    compatibility = build_compatibility()
+    result: dict[str, AwesomeVersion] = {}
+    for wheel_file in wheels_folder.glob("*.whl"):
+        try:
+            name, version, _, tags = parse_wheel_filename(wheel_file.name)
+        except InvalidWheelFilename as err:
+            msg = f"Error on parse wheel {wheel_file.name}"
+            raise RuntimeError(msg) from err
+
+        if compatibility.compatible(tags):
+            continue
+
+        print(
+            f"Found wheel {wheel_file.name} that not match our min requirements",
+            flush=True,
+        )
+        result[name] = AwesomeVersion(str(version))
+        wheel_file.unlink()
+
+    return result
+
+
+def snapshot_wheels(cache_folder: Path) -> frozenset[Path]:
+    """Return the wheels in the pip cache before a run."""
+    return frozenset(cache_folder.glob("**/*.whl"))
+
+
+def copy_wheels_from_cache(
+    cache_folder: Path,
+    wheels_folder: Path,
+    packages: Collection[NormalizedName] | None = None,
+    snapshot: Collection[Path] = frozenset(),
+    uploaded: Collection[NormalizedName] = frozenset(),
+) -> None:
+    """Preserve wheels from cache on timeout error.
+
+    Only wheels this run added to the cache are used, if packages are given
+    only for these packages. A package with a wheel in the folder or one of
+    the uploaded packages is skipped.
+    """
+    existing = {
+        parse_wheel_filename(wheel_file.name)[0]
+        for wheel_file in wheels_folder.glob("*.whl")
+    }
+    existing.update(uploaded)
+    for wheel_file in cache_folder.glob("**/*.whl"):
+        if wheel_file in snapshot:
+            continue
+        try:
+            name = parse_wheel_filename(wheel_file.name)[0]
+        except InvalidWheelFilename:
+            continue
+        if name in existing or (packages is not None and name not in packages):
+            continue
+        with suppress(OSError):
+            stage_file(wheel_file, wheels_folder)
+            print(f"Preserve {wheel_file.name} from pip cache", flush=True)
+            existing.add(name)
+
+
+def is_linux_wheel(wheel_file: Path) -> bool:
+    """Return True if a wheel has the linux platform tag of a fresh build."""
+    return _RE_LINUX_PLATFORM.search(wheel_file.name) is not None
+
+
+def has_native_code(wheel_file: Path) -> bool:
+    """Return True if a wheel ships shared objects or executables.
+
+    Shared objects are found from the zip central directory. Only members
+    without a file suffix are opened to look for the ELF magic of an
+    executable. A wheel that can't be read is handed to auditwheel, which
+    reports the error.
+    """
+    try:
+        with ZipFile(wheel_file) as wheel_zip:
+            for info in wheel_zip.infolist():
+                if _RE_SHARED_OBJECT.search(info.filename):
+                    return True
+                if info.is_dir() or Path(info.filename).suffix:
+                    continue
+                with wheel_zip.open(info) as member:
+                    if member.read(len(_ELF_MAGIC)) == _ELF_MAGIC:
+                        return True
+    except (BadZipFile, OSError):
+        return True
+    return False
+
+
+def _record_hash(data: bytes) -> str:
+    """Return the RECORD hash of a wheel member."""
+    digest = base64.urlsafe_b64encode(hashlib.sha256(data).digest())
+    return f"sha256={digest.rstrip(b'=').decode()}"
+
+
+def retag_wheel(wheel_file: Path, output: Path, platform: str) -> Path:
+    """Copy a wheel without native code to output with a new platform tag.
+
+    Raise ValueError for a wheel without WHEEL metadata.
+    """
+    target = Path(output, _RE_LINUX_PLATFORM.sub(f"-{platform}.whl", wheel_file.name))
+    with ZipFile(wheel_file) as source:
+        metadata = next(
+            (
+                name
+                for name in source.namelist()
+                if name.count("/") == 1 and name.endswith(".dist-info/WHEEL")
+            ),
+            None,
+        )
+        if metadata is None:
+            msg = f"No WHEEL metadata in {wheel_file.name}"
+            raise ValueError(msg)
+        record = metadata.replace("/WHEEL", "/RECORD")
+
+        lines = []
+        for line in source.read(metadata).decode().splitlines():
+            if line.startswith("Tag:") and "-linux_" in line:
+                interpreter, abi, _ = line.removeprefix("Tag:").strip().split("-")
+                line = f"Tag: {interpreter}-{abi}-{platform}"  # noqa: PLW2901
+            lines.append(line)
+        wheel_data = "\n".join([*lines, ""]).encode()
+
+        try:
+            with ZipFile(target, "w", ZIP_DEFLATED) as target_zip:
+                for info in source.infolist():
+                    data = source.read(info)
+                    if info.filename == metadata:
+                        data = wheel_data
+                    elif info.filename == record:
+                        rows = [
+                            f"{metadata},{_record_hash(wheel_data)},{len(wheel_data)}"
+                            if row.startswith(f"{metadata},")
+                            else row
+                            for row in data.decode().splitlines()
+                        ]
+                        data = "\n".join([*rows, ""]).encode()
+                    target_zip.writestr(info, data)
+        except BaseException:
+            target.unlink(missing_ok=True)
+            raise
+    return target
+
+
+def repair_wheel(
+    wheel_file: Path,
+    output: Path,
+    wheel_cache: WheelCache | None = None,
+    log: IO[str] | None = None,
+    workers: AuditWorkers | None = None,
+) -> None:
+    """Repair one wheel into output, without auditwheel if possible.
+
+    A wheel that can't be retagged is handed to auditwheel, which reports it.
+    """
+    with span(f"repair {wheel_file.name}", "repair"):
+        if not has_native_code(wheel_file):
+            print(
+                f"Retag {wheel_file.name} without native code",
+                file=log or sys.stdout,
+            )
+            try:
+                retag_wheel(wheel_file, output, build_compatibility().platform)
+            except (BadZipFile, KeyError, OSError, ValueError) as err:
+                print(f"Can't retag {wheel_file.name}: {err!s}", file=log or sys.stdout)
+            else:
+                return
+
+        key = wheel_cache.repair_key(file_sha256(wheel_file)) if wheel_cache else None
+        if wheel_cache and key and wheel_cache.restore(key, output):
+            print(f"Found repair of {wheel_file.name} in cache", file=log or sys.stdout)
+            return
+
+        with TemporaryDirectory() as repair_dir:
+            if workers:
+                workers.repair(wheel_file, Path(repair_dir), log)
+            else:
+                run_command(
+                    f"auditwheel repair -w {repair_dir} {wheel_file}",
+                    output=log,
+                )
+            repaired = list(Path(repair_dir).glob("*.whl"))
+            if wheel_cache and key:
+                wheel_cache.store(key, repaired)
+            for repaired_file in repaired:
+                stage_file(repaired_file, output, move=True)
+
+
+def run_auditwheel(
+    wheels_folder: Path,
+    jobs: int = 1,
+    wheel_cache: WheelCache | None = None,
+    workers: AuditWorkers | None = None,
+) -> bool:
+    """Run auditwheel to include shared library.
+
+    Wheels without shared objects only get a new platform tag. Repairs are
+    stored in the cache by the sha256 of the input wheel and run by the
+    workers if given, else by the auditwheel command.
+    """
+    success = True
+    with TemporaryDirectory() as temp_dir:
+
+        def _repair(wheel_file: Path) -> None:
+            with captured_output(wheel_file.name) if jobs > 1 else nullcontext() as log:
+                repair_wheel(wheel_file, Path(temp_dir), wheel_cache, log, workers)
+
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            repairs = {
+                executor.submit(_repair, wheel_file): wheel_file
+                for wheel_file in wheels_folder.glob("*.whl")
+                if is_linux_wheel(wheel_file)
+            }
+            for repair in as_completed(repairs):
+                wheel_file = repairs[repair]
+                try:
+                    repair.result()
+                except CalledProcessError as err:
+                    print(f"Issues auditwheel {wheel_file.name}: {err!s}", flush=True)
+                    success = False
+                    wheel_file.unlink()
+
+        # Copy back wheels & make sure ARCH is correct
+        target_arch = _ARCH_PLAT.get(build_arch(), build_arch())
+        for wheel_file in Path(temp_dir).glob("*.whl"):
+            package = _RE_MUSLLINUX_PLATFORM.search(wheel_file.name)
+            if not package:
+                msg = f"Wheel format error {wheel_file}"
+                raise RuntimeError(msg)
+            if package["arch"] != target_arch:
+                msg = f"Wheel have wrong platform {package['arch']}"
+                raise RuntimeError(msg)
+            stage_file(wheel_file, wheels_folder, move=True)
+
+    # Cleanup linux_ARCH tags
+    for wheel_file in wheels_folder.glob("*.whl"):
+        if is_linux_wheel(wheel_file):
+            wheel_file.unlink()
+
+    return success
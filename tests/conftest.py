@@ -20,22 +20,25 @@ TEST_INDEX_FILES = [
 ]
 
 
+# Mimc the HTML of a webserver autoindex.
+INDEX_CONTENT = (
+    "<!DOCTYPE html>\n<html>\n<body>\n"
+    + "\n".join(
+        f'<a href="{wheel}" title="{wheel}">{wheel}</a>     28-May-2021 09:53  38181515'
+        for wheel in TEST_INDEX_FILES
+    )
+    + "\n</body></html>"
+)
+
+
 @pytest.fixture(autouse=True)
 def mock_index_data() -> Generator[None]:
     """Prepare a fake existing wheel index for use in tests."""
-    # Mimc the HTML of a webserver autoindex.
-    content = (
-        "<!DOCTYPE html>\n<html>\n<body>\n"
-        + "\n".join(
-            f'<a href="{wheel}" title="{wheel}">{wheel}</a>'
-            "     28-May-2021 09:53  38181515"
-            for wheel in TEST_INDEX_FILES
-        )
-        + "\n</body></html>"
-    )
     with patch("builder.infra.requests.get") as mock_request_get:
         mock_request_get.return_value.status_code = 200
-        mock_request_get.return_value.text = content
+        mock_request_get.return_value.iter_content.return_value = [
+            INDEX_CONTENT.encode(),
+        ]
         yield
 
 
@@ -44,6 +47,8 @@ def sys_arch() -> Generator[None]:
     """Patch system arch."""
     with (
         patch("builder.utils.build_arch", return_value="amd64"),
+        patch("builder.cache.build_arch", return_value="amd64"),
+        patch("builder.history.build_arch", return_value="amd64"),
         patch("builder.wheel.build_arch", return_value="amd64"),
     ):
         yield
@@ -54,6 +59,8 @@ def sys_abi() -> Generator[None]:
     """Patch system abi."""
     with (
         patch("builder.utils.build_abi", return_value="cp310"),
+        patch("builder.cache.build_abi", return_value="cp310"),
+        patch("builder.history.build_abi", return_value="cp310"),
         patch("builder.wheel.build_abi", return_value="cp310"),
     ):
         yield
@@ -64,6 +71,7 @@ def sys_alpine() -> Generator[None]:
     """Patch system abi."""
     with (
         patch("builder.utils.alpine_version", return_value=("3", "16")),
+        patch("builder.cache.alpine_version", return_value=("3", "16")),
         patch("builder.wheel.alpine_version", return_value=("3", "16")),
     ):
         yield
@@ -0,0 +1,71 @@
+"""Tests for audit module."""
+
+import io
+import os
+from pathlib import Path
+from subprocess import CalledProcessError
+from unittest.mock import patch
+
+import pytest
+
+from builder.audit import AuditWorkers
+from builder.wheel import run_auditwheel
+
+
+def test_audit_workers_error(tmp_path: Path) -> None:
+    """Test a rejected wheel fails like the auditwheel command."""
+    log = io.StringIO()
+    with AuditWorkers() as workers:
+        for _ in range(2):
+            with pytest.raises(CalledProcessError):
+                workers.repair(
+                    tmp_path / "missing-1.0-cp310-cp310-linux_x86_64.whl",
+                    tmp_path,
+                    log,
+                )
+    assert "missing-1.0-cp310-cp310-linux_x86_64.whl. No such file" in log.getvalue()
+
+
+def test_audit_workers_broken_wheel(tmp_path: Path) -> None:
+    """Test a corrupt wheel fails its repair and not the workers."""
+    wheel_file = tmp_path / "broken-1.0-cp310-cp310-linux_x86_64.whl"
+    wheel_file.write_bytes(b"no zip file")
+    log = io.StringIO()
+    with AuditWorkers() as workers:
+        for _ in range(2):
+            with pytest.raises(CalledProcessError):
+                workers.repair(wheel_file, tmp_path, log)
+    assert "BadZipFile: File is not a zip file" in log.getvalue()
+
+
+def test_run_auditwheel_broken_wheel(tmp_path: Path) -> None:
+    """Test a corrupt wheel is dropped like with the auditwheel command."""
+    (tmp_path / "broken-1.0-cp310-cp310-linux_x86_64.whl").write_bytes(b"no zip")
+    (tmp_path / "six-1.16.0-py2.py3-none-any.whl").touch()
+    with AuditWorkers() as workers:
+        assert not run_auditwheel(tmp_path, workers=workers)
+    assert [p.name for p in tmp_path.glob("*.whl")] == [
+        "six-1.16.0-py2.py3-none-any.whl",
+    ]
+
+
+def _exit_worker(*_: str) -> None:
+    """End the worker process like the OOM killer."""
+    os._exit(1)
+
+
+def test_audit_workers_died(tmp_path: Path) -> None:
+    """Test a dead worker fails only its wheel and the pool starts again."""
+    wheel_file = tmp_path / "killed-1.0-cp310-cp310-linux_x86_64.whl"
+    log = io.StringIO()
+    with AuditWorkers() as workers:
+        with (
+            patch("builder.audit._repair", _exit_worker),
+            pytest.raises(CalledProcessError),
+        ):
+            workers.repair(wheel_file, tmp_path, log)
+        assert "Audit worker died" in log.getvalue()
+
+        with pytest.raises(CalledProcessError):
+            workers.repair(wheel_file, tmp_path, log)
+    assert "killed-1.0-cp310-cp310-linux_x86_64.whl. No such file" in log.getvalue()
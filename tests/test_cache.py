@@ -0,0 +1,245 @@
+"""Tests for cache module."""
+
+import os
+from pathlib import Path
+from subprocess import CalledProcessError
+from unittest.mock import patch
+from zipfile import ZipFile
+
+import pytest
+
+from builder import cache, pip
+from builder.utils import file_sha256
+
+WHEEL = "aiohttp-3.7.4-cp310-cp310-linux_x86_64.whl"
+
+
+@pytest.mark.parametrize(
+    ("package", "result"),
+    [
+        ("aiohttp==3.7.4", ("aiohttp", "3.7.4")),
+        ("Google_Cloud-Pubsub==2.1.0", ("google-cloud-pubsub", "2.1.0")),
+        ("aiohttp>=3.7.4", None),
+        ("aiohttp==3.7.*", None),
+        ("aiohttp", None),
+        ("-e .", None),
+    ],
+)
+def test_pinned_version(package: str, result: tuple[str, str] | None) -> None:
+    assert cache.pinned_version(package) == result
+
+
+def test_cache_key(tmp_path: Path) -> None:
+    wheel_cache = cache.WheelCache(tmp_path, 1024, apk="build-base;cmake")
+    key = wheel_cache.key("aiohttp==3.7.4", ":none:")
+    assert key
+    assert wheel_cache.key("AIOhttp==3.7.4", ":none:") == key
+    assert cache.WheelCache(tmp_path, 1024, apk="cmake;build-base").key(
+        "aiohttp==3.7.4",
+        ":none:",
+    ) == (key)
+
+    # Build from source, other version or build system are different builds
+    assert wheel_cache.key("aiohttp==3.7.4", "aiohttp,grpcio") != key
+    assert wheel_cache.key("aiohttp==3.7.3", ":none:") != key
+    assert cache.WheelCache(tmp_path, 1024).key("aiohttp==3.7.4", ":none:") != key
+    with patch.dict(os.environ, {"CFLAGS": "-O3"}):
+        assert (
+            cache.WheelCache(tmp_path, 1024, apk="build-base;cmake").key(
+                "aiohttp==3.7.4",
+                ":none:",
+            )
+            != key
+        )
+
+    # Dependencies depend on index and constraints
+    assert wheel_cache.key("aiohttp==3.7.4", ":none:", index="https://a/") != key
+    assert wheel_cache.key("aiohttp==3.7.4", ":none:", constraint="abcd") != key
+
+    # Entries with the package wheel only
+    assert wheel_cache.key("aiohttp==3.7.4", ":none:", no_deps=True) != key
+    assert wheel_cache.key("aiohttp==3.7.4", ":none:", requirement=True) not in {
+        key,
+        wheel_cache.key("aiohttp==3.7.4", ":none:", no_deps=True),
+    }
+    assert wheel_cache.key("aiohttp>=3.7.4", ":none:") is None
+
+
+def test_cache_store_restore(tmp_path: Path) -> None:
+    wheel_cache = cache.WheelCache(tmp_path / "cache", 1024)
+    build = tmp_path / "build"
+    build.mkdir()
+    (build / WHEEL).write_bytes(b"wheel")
+    output = tmp_path / "output"
+    output.mkdir()
+
+    assert not wheel_cache.restore("abcd", output)
+    wheel_cache.store("abcd", [build / WHEEL])
+    assert wheel_cache.restore("abcd", output)
+    assert (output / WHEEL).read_bytes() == b"wheel"
+
+
+def test_cache_evict(tmp_path: Path) -> None:
+    wheel_cache = cache.WheelCache(tmp_path / "cache", 10)
+    for i, key in enumerate(("aaaa", "bbbb", "cccc")):
+        wheel_file = tmp_path / f"{key}-1.0-py3-none-any.whl"
+        wheel_file.write_bytes(b"12345")
+        wheel_cache.store(key, [wheel_file])
+        os.utime(wheel_cache.wheels / key[:2] / key, (i, i))
+
+    # Recently used entries are kept
+    assert wheel_cache.restore("aaaa", tmp_path)
+    wheel_cache.evict()
+
+    assert {entry.name for entry in wheel_cache.wheels.glob("*/*")} == {
+        "aaaa",
+        "cccc",
+    }
+
+
+def test_build_wheels_package_cached(tmp_path: Path) -> None:
+    wheel_cache = cache.WheelCache(tmp_path / "cache", 1024)
+    output = tmp_path / "output"
+    output.mkdir()
+
+    def _run_command(cmd: str, **_: object) -> None:
+        wheel_dir = Path(cmd.split("--wheel-dir ")[1].split()[0])
+        (wheel_dir / WHEEL).write_bytes(b"wheel")
+
+    with patch("builder.pip.run_command", side_effect=_run_command) as run_command:
+        for _ in range(2):
+            pip.build_wheels_package(
+                "aiohttp==3.7.4",
+                "https://example.com",
+                output,
+                ":none:",
+                60,
+                cache=wheel_cache,
+            )
+
+    assert run_command.call_count == 1
+    assert (output / WHEEL).read_bytes() == b"wheel"
+
+
+def test_build_wheels_requirement_cached(tmp_path: Path) -> None:
+    wheel_cache = cache.WheelCache(tmp_path / "cache", 1024)
+    output = tmp_path / "output"
+    output.mkdir()
+    requirement = tmp_path / "requirement.txt"
+    requirement.write_text("aiohttp==3.7.4\ngrpcio==1.31.0\n")
+    constraint = tmp_path / "constraint.txt"
+    constraint.write_text("yarl==1.6.3\n")
+    (tmp_path / WHEEL).touch()
+    wheel_cache.store(
+        wheel_cache.key(
+            "aiohttp==3.7.4",
+            ":none:",
+            index="https://example.com",
+            constraint=file_sha256(constraint),
+            requirement=True,
+        )
+        or "",
+        [tmp_path / WHEEL],
+    )
+    requirements: list[list[str]] = []
+
+    def _run_command(cmd: str, **_: object) -> None:
+        wheel_dir = Path(cmd.split("--wheel-dir ")[1].split()[0])
+        temp_requirement = Path(cmd.split("--requirement ")[1].split()[0])
+        requirements.append(temp_requirement.read_text(encoding="utf-8").split())
+        for line in requirements[-1]:
+            name = Path(line).name.partition("==")[0].partition("-")[0]
+            (wheel_dir / f"{name}-1.0-cp310-cp310-linux_x86_64.whl").touch()
+        (wheel_dir / "yarl-1.6.3-cp310-cp310-linux_x86_64.whl").touch()
+
+    with patch("builder.pip.run_command", side_effect=_run_command):
+        for _ in range(2):
+            pip.build_wheels_requirement(
+                requirement,
+                "https://example.com",
+                output,
+                ":none:",
+                60,
+                constraint,
+                cache=wheel_cache,
+            )
+
+    # Cached wheels are passed by path, so pip adds their dependencies
+    assert [[Path(line).name for line in lines] for lines in requirements] == [
+        ["grpcio==1.31.0", WHEEL],
+        [WHEEL, "grpcio-1.0-cp310-cp310-linux_x86_64.whl"],
+    ]
+    assert (output / WHEEL).exists()
+    assert (output / "yarl-1.6.3-cp310-cp310-linux_x86_64.whl").exists()
+
+    # The entries hold only the wheel of the package
+    assert wheel_cache.key("grpcio==1.31.0", ":none:") not in {
+        entry.name for entry in wheel_cache.wheels.glob("*/*")
+    }
+    assert wheel_cache.restore(
+        wheel_cache.key(
+            "grpcio==1.31.0",
+            ":none:",
+            index="https://example.com",
+            constraint=file_sha256(constraint),
+            requirement=True,
+        )
+        or "",
+        tmp_path,
+    )
+
+
+def test_build_wheels_failed_cached(tmp_path: Path) -> None:
+    wheel_cache = cache.WheelCache(tmp_path / "cache", 1024)
+    output = tmp_path / "output"
+    output.mkdir()
+    requirement = tmp_path / "requirement.txt"
+    requirement.write_text("good==1.0\nbroken==1.0\n")
+    good = "good-1.0-cp310-cp310-linux_x86_64.whl"
+
+    def _run_command(cmd: str, **_: object) -> None:
+        wheel_dir = Path(cmd.split("--wheel-dir ")[1].split()[0])
+        with ZipFile(wheel_dir / good, "w") as wheel_zip:
+            wheel_zip.writestr("good.py", b"")
+        # Killed while writing
+        (wheel_dir / "broken-1.0-cp310-cp310-linux_x86_64.whl").write_bytes(b"PK")
+        raise CalledProcessError(1, cmd)
+
+    with (
+        patch("builder.pip.run_command", side_effect=_run_command),
+        pytest.raises(CalledProcessError),
+    ):
+        pip.build_wheels_requirement(
+            requirement,
+            "https://example.com",
+            output,
+            ":none:",
+            60,
+            cache=wheel_cache,
+        )
+    assert [p.name for p in output.glob("*.whl")] == [good]
+    assert wheel_cache.restore(
+        wheel_cache.key(
+            "good==1.0",
+            ":none:",
+            index="https://example.com",
+            requirement=True,
+        )
+        or "",
+        tmp_path,
+    )
+
+    (output / good).unlink()
+    with (
+        patch("builder.pip.run_command", side_effect=_run_command),
+        pytest.raises(CalledProcessError),
+    ):
+        pip.build_wheels_package(
+            "broken==1.0",
+            "https://example.com",
+            output,
+            ":none:",
+            60,
+            cache=wheel_cache,
+        )
+    assert [p.name for p in output.glob("*.whl")] == [good]
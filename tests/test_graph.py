@@ -0,0 +1,108 @@
+"""Tests for graph module."""
+
+from typing import Any
+
+from packaging.utils import canonicalize_name
+
+from builder import graph
+from builder.infra import extract_packages_from_index
+
+INSTALL_REPORT: dict[str, Any] = {
+    "version": "1",
+    "install": [
+        {
+            "metadata": {
+                "name": "aiohttp",
+                "version": "3.7.4",
+                "requires_dist": [
+                    "multidict>=4.5",
+                    "yarl>=1.0",
+                    "cchardet; extra == 'speedups'",
+                ],
+            },
+            "requested": True,
+        },
+        {
+            "metadata": {
+                "name": "yarl",
+                "version": "1.6.3",
+                "requires_dist": ["multidict>=4.0", "idna>=2.0"],
+            },
+            "requested": True,
+        },
+        {
+            "metadata": {"name": "multidict", "version": "5.1.0"},
+            "requested": False,
+        },
+        {
+            "metadata": {
+                "name": "Google_Cloud_Pubsub",
+                "version": "2.1.0",
+                "requires_dist": ["grpcio>=1.0", "pytest; python_version < '3'"],
+            },
+            "requested": True,
+        },
+        {
+            "metadata": {
+                "name": "grpcio",
+                "version": "1.31.0",
+                "requires_dist": ["multidict"],
+            },
+            "requested": False,
+        },
+    ],
+}
+
+
+def test_parse_install_report() -> None:
+    resolved = graph.parse_install_report(INSTALL_REPORT)
+    assert set(resolved) == {
+        "aiohttp",
+        "yarl",
+        "multidict",
+        "google-cloud-pubsub",
+        "grpcio",
+    }
+    # Inactive markers and packages outside of the report are dropped
+    assert resolved[canonicalize_name("aiohttp")].dependencies == {"multidict", "yarl"}
+    assert resolved[canonicalize_name("yarl")].dependencies == {"multidict"}
+    assert resolved[canonicalize_name("google-cloud-pubsub")].dependencies == {"grpcio"}
+    assert resolved[canonicalize_name("google-cloud-pubsub")].requested
+    assert not resolved[canonicalize_name("multidict")].requested
+
+
+def test_transitive_dependencies() -> None:
+    resolved = graph.parse_install_report(INSTALL_REPORT)
+    assert graph.transitive_dependencies(
+        resolved,
+        canonicalize_name("google-cloud-pubsub"),
+    ) == {
+        "grpcio",
+        "multidict",
+    }
+
+
+def test_schedule_packages() -> None:
+    resolved = graph.parse_install_report(INSTALL_REPORT)
+    schedule = graph.schedule_packages(
+        ["aiohttp==3.7.4", "yarl==1.6.3", "google_cloud_pubsub==2.1.0", "-e ."],
+        resolved,
+    )
+    assert schedule == {
+        "-e .": set(),
+        "aiohttp==3.7.4": {"yarl==1.6.3", "multidict==5.1.0"},
+        "yarl==1.6.3": {"multidict==5.1.0"},
+        "google_cloud_pubsub==2.1.0": {"multidict==5.1.0"},
+        # Shared by all requested packages
+        "multidict==5.1.0": set(),
+    }
+
+
+def test_missing_packages() -> None:
+    resolved = graph.parse_install_report(INSTALL_REPORT)
+    package_index = extract_packages_from_index("https://example.com")
+
+    assert graph.missing_packages(resolved, package_index) == [
+        "multidict==5.1.0",
+        "yarl==1.6.3",
+    ]
@@ -0,0 +1,78 @@
+"""Tests for history module."""
+
+from pathlib import Path
+
+from builder.history import BuildHistory, select_shard
+
+
+def test_estimate(tmp_path: Path) -> None:
+    history = BuildHistory(tmp_path / "history.json")
+    history.record("grpcio==1.60.0", 600)
+    history.record("grpcio==1.61.0", 800)
+    history.record("aiohttp==3.7.4", 30)
+    history.record("yarl==1.9.0", 20)
+    history.record("multidict==6.0.0", 25)
+
+    assert history.estimate("grpcio==1.60.0") == history.estimate("GRPCio==1.60.0")
+    assert history.estimate("grpcio==1.61.0") > history.estimate("grpcio==1.62.0")
+    assert history.estimate("grpcio==1.62.0") > history.estimate("grpcio==1.60.0")
+    assert history.estimate("aiohttp==3.8.0") == history.estimate("aiohttp==3.7.4")
+
+    # Unknown packages take the median of all recorded builds
+    history.save()
+    history = BuildHistory(tmp_path / "history.json")
+    assert history.estimate("pillow==10.0.0") == history.estimate("aiohttp==3.7.4")
+    assert history.longest_first(
+        ["yarl==1.9.0", "pillow==10.0.0", "grpcio==1.61.0", "aiohttp==3.7.4"],
+    ) == ["grpcio==1.61.0", "aiohttp==3.7.4", "pillow==10.0.0", "yarl==1.9.0"]
+
+
+def test_keep_latest_versions(tmp_path: Path) -> None:
+    history = BuildHistory(tmp_path / "history.json")
+    versions = ["1.0", "1.1", "1.2", "1.3"]
+    for version in versions:
+        history.record(f"grpcio=={version}", 100)
+    history.record("grpcio==1.0", 500)
+
+    assert history.estimate("grpcio==1.0") > history.estimate("grpcio==1.3")
+    assert history.estimate("grpcio==1.1") < history.estimate("grpcio==1.0")
+    history.save()
+    assert "1.1" not in (tmp_path / "history.json").read_text("utf-8")
+
+
+def test_broken_history(tmp_path: Path) -> None:
+    history_file = tmp_path / "history.json"
+    history_file.write_text("{broken", "utf-8")
+
+    history = BuildHistory(history_file)
+    assert history.longest_first(["yarl", "aiohttp"]) == ["aiohttp", "yarl"]
+    history.record("yarl", 1)
+    history.save()
+    assert BuildHistory(history_file).estimate("yarl") == 1
+
+
+def test_select_shard_hash() -> None:
+    packages = [f"package-{i}==1.0.0" for i in range(50)]
+    shards = [select_shard(packages, shard, 3) for shard in (1, 2, 3)]
+
+    assert sorted(package for shard in shards for package in shard) == sorted(packages)
+    assert all(shards)
+
+    # A package stays in its shard if others change
+    changed = [*packages[:10], "new==1.0.0"]
+    assert [
+        package for package in select_shard(changed, 2, 3) if package in packages
+    ] == [package for package in shards[1] if package in changed]
+    assert select_shard(["package-1==2.0.0"], 1, 1) == ["package-1==2.0.0"]
+
+
+def test_select_shard_history(tmp_path: Path) -> None:
+    history = BuildHistory(tmp_path / "history.json")
+    for package, seconds in (("grpcio", 600), ("numpy", 500), ("pillow", 100)):
+        history.record(f"{package}==1.0", seconds)
+    packages = ["yarl==1.0", "grpcio==1.0", "pillow==1.0", "numpy==1.0"]
+
+    shards = [select_shard(packages, shard, 2, history) for shard in (1, 2)]
+    assert shards == [["grpcio==1.0", "yarl==1.0"], ["numpy==1.0", "pillow==1.0"]]
+    assert select_shard(reversed(packages), 1, 2, history) == shards[0]
+    assert select_shard(packages, len(packages) + 1, len(packages) + 1, history) == []
@@ -1,11 +1,17 @@
 """Tests for infra module."""
 
 from pathlib import Path
+from unittest.mock import MagicMock, patch
 
+import pytest
 from packaging.utils import canonicalize_name
 
 from builder import infra
 
+from .conftest import INDEX_CONTENT, TEST_INDEX_FILES
+
+# pylint: disable=protected-access
+
 
 def test_extract_packages_from_index() -> None:
     """Test index package extraction."""
@@ -26,6 +32,23 @@ def test_extract_packages_from_index() -> None:
     ]
 
 
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 65536])
+def test_iter_index_wheels(chunk_size: int) -> None:
+    """Test wheel filenames are found across chunk borders."""
+    content = (
+        INDEX_CONTENT.replace("</body>", '<a href="../">../</a></body>')
+        + "<a href='/musllinux/pkg-1.0%2Blocal-py3-none-any.whl'>x</a>"
+        + '<a href="pkg-1.0-py3-none-any.whl.metadata">x</a>'
+    ).encode()
+    chunks = (
+        content[pos : pos + chunk_size] for pos in range(0, len(content), chunk_size)
+    )
+    assert list(infra.iter_index_wheels(chunks)) == [
+        *TEST_INDEX_FILES,
+        "pkg-1.0+local-py3-none-any.whl",
+    ]
+
+
 def test_check_available_binary_none() -> None:
     """No-op when no binaries specified to skip."""
     package_index = infra.extract_packages_from_index("https://example.com")
@@ -278,3 +301,182 @@ def test_remove_local_wheel_no_build_wheels(tmp_path: Path) -> None:
         ],
         wheels_dir=tmp_path,
     )
+
+
+def test_index_snapshot(tmp_path: Path) -> None:
+    """Test snapshot files keep cache metadata and wheel filenames."""
+    snapshot = tmp_path / "index" / "wheels.snapshot"
+    assert infra.read_index_snapshot(snapshot) is None
+
+    infra.write_index_snapshot(snapshot, {"etag": '"abc"'}, TEST_INDEX_FILES)
+    assert infra.read_index_snapshot(snapshot) == (
+        {"etag": '"abc"'},
+        TEST_INDEX_FILES,
+    )
+
+    snapshot.write_bytes(b"garbage")
+    assert infra.read_index_snapshot(snapshot) is None
+
+
+def test_extract_packages_from_index_snapshot(tmp_path: Path) -> None:
+    """Test index snapshot is revalidated with a conditional request."""
+    snapshot = tmp_path / "wheels.snapshot"
+    with patch("builder.infra.requests.get") as mock_request_get:
+        mock_request_get.return_value.status_code = 200
+        mock_request_get.return_value.iter_content.return_value = [
+            INDEX_CONTENT.encode(),
+        ]
+        mock_request_get.return_value.headers = {
+            "ETag": '"abc"',
+            "Last-Modified": "Fri, 28 May 2021 09:53:00 GMT",
+        }
+        package_index = infra.extract_packages_from_index(
+            "https://example.com",
+            snapshot,
+        )
+        assert mock_request_get.call_args.kwargs["headers"] == {}
+
+        mock_request_get.return_value.status_code = 304
+        mock_request_get.return_value.iter_content.return_value = []
+        assert (
+            infra.extract_packages_from_index("https://example.com", snapshot)
+            == package_index
+        )
+        assert mock_request_get.call_args.kwargs["headers"] == {
+            "If-None-Match": '"abc"',
+            "If-Modified-Since": "Fri, 28 May 2021 09:53:00 GMT",
+        }
+
+        # Within ttl the snapshot is used without request
+        mock_request_get.reset_mock()
+        assert (
+            infra.extract_packages_from_index("https://example.com", snapshot, 60)
+            == package_index
+        )
+        mock_request_get.assert_not_called()
+
+        # A failing server falls back to the snapshot
+        mock_request_get.return_value.status_code = 503
+        mock_request_get.return_value.iter_content.return_value = [b"<html></html>"]
+        assert (
+            infra.extract_packages_from_index("https://example.com", snapshot)
+            == package_index
+        )
+        mock_request_get.return_value.__exit__.assert_called()
+
+
+def test_extract_packages_from_projects() -> None:
+    """Test only requested projects are looked up in the simple index."""
+
+    def _get(url: str, headers: dict[str, str], **_: object) -> MagicMock:
+        assert headers["Accept"].startswith("application/vnd.pypi.simple.v1+json")
+        response = MagicMock()
+        response.status_code = 200
+        if url == "https://example.com/musllinux-index/aiohttp/":
+            response.headers = {"Content-Type": "application/vnd.pypi.simple.v1+json"}
+            response.json.return_value = {
+                "meta": {"api-version": "1.0"},
+                "files": [
+                    {"filename": wheel, "hashes": {"sha256": "abc"}}
+                    for wheel in TEST_INDEX_FILES
+                    if wheel.startswith("aiohttp-")
+                ]
+                + [{"filename": "aiohttp-3.7.4.tar.gz", "hashes": {}}],
+            }
+        elif url == "https://example.com/musllinux-index/google-cloud-pubsub/":
+            response.headers = {"Content-Type": "text/html"}
+            response.text = (
+                '<a href="../../musllinux/google_cloud_pubsub-2.1.0-py2.py3-none-any'
+                '.whl#sha256=abc">google_cloud_pubsub-2.1.0-py2.py3-none-any.whl</a>'
+            )
+        else:
+            response.status_code = 404
+        return response
+
+    with patch("builder.infra.requests.get", side_effect=_get) as mock_request_get:
+        package_index = infra.extract_packages_from_projects(
+            "https://example.com/musllinux-index/",
+            ["AIOhttp", "google_cloud_pubsub", "unknown", "aiohttp"],
+        )
+    assert sorted(call.args[0] for call in mock_request_get.call_args_list) == [
+        "https://example.com/musllinux-index/aiohttp/",
+        "https://example.com/musllinux-index/google-cloud-pubsub/",
+        "https://example.com/musllinux-index/unknown/",
+    ]
+
+    assert list(package_index.keys()) == ["aiohttp", "google-cloud-pubsub"]
+    assert [
+        str(package.version) for package in package_index[canonicalize_name("aiohttp")]
+    ] == ["3.6.1", "3.7.3", "3.7.4"]
+
+
+def test_remove_uploaded_wheels(tmp_path: Path) -> None:
+    """Test wheels on the index are removed before upload by filename or hash."""
+    same = tmp_path / "aiohttp-3.7.4-cp310-cp310-musllinux_1_2_x86_64.whl"
+    changed = tmp_path / "aioconsole-0.4.2-py3-none-any.whl"
+    new = tmp_path / "aioconsole-0.5.0-py3-none-any.whl"
+    for wheel in (same, changed, new):
+        wheel.write_text(wheel.name, "utf-8")
+
+    response = MagicMock(status_code=200, headers={"Content-Type": "text/html"})
+    response.text = "".join(
+        f'<a href="../../musllinux/{wheel.name}#sha256={digest}">{wheel.name}</a>'
+        for wheel, digest in ((same, infra.file_sha256(same)), (changed, "abc"))
+    )
+    with patch("builder.infra.requests.get", return_value=response):
+        remote = infra.fetch_projects_files(
+            "https://example.com/musllinux-index/",
+            ["aiohttp"],
+        )
+    assert remote == {same.name: infra.file_sha256(same), changed.name: "abc"}
+
+    assert infra.remove_uploaded_wheels(tmp_path, remote, check_hash=True) == len(
+        same.name,
+    )
+    assert sorted(tmp_path.iterdir()) == [changed, new]
+
+    package_index = infra.PackageIndex(TEST_INDEX_FILES)
+    assert package_index.files(canonicalize_name("aioconsole")) == [
+        "aioconsole-0.4.1-py3-none-any.whl",
+        changed.name,
+    ]
+    infra.remove_uploaded_wheels(
+        tmp_path,
+        dict.fromkeys(package_index.files(canonicalize_name("aioconsole"))),
+    )
+    assert list(tmp_path.iterdir()) == [new]
+
+
+def test_package_index_lazy() -> None:
+    """Test wheels are only parsed on lookup and tag sets are shared."""
+    package_index = infra.PackageIndex(
+        [
+            *TEST_INDEX_FILES,
+            "only_i686-1.0-cp310-cp310-musllinux_1_2_i686.whl",
+            "orjson-3.9.0-cp310-cp310-musllinux_1_2_x86_64.whl",
+        ],
+    )
+    assert not package_index._packages
+
+    aiohttp = package_index[canonicalize_name("aiohttp")]
+    assert list(package_index._packages) == ["aiohttp"]
+    assert [str(package.version) for package in aiohttp] == ["3.6.1", "3.7.3", "3.7.4"]
+    assert aiohttp[1].tags is aiohttp[2].tags
+
+    orjson = package_index[canonicalize_name("orjson")]
+    assert orjson[0].tags is aiohttp[0].tags
+
+    # Packages without supported wheels are not part of the index
+    assert "only-i686" not in package_index
+    assert "ONLY_i686" not in package_index
+    assert "GRPCio" in package_index
+    assert package_index["GRPCio"] == package_index[canonicalize_name("grpcio")]
+    with pytest.raises(KeyError):
+        package_index["ONLY_i686"]  # pylint: disable=pointless-statement
+    assert list(package_index) == [
+        "aiohttp",
+        "google-cloud-pubsub",
+        "grpcio",
+        "aioconsole",
+        "orjson",
+    ]
@@ -1,6 +1,11 @@
 """Tests for pip module."""
 
 from pathlib import Path
+from subprocess import CalledProcessError
+from typing import IO
+from unittest.mock import patch
+
+import pytest
 
 from builder import pip
 
@@ -40,3 +45,124 @@ def test_extract_packages_diff2() -> None:
         )
         == []
     )
+
+
+@pytest.mark.parametrize(
+    ("jobs", "cpu"),
+    [
+        (1, 8),
+        (3, 2),
+        (16, 1),
+    ],
+)
+def test_build_cpu_count(jobs: int, cpu: int) -> None:
+    with patch("builder.pip.os.cpu_count", return_value=8):
+        assert pip.build_cpu_count(jobs) == cpu
+
+
+def test_build_wheels_packages(tmp_path: Path) -> None:
+    def _run_command(
+        cmd: str,
+        env: dict[str, str],
+        timeout: int,
+        output: IO[str] | None,
+    ) -> None:
+        assert env["MAKEFLAGS"] == "-j2"
+        assert timeout
+        assert output is not None
+        if '"broken==1.0"' in cmd:
+            raise CalledProcessError(1, cmd)
+        print(f"Built {cmd.split()[-1]}")
+
+    with (
+        patch("builder.pip.os.cpu_count", return_value=4),
+        patch("builder.pip.run_command", side_effect=_run_command),
+    ):
+        builds = dict(
+            pip.build_wheels_packages(
+                ["aiohttp==3.7.4", "broken==1.0"],
+                "https://example.com",
+                tmp_path,
+                ":none:",
+                60,
+                jobs=2,
+            ),
+        )
+
+    assert builds.keys() == {"aiohttp==3.7.4", "broken==1.0"}
+    assert builds["aiohttp==3.7.4"].result() is None
+    assert isinstance(builds["broken==1.0"].exception(), CalledProcessError)
+
+
+def test_build_wheels_packages_dependencies(tmp_path: Path) -> None:
+    commands: list[str] = []
+
+    def _run_command(cmd: str, **_: object) -> None:
+        commands.append(cmd)
+        wheel_dir = Path(cmd.split("--wheel-dir ")[1].split()[0])
+        name, _sep, version = cmd.split('"')[3].partition("==")
+        (wheel_dir / f"{name}-{version}-cp310-cp310-linux_x86_64.whl").touch()
+
+    with patch("builder.pip.run_command", side_effect=_run_command):
+        order = [
+            package
+            for package, _ in pip.build_wheels_packages(
+                ["aiohttp==3.7.4", "yarl==1.6.3", "multidict==5.1.0"],
+                "https://example.com",
+                tmp_path,
+                "aiohttp,multidict,yarl",
+                60,
+                jobs=2,
+                dependencies={
+                    "aiohttp==3.7.4": {"yarl==1.6.3", "multidict==5.1.0"},
+                    "yarl==1.6.3": {"multidict==5.1.0"},
+                },
+            )
+        ]
+
+    assert order == ["multidict==5.1.0", "yarl==1.6.3", "aiohttp==3.7.4"]
+    assert all(f"--find-links {tmp_path}" in cmd for cmd in commands)
+
+    # Dependencies built before are used as wheels and not built again
+    assert '--no-binary "aiohttp,multidict,yarl"' in commands[0]
+    assert '--no-binary "aiohttp,yarl"' in commands[1]
+    assert commands[1].endswith('multidict-5.1.0-cp310-cp310-linux_x86_64.whl"')
+    assert '--no-binary "aiohttp"' in commands[2]
+    assert "yarl-1.6.3-cp310-cp310-linux_x86_64.whl" in commands[2]
+
+
+def test_build_wheels_no_deps(tmp_path: Path) -> None:
+    commands: list[str] = []
+    requirement = tmp_path / "requirement.txt"
+    requirement.write_text("multidict==5.1.0", "utf-8")
+
+    with patch(
+        "builder.pip.run_command",
+        side_effect=lambda cmd, **_: commands.append(cmd),
+    ):
+        for _, build in pip.build_wheels_packages(
+            ["yarl==1.6.3"],
+            "https://example.com",
+            tmp_path,
+            ":none:",
+            60,
+            no_deps=True,
+        ):
+            build.result()
+        pip.build_wheels_requirement(
+            requirement,
+            "https://example.com",
+            tmp_path,
+            ":none:",
+            60,
+            no_deps=True,
+        )
+        pip.build_wheels_package(
+            "aiohttp==3.7.4",
+            "https://example.com",
+            tmp_path,
+            ":none:",
+            60,
+        )
+
+    assert ["--no-deps" in cmd for cmd in commands] == [True, True, False]
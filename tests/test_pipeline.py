@@ -0,0 +1,129 @@
+"""Tests for pipeline module."""
+
+from pathlib import Path
+from subprocess import CalledProcessError
+from typing import IO
+from unittest.mock import patch
+from zipfile import ZipFile
+
+from packaging.utils import canonicalize_name
+
+from builder.pipeline import WheelPipeline
+
+
+def _write_wheel(wheel_file: Path, member: str = "package/_native.so") -> None:
+    """Create a complete wheel."""
+    with ZipFile(wheel_file, "w") as wheel_zip:
+        wheel_zip.writestr(member, b"\x7fELF")
+
+
+def test_pipeline_batches(tmp_path: Path) -> None:
+    """Test wheels are repaired and uploaded in batches while building."""
+    wheels_dir = tmp_path / "musllinux"
+    wheels_dir.mkdir()
+    uploaded: list[set[str]] = []
+
+    def _upload(folder: Path) -> None:
+        uploaded.append({p.name for p in Path(folder, "musllinux").glob("*.whl")})
+
+    def _run_command(cmd: str, output: IO[str] | None) -> None:
+        assert output is None
+        _, _, _, wheel_dir, wheel_file = cmd.split()
+        name = Path(wheel_file).name.split("-")[0]
+        if name == "broken":
+            raise CalledProcessError(1, cmd)
+        Path(wheel_dir, f"{name}-1.0-cp310-cp310-musllinux_1_2_x86_64.whl").touch()
+
+    pipeline = WheelPipeline(
+        wheels_dir,
+        _upload,
+        {canonicalize_name("grpcio")},
+        batch_size=2,
+    )
+    with patch("builder.wheel.run_command", side_effect=_run_command):
+        _write_wheel(wheels_dir / "aiohttp-1.0-cp310-cp310-linux_x86_64.whl")
+        _write_wheel(wheels_dir / "broken-1.0-cp310-cp310-linux_x86_64.whl")
+        _write_wheel(wheels_dir / "grpcio-1.0-cp310-cp310-musllinux_1_2_x86_64.whl")
+        _write_wheel(wheels_dir / "six-1.16.0-py2.py3-none-any.whl", "six.py")
+        _write_wheel(wheels_dir / "old-1.0-cp310-cp310-musllinux_1_1_aarch64.whl")
+        # Still written by pip
+        (wheels_dir / "orjson-1.0-cp310-cp310-linux_x86_64.whl").write_bytes(b"PK")
+        pipeline.process()
+        pipeline.flush()
+
+        _write_wheel(wheels_dir / "orjson-1.0-cp310-cp310-linux_x86_64.whl")
+        assert not pipeline.stop()
+
+    assert uploaded == [
+        {
+            "aiohttp-1.0-cp310-cp310-musllinux_1_2_x86_64.whl",
+            "six-1.16.0-py2.py3-none-any.whl",
+        },
+        {"orjson-1.0-cp310-cp310-musllinux_1_2_x86_64.whl"},
+    ]
+    # Left for the final pass
+    assert {p.name for p in wheels_dir.glob("*.whl")} == {
+        "grpcio-1.0-cp310-cp310-musllinux_1_2_x86_64.whl",
+        "old-1.0-cp310-cp310-musllinux_1_1_aarch64.whl",
+    }
+
+
+def test_pipeline_upload_failed(tmp_path: Path) -> None:
+    """Test wheels of a failed batch go back to the wheels folder."""
+    wheels_dir = tmp_path / "musllinux"
+    wheels_dir.mkdir()
+    wheel_name = "six-1.16.0-py2.py3-none-any.whl"
+    _write_wheel(wheels_dir / wheel_name, "six.py")
+
+    def _upload(folder: Path) -> None:
+        raise CalledProcessError(12, f"rsync {folder}")
+
+    pipeline = WheelPipeline(wheels_dir, _upload, interval=0.01)
+    pipeline.start()
+    assert pipeline.stop()
+    assert [p.name for p in wheels_dir.glob("*.whl")] == [wheel_name]
+
+
+def test_pipeline_prune(tmp_path: Path) -> None:
+    """Test wheels on the index are pruned from a batch before its upload."""
+    wheels_dir = tmp_path / "musllinux"
+    wheels_dir.mkdir()
+    uploaded: list[set[str]] = []
+    _write_wheel(wheels_dir / "six-1.16.0-py2.py3-none-any.whl", "six.py")
+    _write_wheel(wheels_dir / "attrs-23.1.0-py3-none-any.whl", "attrs.py")
+
+    def _upload(folder: Path) -> None:
+        uploaded.append({p.name for p in Path(folder, "musllinux").glob("*.whl")})
+
+    def _prune(folder: Path) -> None:
+        Path(folder, "six-1.16.0-py2.py3-none-any.whl").unlink()
+
+    pipeline = WheelPipeline(wheels_dir, _upload, prune=_prune)
+    assert pipeline.stop()
+    assert pipeline.uploaded_packages == {"attrs", "six"}
+    assert uploaded == [{"attrs-23.1.0-py3-none-any.whl"}]
+    assert not list(wheels_dir.glob("*.whl"))
+
+
+def test_pipeline_error(tmp_path: Path) -> None:
+    """Test an unexpected error leaves the wheel to the final pass."""
+    wheels_dir = tmp_path / "musllinux"
+    wheels_dir.mkdir()
+    wheel_name = "aiohttp-1.0-cp310-cp310-linux_x86_64.whl"
+    _write_wheel(wheels_dir / wheel_name)
+    _write_wheel(wheels_dir / "six-1.16.0-py2.py3-none-any.whl", "six.py")
+    uploaded: list[set[str]] = []
+
+    def _upload(folder: Path) -> None:
+        uploaded.append({p.name for p in Path(folder, "musllinux").glob("*.whl")})
+
+    pipeline = WheelPipeline(wheels_dir, _upload, interval=0.01)
+    with patch(
+        "builder.pipeline.repair_wheel",
+        side_effect=ValueError("libfoo.so could not be located"),
+    ):
+        pipeline.start()
+        assert not pipeline.stop()
+
+    assert uploaded == [{"six-1.16.0-py2.py3-none-any.whl"}]
+    assert [p.name for p in wheels_dir.glob("*.whl")] == [wheel_name]
@@ -0,0 +1,82 @@
+"""Tests for trace module."""
+
+# pylint: disable=protected-access
+
+import json
+from collections.abc import Generator
+from pathlib import Path
+
+import pytest
+
+from builder import trace
+from builder.utils import run_command
+
+
+@pytest.fixture(autouse=True)
+def recording() -> Generator[None]:
+    """Record spans for a test only."""
+    trace.enable()
+    yield
+    trace._events = None
+
+
+def test_span_parent() -> None:
+    """Test nested spans name their parent."""
+    with trace.span("build"), trace.span("build aiohttp", "build"):
+        pass
+
+    events = {event["name"]: event for event in trace._events or []}
+    assert events["build aiohttp"]["args"] == {"parent": "build"}
+    assert events["build"]["args"] == {}
+    assert events["build"]["dur"] >= events["build aiohttp"]["dur"]
+
+
+def test_span_disabled() -> None:
+    """Test nothing is recorded before enable."""
+    trace._events = None
+    with trace.span("build"):
+        pass
+
+    assert trace._events is None
+
+
+def test_command_span() -> None:
+    """Test every command is recorded by its executable."""
+    with trace.span("install_pips"):
+        run_command("true --version")
+
+    command = (trace._events or [])[0]
+    assert command["name"] == "true"
+    assert command["cat"] == "command"
+    assert command["args"] == {"cmd": "true --version", "parent": "install_pips"}
+
+
+def test_write_trace(tmp_path: Path) -> None:
+    """Test the Chrome trace file and the summary."""
+    with trace.span("build"):
+        for package in ("aiohttp", "yarl"):
+            with trace.span(f"build {package}", "build"):
+                pass
+    with trace.span("run_upload"):
+        pass
+
+    trace_file = tmp_path / "trace.json"
+    trace.write_trace(trace_file)
+    data = json.loads(trace_file.read_text("utf-8"))
+
+    assert {event["ph"] for event in data["traceEvents"]} == {"X"}
+    assert [event["name"] for event in data["traceEvents"]] == [
+        "build aiohttp",
+        "build yarl",
+        "build",
+        "run_upload",
+    ]
+
+    lines = trace.summary().splitlines()
+    assert [line.split()[0] for line in lines[1:4]] == [
+        "build",
+        "[build]",
+        "run_upload",
+    ]
+    assert lines[3 + 1].startswith("Slowest")
+    assert {line.split()[1] for line in lines[5:]} == {"aiohttp", "yarl"}
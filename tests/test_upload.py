@@ -0,0 +1,224 @@
+"""Tests for upload plugins."""
+
+import hashlib
+import json
+import shutil
+from pathlib import Path
+from subprocess import CalledProcessError
+from typing import IO
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from builder.upload import local as local_plugin
+from builder.upload import manifest, rsync
+
+REMOTE = "user@host:/wheels"
+
+
+def _stage(local: Path, wheels: dict[str, bytes]) -> None:
+    """Create wheels in the musllinux folder."""
+    Path(local, "musllinux").mkdir(parents=True, exist_ok=True)
+    for name, data in wheels.items():
+        Path(local, "musllinux", name).write_bytes(data)
+
+
+def test_manifest_upload_local(tmp_path: Path) -> None:
+    """Test only new or changed files are copied to a local remote."""
+    local = tmp_path / "local"
+    remote = tmp_path / "remote"
+    remote.mkdir()
+    _stage(local, {"aiohttp.whl": b"aiohttp", "yarl.whl": b"yarl"})
+    manifest.upload(local, str(remote))
+
+    assert Path(remote, "musllinux/aiohttp.whl").read_bytes() == b"aiohttp"
+    remote_manifest = json.loads(
+        Path(remote, manifest.MANIFEST).read_text("utf-8"),
+    )
+    assert remote_manifest == manifest.create_manifest(local)
+
+    # Remote files are never read, an unchanged file is not copied again
+    Path(remote, "musllinux/yarl.whl").unlink()
+    Path(remote, "musllinux/yarl.whl").write_bytes(b"untouched")
+    Path(local, "musllinux/aiohttp.whl").unlink()
+    _stage(local, {"orjson.whl": b"orjson", "yarl.whl": b"yarl"})
+    manifest.upload(local, str(remote))
+
+    assert Path(remote, "musllinux/yarl.whl").read_bytes() == b"untouched"
+    assert Path(remote, "musllinux/orjson.whl").read_bytes() == b"orjson"
+    assert set(
+        json.loads(Path(remote, manifest.MANIFEST).read_text("utf-8")),
+    ) == {
+        "musllinux/aiohttp.whl",
+        "musllinux/orjson.whl",
+        "musllinux/yarl.whl",
+    }
+    assert not list(remote.rglob("*.tmp"))
+
+
+def test_manifest_upload_rsync(tmp_path: Path) -> None:
+    """Test a rsync remote gets a file list and the manifest at last."""
+    _stage(tmp_path, {"aiohttp.whl": b"aiohttp", "yarl.whl": b"yarl"})
+    remote_manifest = {
+        "musllinux/yarl.whl": manifest.create_manifest(tmp_path)["musllinux/yarl.whl"],
+    }
+    transferred: list[str] = []
+
+    def _run_command(cmd: str, output: IO[str] | None = None) -> None:
+        assert output is None
+        source, target = cmd.split()[-2:]
+        if "--files-from" in cmd:
+            files_from = cmd.split("--files-from=")[1].split()[0]
+            transferred.extend(Path(files_from).read_text("utf-8").splitlines())
+        elif source.startswith(REMOTE):
+            transferred.append("manifest")
+            Path(target).write_text(json.dumps(remote_manifest), "utf-8")
+        else:
+            transferred.append("manifest uploaded")
+
+    run_command = MagicMock(side_effect=_run_command)
+    with (
+        patch("builder.upload.manifest.run_command", run_command),
+        patch("builder.upload.rsync.run_command", run_command),
+    ):
+        manifest.upload(tmp_path, REMOTE)
+
+    assert transferred == [
+        "manifest",
+        "musllinux/aiohttp.whl",
+        "manifest",
+        "manifest uploaded",
+    ]
+
+
+def test_manifest_upload_rsync_missing(tmp_path: Path) -> None:
+    """Test a remote without manifest gets all files."""
+    _stage(tmp_path, {"aiohttp.whl": b"aiohttp"})
+    run_command = MagicMock(
+        side_effect=[CalledProcessError(23, "rsync"), None, None, None],
+    )
+    with (
+        patch("builder.upload.manifest.run_command", run_command),
+        patch("builder.upload.rsync.run_command", run_command),
+    ):
+        manifest.upload(tmp_path, REMOTE)
+    assert "--files-from" in run_command.call_args_list[1].args[0]
+
+
+def test_manifest_upload_streams(tmp_path: Path) -> None:
+    """Test files are copied over concurrent streams to a local remote."""
+    local = tmp_path / "local"
+    remote = tmp_path / "remote"
+    remote.mkdir()
+    wheels = {f"package_{i}.whl": b"x" * i for i in range(1, 9)}
+    _stage(local, wheels)
+
+    manifest.upload(local, str(remote), streams=3)
+
+    assert {p.name for p in remote.glob("musllinux/*.whl")} == set(wheels)
+    assert len(json.loads(Path(remote, manifest.MANIFEST).read_text("utf-8"))) == len(
+        wheels,
+    )
+
+
+def test_rsync_upload_streams_failure(
+    tmp_path: Path,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    """Test failed streams are summarized after all streams are done."""
+    wheels = {"aiohttp.whl": b"aiohttp", "yarl.whl": b"yarl", "orjson.whl": b"or"}
+    _stage(tmp_path, wheels)
+    transferred: list[str] = []
+
+    def _run_command(cmd: str, output: IO[str] | None = None) -> None:
+        assert output is not None
+        assert "--checksum" in cmd
+        files_from = cmd.split("--files-from=")[1].split()[0]
+        files = Path(files_from).read_text("utf-8").splitlines()
+        if "musllinux/yarl.whl" in files:
+            raise CalledProcessError(12, "rsync")
+        transferred.extend(files)
+
+    with (
+        patch("builder.upload.rsync.run_command", side_effect=_run_command),
+        pytest.raises(CalledProcessError),
+    ):
+        rsync.upload(tmp_path, REMOTE, streams=len(wheels))
+
+    assert sorted(transferred) == ["musllinux/aiohttp.whl", "musllinux/orjson.whl"]
+    summary = capsys.readouterr().out.split("Upload failed on 1 of 3 streams:")[1]
+    assert "musllinux/yarl.whl" in summary
+
+
+def test_local_upload_index(tmp_path: Path) -> None:
+    """Test only pages of projects with new wheels are written."""
+    local = tmp_path / "local"
+    remote = tmp_path / "remote"
+    _stage(
+        local,
+        {
+            "aiohttp-3.7.4-cp310-cp310-musllinux_1_2_x86_64.whl": b"aiohttp",
+            "Yarl-1.6.3-cp310-cp310-musllinux_1_2_x86_64.whl": b"yarl",
+        },
+    )
+    local_plugin.upload(local, str(remote))
+
+    index = remote / local_plugin.INDEX
+    yarl_page = index / "yarl" / "index.html"
+    yarl_mtime = yarl_page.stat().st_mtime_ns
+    assert (
+        "../../musllinux/Yarl-1.6.3-cp310-cp310-musllinux_1_2_x86_64.whl#sha256="
+        + hashlib.sha256(b"yarl").hexdigest()
+    ) in yarl_page.read_text("utf-8")
+
+    shutil.rmtree(local)
+    _stage(
+        local,
+        {
+            "aiohttp-3.8.0-cp310-cp310-musllinux_1_2_x86_64.whl": b"aiohttp new",
+            "orjson-3.5.2-cp310-cp310-musllinux_1_2_x86_64.whl": b"orjson",
+        },
+    )
+    local_plugin.upload(local, str(remote), streams=2)
+
+    assert yarl_page.stat().st_mtime_ns == yarl_mtime
+    aiohttp_page = (index / "aiohttp" / "index.html").read_text("utf-8")
+    assert "aiohttp-3.7.4-cp310-cp310-musllinux_1_2_x86_64.whl" in aiohttp_page
+    assert "aiohttp-3.8.0-cp310-cp310-musllinux_1_2_x86_64.whl" in aiohttp_page
+    root_page = (index / "index.html").read_text("utf-8")
+    assert [line for line in root_page.splitlines() if "<a " in line] == [
+        '<a href="aiohttp/">aiohttp</a><br>',
+        '<a href="orjson/">orjson</a><br>',
+        '<a href="yarl/">yarl</a><br>',
+    ]
+    assert {p.name.split("-")[1] for p in remote.glob("musllinux/*.whl")} == {
+        "3.7.4",
+        "1.6.3",
+        "3.8.0",
+        "3.5.2",
+    }
+    assert not list(remote.rglob("*.tmp"))
+
+
+def test_upload_streams_progress(
+    tmp_path: Path,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    """Test every stream prints its files live and the tool output at the end."""
+    wheels = {"aiohttp.whl": b"aiohttp", "yarl.whl": b"yarl"}
+    _stage(tmp_path, wheels)
+
+    def _run_command(cmd: str, output: IO[str] | None = None) -> None:
+        assert output is not None
+        files_from = cmd.split("--files-from=")[1].split()[0]
+        for name in Path(files_from).read_text("utf-8").splitlines():
+            print(f"sending incremental file list\n{name}\n   7 100%\r", file=output)
+        output.flush()
+
+    with patch("builder.upload.rsync.run_command", side_effect=_run_command):
+        rsync.upload(tmp_path, REMOTE, streams=len(wheels))
+
+    out = capsys.readouterr().out
+    for name in ("aiohttp.whl", "yarl.whl"):
+        progress = out.index(f": [1/1] musllinux/{name}")
+        assert progress < out.index(f"sending incremental file list\nmusllinux/{name}")
@@ -0,0 +1,147 @@
+"""Tests for utils module."""
+
+import errno
+import json
+import sys
+from pathlib import Path
+from subprocess import CalledProcessError, TimeoutExpired
+from unittest.mock import patch
+
+import pytest
+
+from builder import utils
+
+
+def test_stage_file_link(tmp_path: Path) -> None:
+    """Test a staged copy shares the data of the source."""
+    source = tmp_path / "aiohttp-3.7.4-cp310-cp310-musllinux_1_2_x86_64.whl"
+    source.write_bytes(b"wheel")
+    target_dir = tmp_path / "wheels"
+    target_dir.mkdir()
+    (target_dir / source.name).write_bytes(b"old")
+
+    target = utils.stage_file(source, target_dir)
+
+    assert target == target_dir / source.name
+    assert target.samefile(source)
+    assert utils.stage_file(source, target) == target
+    assert source.read_bytes() == b"wheel"
+
+
+def test_stage_file_copy(tmp_path: Path) -> None:
+    """Test data is copied if it can't be shared."""
+    source = tmp_path / "source.whl"
+    source.write_bytes(b"wheel")
+    target = tmp_path / "target.whl"
+
+    with (
+        patch("builder.utils.os.link", side_effect=OSError(errno.EXDEV, "link")),
+        patch("builder.utils.fcntl.ioctl", side_effect=OSError(errno.EXDEV, "clone")),
+    ):
+        utils.stage_file(source, target)
+
+    assert not target.samefile(source)
+    assert target.read_bytes() == b"wheel"
+
+
+def test_stage_file_keeps_linked_target(tmp_path: Path) -> None:
+    """Test a target that is a hardlink of another file is replaced, not written."""
+    cached = tmp_path / "cached.whl"
+    cached.write_bytes(b"cached")
+    target = tmp_path / "target.whl"
+    utils.stage_file(cached, target)
+    source = tmp_path / "source.whl"
+    source.write_bytes(b"wheel")
+
+    with patch("builder.utils.os.link", side_effect=OSError(errno.EXDEV, "link")):
+        utils.stage_file(source, target)
+    assert target.read_bytes() == b"wheel"
+    assert cached.read_bytes() == b"cached"
+
+    # Other errors of a link are raised
+    with (
+        patch("builder.utils.os.link", side_effect=OSError(errno.ENOSPC, "link")),
+        pytest.raises(OSError, match="link"),
+    ):
+        utils.stage_file(cached, target)
+    assert [p.name for p in sorted(tmp_path.iterdir())] == [
+        "cached.whl",
+        "source.whl",
+        "target.whl",
+    ]
+
+
+def test_stage_file_move(tmp_path: Path) -> None:
+    """Test a move renames and falls back to copy across filesystems."""
+    source = tmp_path / "source.whl"
+    source.write_bytes(b"wheel")
+    utils.stage_file(source, tmp_path / "renamed.whl", move=True)
+    assert not source.exists()
+
+    replace = Path.replace
+
+    def _replace(path: Path, target: Path) -> Path:
+        if path.name == "renamed.whl":
+            raise OSError(errno.EXDEV, "move")
+        return replace(path, target)
+
+    with patch.object(Path, "replace", autospec=True, side_effect=_replace):
+        utils.stage_file(tmp_path / "renamed.whl", tmp_path / "moved.whl", move=True)
+    assert not (tmp_path / "renamed.whl").exists()
+    assert (tmp_path / "moved.whl").read_bytes() == b"wheel"
+
+
+@pytest.mark.parametrize(
+    ("weights", "count", "loads"),
+    [
+        ({"a": 5, "b": 4, "c": 3, "d": 3, "e": 1}, 2, [8, 8]),
+        ({"a": 10, "b": 1, "c": 1, "d": 1}, 2, [3, 10]),
+        ({"a": 1, "b": 1}, 4, [1, 1]),
+        ({}, 2, []),
+    ],
+)
+def test_balanced_partitions(
+    weights: dict[str, int],
+    count: int,
+    loads: list[int],
+) -> None:
+    partitions = utils.balanced_partitions(weights, count)
+    assert sorted(sum(weights[item] for item in part) for part in partitions) == loads
+    assert sorted(item for part in partitions for item in part) == sorted(weights)
+
+
+def test_run_command_usage(tmp_path: Path) -> None:
+    """Test the usage of a command covers its children."""
+    size = 64 * 1024 * 1024
+    usage = utils.run_command(
+        f'{sys.executable} -c "data = bytearray({size}); print(len(data))"',
+        timeout=60,
+    )
+
+    assert usage.status == "success"
+    assert usage.max_rss >= size
+    assert usage.wall >= usage.user > 0
+
+    report = tmp_path / "usage.json"
+    utils.write_usage_report(report, {"aiohttp": usage})
+    assert json.loads(report.read_text("utf-8"))["aiohttp"]["max_rss"] >= size
+
+
+def test_run_command_failed() -> None:
+    """Test a failed command raises with its usage."""
+    with pytest.raises(CalledProcessError) as err:
+        utils.run_command("exit 3")
+
+    assert isinstance(err.value, utils.CommandError)
+    assert err.value.returncode == len("abc")
+    assert err.value.usage.status == "failed"
+
+
+def test_run_command_timeout() -> None:
+    """Test a command is killed after its timeout."""
+    with pytest.raises(TimeoutExpired) as err:
+        utils.run_command("exec sleep 30", timeout=1)
+
+    assert isinstance(err.value, utils.CommandTimeout)
+    assert err.value.usage.status == "timeout"
+    assert err.value.usage.wall < len("abc")
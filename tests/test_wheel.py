@@ -1,11 +1,16 @@
 """Tests for pip module."""
 
 from pathlib import Path
-from unittest.mock import patch
+from subprocess import CalledProcessError
+from typing import IO
+from unittest.mock import MagicMock, patch
+from zipfile import ZipFile
 
 import pytest
+from packaging.utils import canonicalize_name, parse_wheel_filename
 
 from builder import wheel
+from builder.cache import WheelCache
 
 # pylint: disable=protected-access
 
@@ -45,7 +50,7 @@ def test_musllinux_regex_wrong(test: str) -> None:
 )
 def test_linux_regex(test: str) -> None:
     """Test linux regex."""
-    assert wheel._RE_LINUX_PLATFORM.search(test)
+    assert wheel.is_linux_wheel(Path(test))
 
 
 @pytest.mark.parametrize(
@@ -57,7 +62,7 @@ def test_linux_regex(test: str) -> None:
 )
 def test_linux_regex_wrong(test: str) -> None:
     """Test linux regex not found."""
-    assert wheel._RE_LINUX_PLATFORM.search(test) is None
+    assert not wheel.is_linux_wheel(Path(test))
 
 
 @pytest.mark.parametrize(
@@ -121,3 +126,205 @@ def test_fix_wheel_unmatch(tmp_path: Path) -> None:
     assert {p.name for p in tmp_path.glob("*.whl")} == {
         "google_cloud_pubsub-2.9.0-py2.py3-none-any.whl",
     }
+
+
+@pytest.mark.parametrize(
+    ("wheel_name", "result"),
+    [
+        ("aiohttp-3.7.4-cp310-cp310-musllinux_1_2_x86_64.whl", True),
+        ("google_cloud_pubsub-2.1.0-py2.py3-none-any.whl", True),
+        ("orjson-3.9.0-cp38-abi3-musllinux_1_1_x86_64.musllinux_1_1_i686.whl", True),
+        ("aiohttp-3.7.4-cp310-cp310-musllinux_1_2_i686.whl", False),
+        ("aiohttp-3.7.4-cp311-cp311-musllinux_1_2_x86_64.whl", False),
+    ],
+)
+def test_wheel_compatibility(wheel_name: str, result: bool) -> None:
+    """Test wheel tags against the build system."""
+    compatibility = wheel.build_compatibility()
+    _, _, _, tags = parse_wheel_filename(wheel_name)
+    assert compatibility.compatible(tags) is result
+    # Answered from the remembered tag set
+    assert compatibility.compatible(frozenset(tags)) is result
+
+
+def test_run_auditwheel(tmp_path: Path) -> None:
+    """Test repairs in parallel keep failed wheels out of the folder."""
+    linux_wheels = ("aiohttp", "broken", "orjson")
+    for name in linux_wheels:
+        (tmp_path / f"{name}-1.0-cp310-cp310-linux_x86_64.whl").touch()
+    (tmp_path / "six-1.16.0-py2.py3-none-any.whl").touch()
+
+    def _run_command(cmd: str, output: IO[str] | None) -> None:
+        assert output is not None
+        _, _, _, wheel_dir, wheel_file = cmd.split()
+        name = Path(wheel_file).name.split("-")[0]
+        if name == "broken":
+            raise CalledProcessError(1, cmd)
+        Path(wheel_dir, f"{name}-1.0-cp310-cp310-musllinux_1_2_x86_64.whl").touch()
+
+    with patch("builder.wheel.run_command", side_effect=_run_command) as run_command:
+        assert not wheel.run_auditwheel(tmp_path, jobs=2)
+
+    assert run_command.call_count == len(linux_wheels)
+    assert {p.name for p in tmp_path.glob("*.whl")} == {
+        "aiohttp-1.0-cp310-cp310-musllinux_1_2_x86_64.whl",
+        "orjson-1.0-cp310-cp310-musllinux_1_2_x86_64.whl",
+        "six-1.16.0-py2.py3-none-any.whl",
+    }
+
+
+def _write_wheel(wheel_file: Path, members: tuple[str, ...]) -> None:
+    """Create a wheel with WHEEL and RECORD metadata."""
+    dist_info = "-".join(wheel_file.name.split("-")[:2]) + ".dist-info"
+    metadata = "Wheel-Version: 1.0\nTag: cp310-cp310-linux_x86_64\n"
+    with ZipFile(wheel_file, "w") as wheel_zip:
+        for member in members:
+            native = ".so" in member or "/bin/" in member
+            wheel_zip.writestr(member, b"\x7fELF" if native else b"")
+        wheel_zip.writestr(f"{dist_info}/WHEEL", metadata)
+        wheel_zip.writestr(
+            f"{dist_info}/RECORD",
+            f"{dist_info}/WHEEL,{wheel._record_hash(metadata.encode())},"
+            f"{len(metadata)}\n{dist_info}/RECORD,,\n",
+        )
+
+
+def test_run_auditwheel_retag(tmp_path: Path) -> None:
+    """Test wheels without shared objects are retagged without auditwheel."""
+    _write_wheel(tmp_path / "pure-1.0-cp310-cp310-linux_x86_64.whl", ("pure.py",))
+
+    with patch("builder.wheel.run_command") as run_command:
+        assert wheel.run_auditwheel(tmp_path)
+
+    run_command.assert_not_called()
+    wheel_file = tmp_path / "pure-1.0-cp310-cp310-musllinux_1_2_x86_64.whl"
+    assert [p.name for p in tmp_path.glob("*.whl")] == [wheel_file.name]
+    with ZipFile(wheel_file) as wheel_zip:
+        metadata = wheel_zip.read("pure-1.0.dist-info/WHEEL")
+        record = wheel_zip.read("pure-1.0.dist-info/RECORD").decode()
+    assert b"Tag: cp310-cp310-musllinux_1_2_x86_64\n" in metadata
+    assert f"pure-1.0.dist-info/WHEEL,{wheel._record_hash(metadata)}," in record
+
+
+def test_run_auditwheel_retag_broken(tmp_path: Path) -> None:
+    """Test a wheel without metadata fails in auditwheel like before."""
+    wheel_file = tmp_path / "foo-1.0-cp310-cp310-linux_x86_64.whl"
+    with ZipFile(wheel_file, "w") as wheel_zip:
+        wheel_zip.writestr("foo.py", b"")
+
+    with patch(
+        "builder.wheel.run_command",
+        side_effect=CalledProcessError(1, "auditwheel"),
+    ) as run_command:
+        assert not wheel.run_auditwheel(tmp_path)
+
+    run_command.assert_called_once()
+    assert not list(tmp_path.glob("*.whl"))
+
+
+@pytest.mark.parametrize(
+    ("name", "result"),
+    [
+        ("native/_speedups.cpython-310-x86_64-linux-gnu.so", True),
+        ("native.libs/libz.so.1.2.13", True),
+        ("native-1.0.data/scripts/bin/tool", True),
+        ("native/sources.py", False),
+        ("native/LICENSE", False),
+    ],
+)
+def test_has_native_code(tmp_path: Path, name: str, result: bool) -> None:
+    """Test shared objects and executables are found."""
+    wheel_file = tmp_path / "native-1.0-cp310-cp310-linux_x86_64.whl"
+    _write_wheel(wheel_file, (name,))
+    assert wheel.has_native_code(wheel_file) is result
+
+
+def test_run_auditwheel_cached(tmp_path: Path) -> None:
+    """Test a byte identical wheel is repaired once."""
+    wheel_cache = WheelCache(tmp_path / "cache", 1024 * 1024)
+    wheels = tmp_path / "wheels"
+    wheels.mkdir()
+    linux_wheel = wheels / "native-1.0-cp310-cp310-linux_x86_64.whl"
+    _write_wheel(linux_wheel, ("native/_speedups.so",))
+    data = linux_wheel.read_bytes()
+
+    def _run_command(cmd: str, output: IO[str] | None) -> None:
+        assert output is None
+        _, _, _, wheel_dir, _ = cmd.split()
+        Path(wheel_dir, "native-1.0-cp310-cp310-musllinux_1_2_x86_64.whl").touch()
+
+    with patch("builder.wheel.run_command", side_effect=_run_command) as run_command:
+        assert wheel.run_auditwheel(wheels, wheel_cache=wheel_cache)
+        linux_wheel.write_bytes(data)
+        assert wheel.run_auditwheel(wheels, wheel_cache=wheel_cache)
+
+    run_command.assert_called_once()
+    assert [p.name for p in wheels.glob("*.whl")] == [
+        "native-1.0-cp310-cp310-musllinux_1_2_x86_64.whl",
+    ]
+
+
+def test_run_auditwheel_workers(tmp_path: Path) -> None:
+    """Test repairs are handed to the audit workers."""
+    linux_wheel = tmp_path / "native-1.0-cp310-cp310-linux_x86_64.whl"
+    linux_wheel.touch()
+
+    def _repair(wheel_file: Path, wheel_dir: Path, output: IO[str] | None) -> None:
+        assert wheel_file == linux_wheel
+        assert output is None
+        Path(wheel_dir, "native-1.0-cp310-cp310-musllinux_1_2_x86_64.whl").touch()
+
+    workers = MagicMock(repair=MagicMock(side_effect=_repair))
+    with patch("builder.wheel.run_command") as run_command:
+        assert wheel.run_auditwheel(tmp_path, workers=workers)
+
+    run_command.assert_not_called()
+    assert [p.name for p in tmp_path.glob("*.whl")] == [
+        "native-1.0-cp310-cp310-musllinux_1_2_x86_64.whl",
+    ]
+
+
+def test_copy_wheels_from_cache(tmp_path: Path) -> None:
+    """Test only new wheels of requested packages are preserved."""
+    cache_folder = tmp_path / "cache"
+    wheels_folder = tmp_path / "wheels"
+    for folder in ("aa/old", "bb/new", "cc/new"):
+        Path(cache_folder, folder).mkdir(parents=True)
+    wheels_folder.mkdir()
+    Path(cache_folder, "aa/old/aiohttp-3.7.3-cp310-cp310-linux_x86_64.whl").touch()
+    snapshot = wheel.snapshot_wheels(cache_folder)
+
+    for wheel_name in (
+        "bb/new/aiohttp-3.7.4-cp310-cp310-linux_x86_64.whl",
+        "bb/new/yarl-1.6.3-cp310-cp310-linux_x86_64.whl",
+        "cc/new/orjson-3.5.2-cp310-cp310-linux_x86_64.whl",
+        "cc/new/multidict-5.1.0-cp310-cp310-linux_x86_64.whl",
+    ):
+        Path(cache_folder, wheel_name).touch()
+    Path(wheels_folder, "orjson-3.5.2-cp310-cp310-musllinux_1_2_x86_64.whl").touch()
+
+    wheel.copy_wheels_from_cache(
+        cache_folder,
+        wheels_folder,
+        {canonicalize_name("aiohttp"), canonicalize_name("orjson")},
+        snapshot,
+    )
+
+    assert {p.name for p in wheels_folder.glob("*.whl")} == {
+        "aiohttp-3.7.4-cp310-cp310-linux_x86_64.whl",
+        "orjson-3.5.2-cp310-cp310-musllinux_1_2_x86_64.whl",
+    }
+
+    # Packages the pipeline uploaded already are not preserved again
+    Path(wheels_folder, "aiohttp-3.7.4-cp310-cp310-linux_x86_64.whl").unlink()
+    wheel.copy_wheels_from_cache(
+        cache_folder,
+        wheels_folder,
+        None,
+        snapshot,
+        {canonicalize_name("aiohttp"), canonicalize_name("yarl")},
+    )
+    assert {p.name for p in wheels_folder.glob("*.whl")} == {
+        "multidict-5.1.0-cp310-cp310-linux_x86_64.whl",
+        "orjson-3.5.2-cp310-cp310-musllinux_1_2_x86_64.whl",
+    }